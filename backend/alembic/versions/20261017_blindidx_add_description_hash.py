@@ -0,0 +1,79 @@
+"""add description_hash blind index to transactions and description_history
+
+Revision ID: 20261017_blindidx
+Revises: 20261017_budgetstats
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.core.encryption import decrypt_field, blind_index
+
+
+# revision identifiers, used by Alembic.
+revision = '20261017_blindidx'
+down_revision = '20261017_budgetstats'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def _add_description_hash(conn, table_name: str):
+    inspector = sa.inspect(conn)
+    columns = [c['name'] for c in inspector.get_columns(table_name)]
+    if 'description_hash' not in columns:
+        op.add_column(table_name, sa.Column('description_hash', sa.String(length=64), nullable=True))
+
+    indexes = [i['name'] for i in inspector.get_indexes(table_name)]
+    index_name = f'ix_{table_name}_description_hash'
+    if index_name not in indexes:
+        op.create_index(index_name, table_name, ['description_hash'])
+
+
+def _backfill_description_hash(conn, table_name: str):
+    """解密既有的 description 並寫入盲索引，依 id 分批處理"""
+    table = sa.table(
+        table_name,
+        sa.column('id', sa.Integer),
+        sa.column('description', sa.String),
+        sa.column('description_hash', sa.String),
+    )
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(table.c.id, table.c.description)
+            .where(table.c.id > last_id, table.c.description_hash.is_(None))
+            .order_by(table.c.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+
+        params = [
+            {'b_id': row.id, 'b_hash': blind_index(decrypt_field(row.description))}
+            for row in rows
+        ]
+        params = [p for p in params if p['b_hash'] is not None]
+        if params:
+            conn.execute(
+                table.update()
+                .where(table.c.id == sa.bindparam('b_id'))
+                .values(description_hash=sa.bindparam('b_hash')),
+                params
+            )
+        last_id = rows[-1].id
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    for table_name in ('transactions', 'description_history'):
+        _add_description_hash(conn, table_name)
+        _backfill_description_hash(conn, table_name)
+
+
+def downgrade() -> None:
+    for table_name in ('transactions', 'description_history'):
+        op.drop_index(f'ix_{table_name}_description_hash', table_name=table_name)
+        op.drop_column(table_name, 'description_hash')
@@ -0,0 +1,38 @@
+"""add budget_daily_stats
+
+Revision ID: 20261017_budgetstats
+Revises: 20261017_dataver
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261017_budgetstats'
+down_revision = '20261017_dataver'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    if 'budget_daily_stats' not in inspector.get_table_names():
+        op.create_table(
+            'budget_daily_stats',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('budget_id', sa.Integer(), sa.ForeignKey('budgets.id', ondelete='CASCADE'), nullable=False),
+            sa.Column('stat_date', sa.Date(), nullable=False),
+            sa.Column('net_spent', sa.Float(), nullable=False, server_default='0'),
+            sa.Column('is_dirty', sa.Boolean(), nullable=False, server_default=sa.false()),
+            sa.UniqueConstraint('budget_id', 'stat_date', name='uq_budget_daily_stats_budget_date'),
+        )
+        op.create_index('ix_budget_daily_stats_id', 'budget_daily_stats', ['id'])
+    # 每日資料由下一次預算統計排程從預算起始日補算，不需回填
+
+
+def downgrade() -> None:
+    op.drop_index('ix_budget_daily_stats_id', table_name='budget_daily_stats')
+    op.drop_table('budget_daily_stats')
@@ -0,0 +1,39 @@
+"""add change_log
+
+Revision ID: 20261017_changelog
+Revises: 20261017_importjob
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261017_changelog'
+down_revision = '20261017_importjob'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    if 'change_log' not in inspector.get_table_names():
+        op.create_table(
+            'change_log',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+            sa.Column('seq', sa.Integer(), nullable=False),
+            sa.Column('entity_type', sa.String(), nullable=False),
+            sa.Column('entity_id', sa.Integer(), nullable=True),
+            sa.Column('op', sa.String(), nullable=False),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.UniqueConstraint('user_id', 'seq', name='uq_change_log_user_seq'),
+        )
+        op.create_index('ix_change_log_id', 'change_log', ['id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_change_log_id', table_name='change_log')
+    op.drop_table('change_log')
@@ -0,0 +1,45 @@
+"""add import_jobs
+
+Revision ID: 20261017_importjob
+Revises: 20261017_reencrypt
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261017_importjob'
+down_revision = '20261017_reencrypt'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    if 'import_jobs' not in inspector.get_table_names():
+        op.create_table(
+            'import_jobs',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+            sa.Column('status', sa.String(), nullable=False),
+            sa.Column('stage', sa.String(), nullable=True),
+            sa.Column('total_transactions', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('processed_transactions', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('stats', sa.Text(), nullable=True),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+            sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index('ix_import_jobs_id', 'import_jobs', ['id'])
+        op.create_index('ix_import_jobs_user_id', 'import_jobs', ['user_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_import_jobs_user_id', table_name='import_jobs')
+    op.drop_index('ix_import_jobs_id', table_name='import_jobs')
+    op.drop_table('import_jobs')
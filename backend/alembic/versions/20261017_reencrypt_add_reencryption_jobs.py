@@ -0,0 +1,45 @@
+"""add reencryption_jobs
+
+Revision ID: 20261017_reencrypt
+Revises: 20261017_blindidx
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261017_reencrypt'
+down_revision = '20261017_blindidx'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    if 'reencryption_jobs' not in inspector.get_table_names():
+        op.create_table(
+            'reencryption_jobs',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('status', sa.String(), nullable=False),
+            sa.Column('target_key_id', sa.String(), nullable=False),
+            sa.Column('rows_per_second', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('current_table', sa.String(), nullable=True),
+            sa.Column('last_id', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('total_rows', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('rows_processed', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('rows_updated', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+            sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index('ix_reencryption_jobs_id', 'reencryption_jobs', ['id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_reencryption_jobs_id', table_name='reencryption_jobs')
+    op.drop_table('reencryption_jobs')
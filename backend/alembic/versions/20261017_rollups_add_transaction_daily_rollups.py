@@ -0,0 +1,67 @@
+"""add transaction_daily_rollups
+
+Revision ID: 20261017_rollups
+Revises: 20251126_oauth
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261017_rollups'
+down_revision = '20251126_oauth'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    inspector = sa.inspect(conn)
+    if 'transaction_daily_rollups' not in inspector.get_table_names():
+        op.create_table(
+            'transaction_daily_rollups',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+            sa.Column('account_id', sa.Integer(), sa.ForeignKey('accounts.id', ondelete='CASCADE'), nullable=False),
+            sa.Column('category', sa.String(), nullable=False, server_default=''),
+            sa.Column('local_date', sa.Date(), nullable=False),
+            sa.Column('transaction_type', sa.String(), nullable=False),
+            sa.Column('exclude_from_budget', sa.Boolean(), nullable=False, server_default=sa.false()),
+            sa.Column('total_amount', sa.Float(), nullable=False, server_default='0'),
+            sa.Column('transaction_count', sa.Integer(), nullable=False, server_default='0'),
+            sa.UniqueConstraint(
+                'user_id', 'account_id', 'category', 'local_date', 'transaction_type', 'exclude_from_budget',
+                name='uq_transaction_daily_rollups_key'
+            ),
+        )
+        op.create_index('ix_transaction_daily_rollups_id', 'transaction_daily_rollups', ['id'])
+        op.create_index('ix_transaction_daily_rollups_user_date', 'transaction_daily_rollups', ['user_id', 'local_date'])
+
+    # 由現有交易回填彙總資料 (日期以台北時間計算)
+    op.execute("DELETE FROM transaction_daily_rollups")
+    op.execute("""
+        INSERT INTO transaction_daily_rollups
+            (user_id, account_id, category, local_date, transaction_type,
+             exclude_from_budget, total_amount, transaction_count)
+        SELECT a.user_id,
+               t.account_id,
+               COALESCE(t.category, ''),
+               date(timezone('Asia/Taipei', t.transaction_date)),
+               t.transaction_type,
+               t.exclude_from_budget,
+               SUM(t.amount),
+               COUNT(t.id)
+        FROM transactions t
+        JOIN accounts a ON a.id = t.account_id
+        GROUP BY a.user_id, t.account_id, COALESCE(t.category, ''),
+                 date(timezone('Asia/Taipei', t.transaction_date)),
+                 t.transaction_type, t.exclude_from_budget
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_transaction_daily_rollups_user_date', table_name='transaction_daily_rollups')
+    op.drop_index('ix_transaction_daily_rollups_id', table_name='transaction_daily_rollups')
+    op.drop_table('transaction_daily_rollups')
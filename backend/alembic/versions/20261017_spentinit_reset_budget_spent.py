@@ -0,0 +1,25 @@
+"""mark budget spent counters as uninitialized
+
+Revision ID: 20261017_spentinit
+Revises: 20261017_txindexes
+Create Date: 2026-10-17 23:00:00.000000
+
+budgets.spent 改為增量維護的未截斷淨支出，既有的值是舊規則計算的結果。
+設為 NULL (尚未初始化)，啟動時由 ensure_budgets_spent_initialized 只重算這些預算。
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '20261017_spentinit'
+down_revision = '20261017_txindexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute('UPDATE budgets SET spent = NULL')
+
+
+def downgrade() -> None:
+    op.execute('UPDATE budgets SET spent = 0 WHERE spent IS NULL')
@@ -0,0 +1,56 @@
+"""add indexes for transaction and budget access patterns
+
+Revision ID: 20261017_txindexes
+Revises: 20261017_changelog
+Create Date: 2026-10-17 22:00:00.000000
+
+索引以 CREATE INDEX CONCURRENTLY 建立 (不鎖住寫入)，需在交易之外執行。
+先前中斷而留下的無效索引 (indisvalid = false) 會先刪除再重建。
+budget_categories 的 (budget_id, category_name) 唯一約束已可用於 budget_id 查詢，不另外建立索引。
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20261017_txindexes'
+down_revision = '20261017_changelog'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    (
+        'ix_transactions_account_date', 'transactions',
+        '(account_id, transaction_date) INCLUDE (amount, transaction_type, category, exclude_from_budget)'
+    ),
+    ('ix_accounts_user_id', 'accounts', '(user_id)'),
+    ('ix_budgets_user_end_date', 'budgets', '(user_id, end_date)'),
+    ('ix_budget_accounts_budget_id', 'budget_accounts', '(budget_id)'),
+]
+
+
+def _index_valid(conn, name):
+    """索引不存在時回傳 None"""
+    return conn.execute(sa.text(
+        "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = :name AND pg_table_is_visible(c.oid)"
+    ), {'name': name}).scalar()
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            valid = _index_valid(conn, name)
+            if valid:
+                continue
+            if valid is False:
+                op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+            op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} {columns}')
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _, _ in reversed(INDEXES):
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
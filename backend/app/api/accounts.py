@@ -1,23 +1,31 @@
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List
-from app.core.database import get_db
-from app.models.user import User
+from app.core.database import get_async_db, get_db
 from app.models.account import Account
+from app.models.transaction import Transaction
 from app.schemas.account import Account as AccountSchema, AccountCreate, AccountUpdate
-from app.api.deps import get_current_user
+from app.api.deps import get_current_principal, get_current_principal_async
+from app.core.principal import Principal
+from app.services.change_log import deletes, record_changes, upserts
+from app.services.transaction_sync import resync_user
 
 router = APIRouter()
 
 @router.get("/", response_model=List[AccountSchema])
-def get_accounts(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    accounts = db.query(Account).filter(Account.user_id == current_user.id).all()
-    return accounts
+async def get_accounts(
+    current_user: Principal = Depends(get_current_principal_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    accounts = await db.scalars(select(Account).where(Account.user_id == current_user.id))
+    return accounts.all()
 
 @router.post("/", response_model=AccountSchema)
 def create_account(
     account: AccountCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     # 提取 initial_balance 並將其設為 balance
@@ -26,20 +34,22 @@ def create_account(
 
     db_account = Account(**account_data, balance=initial_balance, user_id=current_user.id)
     db.add(db_account)
+    db.flush()
+    record_changes(db, current_user.id, upserts("account", [db_account.id]))
     db.commit()
     db.refresh(db_account)
     return db_account
 
 @router.get("/{account_id}", response_model=AccountSchema)
-def get_account(
+async def get_account(
     account_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    account = db.query(Account).filter(
+    account = await db.scalar(select(Account).where(
         Account.id == account_id,
         Account.user_id == current_user.id
-    ).first()
+    ))
     if not account:
         raise HTTPException(status_code=404, detail="Account not found")
     return account
@@ -48,7 +58,7 @@ def get_account(
 def update_account(
     account_id: int,
     account_update: AccountUpdate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     account = db.query(Account).filter(
@@ -61,6 +71,7 @@ def update_account(
     for key, value in account_update.dict(exclude_unset=True).items():
         setattr(account, key, value)
 
+    record_changes(db, current_user.id, upserts("account", [account.id]))
     db.commit()
     db.refresh(account)
     return account
@@ -68,7 +79,7 @@ def update_account(
 @router.delete("/{account_id}")
 def delete_account(
     account_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     account = db.query(Account).filter(
@@ -78,6 +89,13 @@ def delete_account(
     if not account:
         raise HTTPException(status_code=404, detail="Account not found")
 
+    # 帳戶的交易隨帳戶一併刪除，記錄各筆交易的墓碑後重建衍生資料
+    transaction_ids = [
+        transaction_id for (transaction_id,) in
+        db.query(Transaction.id).filter(Transaction.account_id == account_id).order_by(Transaction.id)
+    ]
     db.delete(account)
+    db.flush()
+    resync_user(db, current_user.id, deletes("transaction", transaction_ids) + deletes("account", [account_id]))
     db.commit()
     return {"message": "Account deleted successfully"}
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
+from sqlalchemy import func, tuple_
+from typing import List, Optional
+from datetime import datetime, timezone
 from app.core.database import get_db
 from app.core.security import get_password_hash
 from app.models.user import User
@@ -9,75 +10,75 @@ from app.models.account import Account
 from app.models.budget import Budget
 from app.models.transaction import Transaction
 from app.schemas.user import UserAdminInfo, AdminUserUpdate
+from app.schemas.reencryption import ReencryptionStart, ReencryptionJobStatus
 from app.api.deps import get_current_admin
+from app.core.encryption import get_active_field_key_id
+from app.core.metrics import collect_metrics
+from app.core.principal import Principal, invalidate_principal
+from app.models.reencryption_job import ReencryptionJob
+from app.services.change_log import RESET, record_changes
+from app.utils.pagination import decode_cursor, encode_cursor
+from app.services.reencryption import (
+    ReencryptionJobConflict, get_latest_reencryption_job, pause_reencryption_job,
+    run_reencryption_job_in_background, start_reencryption_job
+)
 
 router = APIRouter()
 
-@router.get("/users", response_model=List[UserAdminInfo])
-def list_all_users(
-    current_admin: User = Depends(get_current_admin),
-    db: Session = Depends(get_db)
-):
-    """列出所有使用者及其統計資訊"""
-    users = db.query(User).all()
-
-    result = []
-    for user in users:
-        # 計算統計資訊
-        transaction_count = db.query(func.count(Transaction.id)).join(Account).filter(
-            Account.user_id == user.id
-        ).scalar() or 0
-
-        budget_count = db.query(func.count(Budget.id)).filter(
-            Budget.user_id == user.id
-        ).scalar() or 0
-
-        account_count = db.query(func.count(Account.id)).filter(
-            Account.user_id == user.id
-        ).scalar() or 0
-
-        user_info = UserAdminInfo(
-            id=user.id,
-            email=user.username,
-            is_google_user=user.is_google_user,
-            is_admin=user.is_admin,
-            is_blocked=user.is_blocked,
-            two_factor_enabled=user.two_factor_enabled,
-            last_login_at=user.last_login_at,
-            created_at=user.created_at,
-            updated_at=user.updated_at,
-            transaction_count=transaction_count,
-            budget_count=budget_count,
-            account_count=account_count
-        )
-        result.append(user_info)
-
-    return result
-
-@router.get("/users/{user_id}", response_model=UserAdminInfo)
-def get_user_info(
-    user_id: int,
-    current_admin: User = Depends(get_current_admin),
-    db: Session = Depends(get_db)
-):
-    """獲取特定使用者的詳細資訊"""
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="使用者不存在")
-
-    # 計算統計資訊
-    transaction_count = db.query(func.count(Transaction.id)).join(Account).filter(
-        Account.user_id == user.id
-    ).scalar() or 0
-
-    budget_count = db.query(func.count(Budget.id)).filter(
-        Budget.user_id == user.id
-    ).scalar() or 0
+# 使用者列表可排序的欄位
+USER_SORT_FIELDS = ("id", "username", "created_at", "last_login_at", "transaction_count", "budget_count", "account_count")
+
+# 使用者列表單頁最大筆數
+MAX_USER_PAGE_SIZE = 200
+
+# 排序時以此值代替空的時間欄位 (從未登入等)
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _user_stats_query(db: Session):
+    """
+    使用者及其交易/預算/帳戶數量
+
+    各數量以分組子查詢計算後 LEFT JOIN，整個列表只需一次查詢。
+
+    Returns:
+        (query, 可排序欄位 {名稱: 欄位運算式})
+    """
+    transaction_counts = db.query(
+        Account.user_id.label("user_id"), func.count(Transaction.id).label("count")
+    ).join(Transaction, Transaction.account_id == Account.id).group_by(Account.user_id).subquery()
+    budget_counts = db.query(
+        Budget.user_id.label("user_id"), func.count(Budget.id).label("count")
+    ).group_by(Budget.user_id).subquery()
+    account_counts = db.query(
+        Account.user_id.label("user_id"), func.count(Account.id).label("count")
+    ).group_by(Account.user_id).subquery()
+
+    sort_columns = {
+        "id": User.id,
+        "username": User.username,
+        "created_at": func.coalesce(User.created_at, _EPOCH),
+        "last_login_at": func.coalesce(User.last_login_at, _EPOCH),
+        "transaction_count": func.coalesce(transaction_counts.c.count, 0),
+        "budget_count": func.coalesce(budget_counts.c.count, 0),
+        "account_count": func.coalesce(account_counts.c.count, 0),
+    }
+    query = db.query(
+        User,
+        sort_columns["transaction_count"].label("transaction_count"),
+        sort_columns["budget_count"].label("budget_count"),
+        sort_columns["account_count"].label("account_count"),
+    ).outerjoin(
+        transaction_counts, transaction_counts.c.user_id == User.id
+    ).outerjoin(
+        budget_counts, budget_counts.c.user_id == User.id
+    ).outerjoin(
+        account_counts, account_counts.c.user_id == User.id
+    )
+    return query, sort_columns
 
-    account_count = db.query(func.count(Account.id)).filter(
-        Account.user_id == user.id
-    ).scalar() or 0
 
+def _to_admin_info(user: User, transaction_count: int, budget_count: int, account_count: int) -> UserAdminInfo:
     return UserAdminInfo(
         id=user.id,
         email=user.username,
@@ -93,11 +94,102 @@ def get_user_info(
         account_count=account_count
     )
 
+
+def _decode_user_cursor(cursor: str, sort: str) -> tuple:
+    """解碼 (排序值, 使用者 ID) 形式的游標"""
+    try:
+        values = decode_cursor(cursor)
+        if len(values) != 2 or not isinstance(values[1], int):
+            raise ValueError("Invalid cursor")
+        value = values[0]
+        if sort in ("created_at", "last_login_at"):
+            value = datetime.fromisoformat(value)
+        elif sort == "username":
+            if not isinstance(value, str):
+                raise ValueError("Invalid cursor")
+        elif not isinstance(value, int):
+            raise ValueError("Invalid cursor")
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return value, values[1]
+
+
+@router.get("/users", response_model=List[UserAdminInfo])
+def list_all_users(
+    response: Response,
+    search: Optional[str] = None,
+    sort: str = "id",
+    order: str = "asc",
+    limit: Optional[int] = Query(None, ge=1, le=MAX_USER_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_admin: Principal = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """
+    列出所有使用者及其統計資訊
+
+    - 搜尋：search 比對使用者名稱 (不分大小寫的部分比對)
+    - 排序：sort 為 id、username、created_at、last_login_at、transaction_count、budget_count、account_count，
+      order 為 asc 或 desc；排序值相同時依使用者 ID
+    - 分頁：傳入 limit 時只回傳一頁，若還有下一頁會在 X-Next-Cursor header 提供游標，
+      下次以相同的 search/sort/order 帶入 cursor 即可接續
+    """
+    if sort not in USER_SORT_FIELDS:
+        raise HTTPException(status_code=400, detail="Invalid sort field")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="Invalid sort order")
+
+    query, sort_columns = _user_stats_query(db)
+    sort_column = sort_columns[sort]
+    if search:
+        query = query.filter(User.username.icontains(search, autoescape=True))
+    if cursor:
+        cursor_value, cursor_id = _decode_user_cursor(cursor, sort)
+        key = tuple_(sort_column, User.id)
+        query = query.filter(key < tuple_(cursor_value, cursor_id) if order == "desc" else key > tuple_(cursor_value, cursor_id))
+    if order == "desc":
+        query = query.order_by(sort_column.desc(), User.id.desc())
+    else:
+        query = query.order_by(sort_column, User.id)
+
+    if not limit:
+        return [_to_admin_info(*row) for row in query.all()]
+
+    # 多取一筆用來判斷是否還有下一頁
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        user, transaction_count, budget_count, account_count = rows[-1]
+        last_values = {
+            "id": user.id,
+            "username": user.username,
+            "created_at": user.created_at or _EPOCH,
+            "last_login_at": user.last_login_at or _EPOCH,
+            "transaction_count": transaction_count,
+            "budget_count": budget_count,
+            "account_count": account_count,
+        }
+        response.headers["X-Next-Cursor"] = encode_cursor([last_values[sort], user.id])
+    return [_to_admin_info(*row) for row in rows]
+
+@router.get("/users/{user_id}", response_model=UserAdminInfo)
+def get_user_info(
+    user_id: int,
+    current_admin: Principal = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """獲取特定使用者的詳細資訊"""
+    query, _ = _user_stats_query(db)
+    row = query.filter(User.id == user_id).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="使用者不存在")
+    return _to_admin_info(*row)
+
 @router.patch("/users/{user_id}", response_model=UserAdminInfo)
 def update_user(
     user_id: int,
     user_update: AdminUserUpdate,
-    current_admin: User = Depends(get_current_admin),
+    current_admin: Principal = Depends(get_current_admin),
     db: Session = Depends(get_db)
 ):
     """更新使用者資訊 (管理員專用)"""
@@ -111,6 +203,7 @@ def update_user(
 
     # 更新欄位
     update_data = user_update.dict(exclude_unset=True)
+    old_username = user.username
 
     # 處理密碼更新
     if 'password' in update_data and update_data['password']:
@@ -143,6 +236,7 @@ def update_user(
             setattr(user, key, value)
 
     db.commit()
+    invalidate_principal(old_username, user.username)
     db.refresh(user)
 
     # 返回更新後的資訊
@@ -151,7 +245,7 @@ def update_user(
 @router.post("/users/{user_id}/reset-data")
 def reset_user_data(
     user_id: int,
-    current_admin: User = Depends(get_current_admin),
+    current_admin: Principal = Depends(get_current_admin),
     db: Session = Depends(get_db)
 ):
     """清除使用者所有資料,恢復到剛建立帳號的狀態"""
@@ -197,6 +291,7 @@ def reset_user_data(
     for account in default_accounts:
         db.add(account)
 
+    record_changes(db, user.id, [RESET])
     db.commit()
 
     return {"message": f"使用者 {user.username} 的資料已重置"}
@@ -204,7 +299,7 @@ def reset_user_data(
 @router.delete("/users/{user_id}")
 def delete_user(
     user_id: int,
-    current_admin: User = Depends(get_current_admin),
+    current_admin: Principal = Depends(get_current_admin),
     db: Session = Depends(get_db)
 ):
     """完全刪除使用者及其所有資料"""
@@ -221,13 +316,14 @@ def delete_user(
     # 刪除使用者 (cascade 會自動刪除所有相關資料)
     db.delete(user)
     db.commit()
+    invalidate_principal(email)
 
     return {"message": f"使用者 {email} 已完全刪除"}
 
 @router.post("/users/{user_id}/block")
 def block_user(
     user_id: int,
-    current_admin: User = Depends(get_current_admin),
+    current_admin: Principal = Depends(get_current_admin),
     db: Session = Depends(get_db)
 ):
     """封鎖使用者"""
@@ -241,13 +337,14 @@ def block_user(
 
     user.is_blocked = True
     db.commit()
+    invalidate_principal(user.username)
 
     return {"message": f"使用者 {user.username} 已被封鎖"}
 
 @router.post("/users/{user_id}/unblock")
 def unblock_user(
     user_id: int,
-    current_admin: User = Depends(get_current_admin),
+    current_admin: Principal = Depends(get_current_admin),
     db: Session = Depends(get_db)
 ):
     """解除封鎖使用者"""
@@ -257,5 +354,75 @@ def unblock_user(
 
     user.is_blocked = False
     db.commit()
+    invalidate_principal(user.username)
 
     return {"message": f"使用者 {user.username} 已解除封鎖"}
+
+def _reencryption_status(job: ReencryptionJob) -> ReencryptionJobStatus:
+    if job.status == "completed":
+        progress = 100.0
+    elif job.total_rows > 0:
+        progress = min(round(job.rows_processed / job.total_rows * 100, 2), 100.0)
+    else:
+        progress = 0.0
+    return ReencryptionJobStatus(
+        id=job.id,
+        status=job.status,
+        target_key_id=job.target_key_id,
+        active_key_id=get_active_field_key_id(),
+        rows_per_second=job.rows_per_second,
+        current_table=job.current_table,
+        last_id=job.last_id,
+        total_rows=job.total_rows,
+        rows_processed=job.rows_processed,
+        rows_updated=job.rows_updated,
+        progress_percent=progress,
+        error=job.error,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        updated_at=job.updated_at
+    )
+
+@router.post("/reencryption", response_model=ReencryptionJobStatus)
+def start_reencryption(
+    options: ReencryptionStart = ReencryptionStart(),
+    current_admin: Principal = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """以目前的金鑰重新加密所有加密欄位，有未完成的任務時從檢查點繼續"""
+    if options.rows_per_second is not None and options.rows_per_second < 0:
+        raise HTTPException(status_code=400, detail="rows_per_second 不能小於 0")
+    try:
+        job = start_reencryption_job(db, options.rows_per_second)
+    except ReencryptionJobConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    run_reencryption_job_in_background(job.id)
+    return _reencryption_status(job)
+
+@router.get("/reencryption", response_model=ReencryptionJobStatus)
+def get_reencryption_progress(
+    current_admin: Principal = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """查看最近一次重新加密任務的進度"""
+    job = get_latest_reencryption_job(db)
+    if not job:
+        raise HTTPException(status_code=404, detail="尚未執行過重新加密任務")
+    return _reencryption_status(job)
+
+@router.post("/reencryption/pause", response_model=ReencryptionJobStatus)
+def pause_reencryption(
+    current_admin: Principal = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """暫停重新加密任務，之後可再次啟動從檢查點繼續"""
+    job = get_latest_reencryption_job(db)
+    if not job:
+        raise HTTPException(status_code=404, detail="尚未執行過重新加密任務")
+    return _reencryption_status(pause_reencryption_job(db, job))
+
+@router.get("/metrics")
+def get_metrics(current_admin: Principal = Depends(get_current_admin)):
+    """目前 worker 行程的快取與效能指標"""
+    return collect_metrics()
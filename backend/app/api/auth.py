@@ -1,9 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from datetime import timedelta
 from app.core.database import get_db
-from app.core.security import verify_password, get_password_hash, create_access_token
+from app.core.security import verify_password_async, get_password_hash_async, create_access_token
 from app.core.config import settings
 from app.core.timezone import get_taipei_now
 from app.models.user import User
@@ -40,7 +41,8 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
             raise HTTPException(status_code=403, detail="此電子郵件已被封鎖,無法註冊")
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    hashed_password = get_password_hash(user.password)
+    # 雜湊在專用執行緒池中執行，不阻塞事件迴圈
+    hashed_password = await get_password_hash_async(user.password)
     db_user = User(
         username=user.email,  # 儲存 email 作為 username
         hashed_password=hashed_password,
@@ -78,10 +80,20 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
 
     return db_user
 
+def _get_user_by_username(db: Session, username: str):
+    return db.query(User).filter(User.username == username).first()
+
+def _record_login(db: Session, user: User):
+    """更新最後登入時間並提交 (提交後 user 的屬性會過期，需要的值請先讀出)"""
+    user.last_login_at = get_taipei_now()
+    db.commit()
+
+# 登入為 async 端點：資料庫存取在執行緒池執行，bcrypt 在專用執行緒池中 await，
+# 等待雜湊的請求不佔用 API 的執行緒
 @router.post("/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    user = await run_in_threadpool(_get_user_by_username, db, form_data.username)
+    if not user or not await verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -95,30 +107,32 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
             detail="此帳號已被封鎖,無法登入"
         )
 
+    username = user.username
+    two_factor_enabled = user.two_factor_enabled
+
     # 更新最後登入時間
-    user.last_login_at = get_taipei_now()
-    db.commit()
+    await run_in_threadpool(_record_login, db, user)
 
     # 如果啟用了 2FA，返回需要 2FA 驗證的標記
-    if user.two_factor_enabled:
+    if two_factor_enabled:
         # 創建臨時 token（包含 pending_2fa 標記）
         temp_token = create_access_token(
-            data={"sub": user.username, "pending_2fa": True}
+            data={"sub": username, "pending_2fa": True}
         )
         return {"access_token": temp_token, "token_type": "bearer", "requires_2fa": True}
 
     # 正常登入
-    access_token = create_access_token(data={"sub": user.username})
+    access_token = create_access_token(data={"sub": username})
     return {"access_token": access_token, "token_type": "bearer", "requires_2fa": False}
 
 @router.post("/login/2fa/verify", response_model=Token)
-def verify_2fa_login(
+async def verify_2fa_login(
     login_data: TwoFactorLogin,
     db: Session = Depends(get_db)
 ):
     """驗證 2FA 並完成登入"""
-    user = db.query(User).filter(User.username == login_data.email).first()
-    if not user or not verify_password(login_data.password, user.hashed_password):
+    user = await run_in_threadpool(_get_user_by_username, db, login_data.email)
+    if not user or not await verify_password_async(login_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -146,12 +160,13 @@ def verify_2fa_login(
             detail="Invalid 2FA code"
         )
 
+    username = user.username
+
     # 更新最後登入時間
-    user.last_login_at = get_taipei_now()
-    db.commit()
+    await run_in_threadpool(_record_login, db, user)
 
     # 創建正常的 access token
-    access_token = create_access_token(data={"sub": user.username})
+    access_token = create_access_token(data={"sub": username})
     return {"access_token": access_token, "token_type": "bearer", "requires_2fa": False}
 
 @router.get("/me", response_model=UserSchema)
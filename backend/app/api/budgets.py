@@ -1,19 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, case
+from sqlalchemy.orm import Session, joinedload, selectinload
 from typing import List, Optional
 from datetime import date, datetime, timezone
 import pytz
 from app.core.database import get_db
-from app.models.user import User
 from app.models.budget import Budget
 from app.models.budget_account import BudgetAccount
 from app.models.budget_category import BudgetCategory
-from app.models.transaction import Transaction
 from app.schemas.budget import Budget as BudgetSchema, BudgetCreate, BudgetUpdate
-from app.api.deps import get_current_user
+from app.api.deps import get_current_principal
+from app.core.principal import Principal
 from app.utils.budget_period import calculate_period_range, calculate_next_period_range
 from app.services.budget_stats import update_budget_stats
+from app.services.budget_spent import clamp_spent, recompute_budgets_spent
+from app.services.change_log import deletes, record_changes, upserts
 
 router = APIRouter()
 
@@ -73,97 +73,27 @@ def calculate_dynamic_daily_limit(budget: Budget, spent: float) -> float:
 
     return round(dynamic_daily_limit, 2)
 
-def calculate_budget_spent(db: Session, budget: Budget, category_names: List[str] = None) -> float:
-    """計算預算已使用金額（計算方式：總支出 - 總收入）
-
-    邏輯說明：
-    - 如果預算沒有綁定帳戶：計算使用者所有帳戶的交易
-    - 如果預算綁定了帳戶：只計算這些帳戶的交易
-    - 如果預算沒有綁定類別（空列表）：計算所有類別的交易
-    - 如果預算綁定了類別：只計算這些類別的交易
-    - 排除 exclude_from_budget=True 的交易
-    - 支出包含：debit, installment
-    - 收入包含：credit
-    """
-    # 獲取預算綁定的帳戶ID列表
-    account_ids = [acc.id for acc in budget.accounts]
-
-    # 建立基礎查詢 - 使用 case 做條件加總
-    # income: transactions where type is 'credit'
-    # expense: transactions where type is 'debit' or 'installment'
-    query = db.query(
-        func.sum(case((Transaction.transaction_type == 'credit', Transaction.amount), else_=0)).label('total_income'),
-        func.sum(case((Transaction.transaction_type.in_(['debit', 'installment']), Transaction.amount), else_=0)).label('total_expense')
-    ).filter(
-        Transaction.transaction_date >= budget.start_date,
-        Transaction.transaction_date <= budget.end_date,
-        Transaction.exclude_from_budget == False  # 排除不計入預算的交易
-    )
-
-    # 如果有綁定帳戶，只計算這些帳戶的交易
-    if account_ids:
-        query = query.filter(Transaction.account_id.in_(account_ids))
-    else:
-        # 沒有綁定帳戶，計算該使用者所有帳戶的交易
-        from app.models.account import Account
-        user_account_ids = db.query(Account.id).filter(Account.user_id == budget.user_id).all()
-        user_account_ids = [acc_id[0] for acc_id in user_account_ids]
-        query = query.filter(Transaction.account_id.in_(user_account_ids))
-
-    # 如果有指定類別列表且不為空，則只計算這些類別的交易
-    if category_names and len(category_names) > 0:
-        query = query.filter(Transaction.category.in_(category_names))
-
-    result = query.first()
-    
-    total_income = result.total_income or 0.0
-    total_expense = result.total_expense or 0.0
-
-    # 預算使用量 = 總支出 - 總收入
-    spent = total_expense - total_income
-    
-    return spent if spent > 0 else 0.0  # 保持非負數，或者允許負數表示盈餘？通常預算消耗是正數。
-                                       # 如果收入大於支出，spent 會是負數。
-                                       # 但原本的預算概念是 "花費"，如果 "賺了" 應該是讓花費變少。
-                                       # 如果賺得比花的多，spent 是負數，這樣剩餘預算 (Limit - Spent) 會變大。
-                                       # 這符合邏輯。
-                                       # 但是，如果 spent 是負數，前端進度條可能需要處理。
-                                       # 暫且不限制非負數，直接返回計算結果。
-                                       # 但等等，如果返回負數，前端進度條 `spent / amount` 會變成負數。
-                                       # 用戶說 "減去400"，意即抵銷。
-                                       # 如果支出 800 收入 400 => spent 400.
-                                       # 如果支出 800 收入 1000 => spent -200.
-                                       # Dashboard: Limit 2000. Spent -200. Remaining 2200.
-                                       # 這聽起來是合理的。
-                                       # 不過這裡我會先把 `if spent > 0 else 0.0` 去掉，或者保留 raw value.
-                                       # 讓我們看 Dashboard Vue:
-                                       # width: Math.min((budget.spent / budget.amount) * 100, 100) + '%'
-                                       # 如果 spent 是負數，width 會是負數，CSS width 不能是負數。
-                                       # Vue template logic: width: ...
-                                       # I should probably just return the raw value and let frontend handle display quirks if any.
-                                       # However, to be safe and match user expectation "Budget usage should decrease", negative usage is technically possible.
-                                       # Start with returning raw value.
-
-    return spent
-
 @router.get("/", response_model=List[BudgetSchema])
-def get_budgets(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    # 使用 joinedload 預載入關聯的帳戶
-    budgets = db.query(Budget).options(joinedload(Budget.accounts)).filter(Budget.user_id == current_user.id).all()
-
-    # 自動更新每個預算的已使用金額，並設置 account_ids 和 category_names
+def get_budgets(current_user: Principal = Depends(get_current_principal), db: Session = Depends(get_db)):
+    # 預載入關聯的帳戶與類別
+    budgets = db.query(Budget).options(
+        joinedload(Budget.accounts),
+        selectinload(Budget.budget_categories)
+    ).filter(Budget.user_id == current_user.id).all()
+
+    # 設置每個預算的 account_ids 和 category_names
     result = []
     for budget in budgets:
         # 獲取綁定的類別名稱列表
-        category_names = list(set([bc.category_name for bc in db.query(BudgetCategory).filter(BudgetCategory.budget_id == budget.id).all()]))
+        category_names = list(set([bc.category_name for bc in budget.budget_categories]))
 
-        # 計算已使用金額（傳入類別名稱列表）
-        budget.spent = calculate_budget_spent(db, budget, category_names)
+        # 已使用金額由交易寫入時維護，直接讀取
+        spent = clamp_spent(budget.spent)
 
         # 計算每日預算（根據模式）
         if budget.daily_limit_mode == 'auto':
             # 系統自動計算動態每日預算
-            calculated_daily_limit = calculate_dynamic_daily_limit(budget, budget.spent)
+            calculated_daily_limit = calculate_dynamic_daily_limit(budget, spent)
         else:
             # 手動填寫模式，使用原有的 daily_limit
             calculated_daily_limit = budget.daily_limit
@@ -176,7 +106,7 @@ def get_budgets(current_user: User = Depends(get_current_user), db: Session = De
             "amount": budget.amount,
             "daily_limit": calculated_daily_limit,
             "daily_limit_mode": budget.daily_limit_mode,
-            "spent": budget.spent,
+            "spent": spent,
             "range_mode": budget.range_mode,
             "period": budget.period,
             "start_date": budget.start_date,
@@ -200,7 +130,7 @@ def get_budgets(current_user: User = Depends(get_current_user), db: Session = De
 @router.post("/", response_model=BudgetSchema)
 def create_budget(
     budget: BudgetCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     budget_data = budget.dict()
@@ -222,11 +152,16 @@ def create_budget(
 
     # Create budget (excluding account_ids and category_names)
     # If is_primary is True, unset other primary budgets
+    previous_primary_ids = []
     if budget_data.get('is_primary'):
-        db.query(Budget).filter(Budget.user_id == current_user.id, Budget.is_primary == True).update({"is_primary": False})
+        primary_query = db.query(Budget).filter(Budget.user_id == current_user.id, Budget.is_primary == True)
+        previous_primary_ids = [budget_id for (budget_id,) in primary_query.with_entities(Budget.id)]
+        primary_query.update({"is_primary": False})
     
     db_budget = Budget(**budget_data, user_id=current_user.id)
     db.add(db_budget)
+    db.flush()
+    record_changes(db, current_user.id, upserts("budget", previous_primary_ids + [db_budget.id]))
     db.commit()
     db.refresh(db_budget)
 
@@ -241,6 +176,7 @@ def create_budget(
             ).first()
             if not account:
                 db.delete(db_budget)
+                record_changes(db, current_user.id, deletes("budget", [db_budget.id]))
                 db.commit()
                 raise HTTPException(status_code=404, detail=f"Account {account_id} not found")
 
@@ -257,12 +193,16 @@ def create_budget(
             budget_category = BudgetCategory(budget_id=db_budget.id, category_name=category_name)
             db.add(budget_category)
 
+    # 依日期區間與綁定計算已使用金額，之後由交易寫入時維護
+    recompute_budgets_spent(db, [db_budget.id])
+    record_changes(db, current_user.id, upserts("budget", [db_budget.id]))
     db.commit()
     db.refresh(db_budget)
+    spent = clamp_spent(db_budget.spent)
 
     # 計算每日預算（根據模式）
     if db_budget.daily_limit_mode == 'auto':
-        calculated_daily_limit = calculate_dynamic_daily_limit(db_budget, db_budget.spent)
+        calculated_daily_limit = calculate_dynamic_daily_limit(db_budget, spent)
     else:
         calculated_daily_limit = db_budget.daily_limit
 
@@ -274,7 +214,7 @@ def create_budget(
         "amount": db_budget.amount,
         "daily_limit": calculated_daily_limit,
         "daily_limit_mode": db_budget.daily_limit_mode,
-        "spent": db_budget.spent,
+        "spent": spent,
         "range_mode": db_budget.range_mode,
         "period": db_budget.period,
         "start_date": db_budget.start_date,
@@ -291,28 +231,28 @@ def create_budget(
 @router.get("/{budget_id}", response_model=BudgetSchema)
 def get_budget(
     budget_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
-    budget = db.query(Budget).options(joinedload(Budget.accounts)).filter(
+    budget = db.query(Budget).options(
+        joinedload(Budget.accounts),
+        selectinload(Budget.budget_categories)
+    ).filter(
         Budget.id == budget_id,
         Budget.user_id == current_user.id
     ).first()
     if not budget:
         raise HTTPException(status_code=404, detail="Budget not found")
 
-    # 獲取綁定的類別名稱列表
-    category_names = [bc.category_name for bc in db.query(BudgetCategory).filter(BudgetCategory.budget_id == budget.id).all()]
-    # 去除重複顯示
-    category_names = list(set(category_names))
+    # 獲取綁定的類別名稱列表（去除重複顯示）
+    category_names = list(set([bc.category_name for bc in budget.budget_categories]))
 
-    # 自動更新已使用金額
-    budget.spent = calculate_budget_spent(db, budget, category_names)
-    # db.commit()  # Do not commit changes on GET request
+    # 已使用金額由交易寫入時維護，直接讀取
+    spent = clamp_spent(budget.spent)
 
     # 計算每日預算（根據模式）
     if budget.daily_limit_mode == 'auto':
-        calculated_daily_limit = calculate_dynamic_daily_limit(budget, budget.spent)
+        calculated_daily_limit = calculate_dynamic_daily_limit(budget, spent)
     else:
         calculated_daily_limit = budget.daily_limit
 
@@ -323,7 +263,7 @@ def get_budget(
         "amount": budget.amount,
         "daily_limit": calculated_daily_limit,
         "daily_limit_mode": budget.daily_limit_mode,
-        "spent": budget.spent,
+        "spent": spent,
         "range_mode": budget.range_mode,
         "period": budget.period,
         "start_date": budget.start_date,
@@ -341,7 +281,7 @@ def get_budget(
 def update_budget(
     budget_id: int,
     budget_update: BudgetUpdate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     budget = db.query(Budget).filter(
@@ -354,18 +294,22 @@ def update_budget(
     update_data = budget_update.dict(exclude_unset=True)
     account_ids = update_data.pop('account_ids', None)  # 提取 account_ids
     category_names = update_data.pop('category_names', None)  # 提取 category_names
+    update_data.pop('spent', None)  # 已使用金額由交易寫入時維護，不接受手動設定
 
     # Update basic budget info
     for key, value in update_data.items():
         setattr(budget, key, value)
         
     # If is_primary is being set to True, unset other primary budgets
+    previous_primary_ids = []
     if update_data.get('is_primary'):
-        db.query(Budget).filter(
+        primary_query = db.query(Budget).filter(
             Budget.user_id == current_user.id, 
             Budget.is_primary == True,
             Budget.id != budget_id
-        ).update({"is_primary": False})
+        )
+        previous_primary_ids = [primary_id for (primary_id,) in primary_query.with_entities(Budget.id)]
+        primary_query.update({"is_primary": False})
 
     # 如果有更新 account_ids，則更新關聯
     if account_ids is not None:
@@ -399,25 +343,35 @@ def update_budget(
                 budget_category = BudgetCategory(budget_id=budget_id, category_name=category_name)
                 db.add(budget_category)
 
+    # 日期區間或綁定變更時，已使用金額需要完整重算
+    if ('start_date' in update_data or 'end_date' in update_data or
+            account_ids is not None or category_names is not None):
+        recompute_budgets_spent(db, [budget_id])
+
+    record_changes(db, current_user.id, upserts("budget", previous_primary_ids + [budget_id]))
     db.commit()
     db.refresh(budget)
 
     # 如果更新了影響統計的欄位，重新計算統計
     should_recalculate = (
         'daily_limit_mode' in update_data or
+        'daily_limit' in update_data or
         'amount' in update_data or
         'start_date' in update_data or
-        'end_date' in update_data
+        'end_date' in update_data or
+        account_ids is not None or
+        category_names is not None
     )
     if should_recalculate:
         budget = update_budget_stats(db, budget)
 
     # 獲取更新後的類別名稱列表
     updated_category_names = [bc.category_name for bc in db.query(BudgetCategory).filter(BudgetCategory.budget_id == budget_id).all()]
+    spent = clamp_spent(budget.spent)
 
     # 計算每日預算（根據模式）
     if budget.daily_limit_mode == 'auto':
-        calculated_daily_limit = calculate_dynamic_daily_limit(budget, budget.spent)
+        calculated_daily_limit = calculate_dynamic_daily_limit(budget, spent)
     else:
         calculated_daily_limit = budget.daily_limit
 
@@ -428,7 +382,7 @@ def update_budget(
         "amount": budget.amount,
         "daily_limit": calculated_daily_limit,
         "daily_limit_mode": budget.daily_limit_mode,
-        "spent": budget.spent,
+        "spent": spent,
         "range_mode": budget.range_mode,
         "period": budget.period,
         "start_date": budget.start_date,
@@ -448,7 +402,7 @@ def update_budget(
 @router.delete("/{budget_id}")
 def delete_budget(
     budget_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     budget = db.query(Budget).filter(
@@ -473,6 +427,7 @@ def delete_budget(
         db.commit()
 
     db.delete(budget)
+    record_changes(db, current_user.id, deletes("budget", [budget_id]))
     db.commit()
     return {"message": "Budget deleted successfully"}
 
@@ -480,7 +435,7 @@ def delete_budget(
 @router.post("/{budget_id}/recalculate-stats", response_model=BudgetSchema)
 def recalculate_budget_stats(
     budget_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """手動觸發預算統計重新計算
@@ -498,24 +453,21 @@ def recalculate_budget_stats(
     if not budget:
         raise HTTPException(status_code=404, detail="Budget not found")
 
-    # 更新統計
+    # 重新計算已使用金額並更新統計
+    recompute_budgets_spent(db, [budget.id])
     budget = update_budget_stats(db, budget)
 
-    # 獲取類別名稱列表並計算 spent
-    category_names = list(set([
-        bc.category_name
-        for bc in db.query(BudgetCategory).filter(
-            BudgetCategory.budget_id == budget.id
-        ).all()
-    ]))
-    budget.spent = calculate_budget_spent(db, budget, category_names)
+    # 獲取類別名稱列表
+    category_names = list(set([bc.category_name for bc in budget.budget_categories]))
+    spent = clamp_spent(budget.spent)
 
     # 計算動態每日預算（如果是 auto 模式）
     if budget.daily_limit_mode == 'auto':
-        budget.daily_limit = calculate_dynamic_daily_limit(budget, budget.spent)
+        budget.daily_limit = calculate_dynamic_daily_limit(budget, spent)
 
     # 構建返回數據
     budget_data = BudgetSchema.from_orm(budget)
+    budget_data.spent = spent
     budget_data.account_ids = [acc.id for acc in budget.accounts]
     budget_data.category_names = category_names
 
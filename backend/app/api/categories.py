@@ -2,9 +2,10 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from typing import List
 from app.core.database import get_db
-from app.api.deps import get_current_user
-from app.models.user import User
+from app.api.deps import get_current_principal
+from app.core.principal import Principal
 from app.models.category import Category
+from app.services.change_log import deletes, record_changes, upserts
 from app.schemas.category import (
     Category as CategorySchema,
     CategoryCreate,
@@ -17,7 +18,7 @@ router = APIRouter()
 
 @router.get("/", response_model=List[CategorySchema])
 def get_categories(
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """取得目前使用者的所有類別"""
@@ -35,10 +36,12 @@ def get_categories(
                 order_index=idx
             )
             db.add(category)
-        db.commit()
+        db.flush()
         categories = db.query(Category).filter(
             Category.user_id == current_user.id
         ).order_by(Category.order_index).all()
+        record_changes(db, current_user.id, upserts("category", [c.id for c in categories]))
+        db.commit()
 
     return categories
 
@@ -46,7 +49,7 @@ def get_categories(
 @router.post("/", response_model=CategorySchema)
 def create_category(
     category_data: CategoryCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """新增類別"""
@@ -73,6 +76,8 @@ def create_category(
         order_index=max_order
     )
     db.add(category)
+    db.flush()
+    record_changes(db, current_user.id, upserts("category", [category.id]))
     db.commit()
     db.refresh(category)
     return category
@@ -82,7 +87,7 @@ def create_category(
 def update_category(
     category_id: int,
     category_data: CategoryUpdate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """更新類別"""
@@ -114,6 +119,7 @@ def update_category(
     if category_data.order_index is not None:
         category.order_index = category_data.order_index
 
+    record_changes(db, current_user.id, upserts("category", [category.id]))
     db.commit()
     db.refresh(category)
     return category
@@ -122,10 +128,11 @@ def update_category(
 @router.post("/reorder")
 def reorder_categories(
     orders: List[CategoryOrderUpdate],
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """批次更新類別順序"""
+    updated_ids = []
     for order_data in orders:
         category = db.query(Category).filter(
             Category.id == order_data.category_id,
@@ -134,7 +141,9 @@ def reorder_categories(
 
         if category:
             category.order_index = order_data.order_index
+            updated_ids.append(category.id)
 
+    record_changes(db, current_user.id, upserts("category", updated_ids))
     db.commit()
     return {"message": "類別順序已更新"}
 
@@ -142,7 +151,7 @@ def reorder_categories(
 @router.delete("/{category_id}")
 def delete_category(
     category_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """刪除類別"""
@@ -158,5 +167,6 @@ def delete_category(
         )
 
     db.delete(category)
+    record_changes(db, current_user.id, deletes("category", [category_id]))
     db.commit()
     return {"message": "類別已刪除"}
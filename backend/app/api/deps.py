@@ -1,41 +1,76 @@
+from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.core.database import get_db
+from app.core.database import get_async_db, get_db
+from app.core.principal import Principal, get_principal, get_principal_async
 from app.core.security import decode_access_token
 from app.models.user import User
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
 
+def _token_subject(token: str) -> str:
+    """驗證 JWT 並回傳 subject (username)"""
     payload = decode_access_token(token)
     if payload is None:
-        raise credentials_exception
+        raise _credentials_exception()
 
     username: str = payload.get("sub")
     if username is None:
-        raise credentials_exception
+        raise _credentials_exception()
+    return username
 
-    user = db.query(User).filter(User.username == username).first()
-    if user is None:
-        raise credentials_exception
+def _check_principal(principal: Optional[Principal]) -> Principal:
+    if principal is None:
+        raise _credentials_exception()
 
     # 檢查使用者是否被封鎖
-    if user.is_blocked:
+    if principal.is_blocked:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="此帳號已被封鎖，無法登入"
         )
 
+    return principal
+
+def get_current_principal(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
+    """
+    驗證 JWT 並回傳已驗證的使用者 (ID、管理員、封鎖狀態)
+
+    principal 由行程內快取提供，快取命中時不查詢資料庫；
+    只需要 current_user.id 的端點應使用此依賴。
+    """
+    return _check_principal(get_principal(db, _token_subject(token)))
+
+async def get_current_principal_async(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+) -> Principal:
+    """get_current_principal 的 async 版本，async 端點使用 (不經過執行緒池)"""
+    return _check_principal(await get_principal_async(db, _token_subject(token)))
+
+def get_current_user(principal: Principal = Depends(get_current_principal), db: Session = Depends(get_db)) -> User:
+    """回傳完整的 User (需要修改使用者或讀取 2FA 等欄位的端點使用)"""
+    user = db.get(User, principal.id)
+    if user is None:
+        raise _credentials_exception()
+    # 快取的 principal 可能尚未反映其他 worker 的封鎖
+    if user.is_blocked:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="此帳號已被封鎖，無法登入"
+        )
     return user
 
-def get_current_admin(current_user: User = Depends(get_current_user)) -> User:
+def get_current_admin(current_user: Principal = Depends(get_current_principal)) -> Principal:
     """檢查當前使用者是否為管理員"""
     if not current_user.is_admin:
         raise HTTPException(
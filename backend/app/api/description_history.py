@@ -4,7 +4,8 @@ from typing import List
 from datetime import datetime, timezone
 
 from app.api import deps
-from app.models.user import User
+from app.core.principal import Principal
+from app.core.encryption import blind_index
 from app.models.description_history import DescriptionHistory
 from app.schemas import description_history as schemas
 
@@ -16,7 +17,7 @@ MAX_DESCRIPTIONS = 100
 @router.get("/", response_model=schemas.DescriptionHistoryList)
 def get_description_history(
     db: Session = Depends(deps.get_db),
-    current_user: User = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_principal)
 ) -> schemas.DescriptionHistoryList:
     """
     獲取當前使用者的敘述歷史，按照 last_used_at 降序排列
@@ -35,7 +36,7 @@ def get_description_history(
 def update_description_history(
     description: str,
     db: Session = Depends(deps.get_db),
-    current_user: User = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
     """
     更新或新增敘述歷史記錄
@@ -50,17 +51,11 @@ def update_description_history(
     description = description.strip()
 
     # 檢查是否已存在此敘述
-    # 由於 description 是加密欄位，無法直接在 SQL 查詢中比對
-    # 需要取得所有該使用者的記錄，在應用層解密後比對
-    all_histories = db.query(DescriptionHistory).filter(
-        DescriptionHistory.user_id == current_user.id
-    ).all()
-
-    existing = None
-    for history in all_histories:
-        if history.description == description:
-            existing = history
-            break
+    # description 是加密欄位，以盲索引在 SQL 中比對
+    existing = db.query(DescriptionHistory).filter(
+        DescriptionHistory.user_id == current_user.id,
+        DescriptionHistory.description_hash == blind_index(description)
+    ).first()
 
     if existing:
         # 更新 last_used_at 讓它排到最前面
@@ -101,7 +96,7 @@ def update_description_history(
 def delete_description_history(
     description_id: int,
     db: Session = Depends(deps.get_db),
-    current_user: User = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
     """
     刪除特定的敘述歷史記錄
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from app.core.database import get_db
+from app.core.database import get_async_db
 from app.models.exchange_rate import ExchangeRate
 from pydantic import BaseModel
 from datetime import datetime
@@ -21,9 +22,9 @@ class ExchangeRateResponse(BaseModel):
         from_attributes = True
 
 @router.get("/latest", response_model=List[ExchangeRateResponse])
-def get_latest_rates(
+async def get_latest_rates(
     bank: Optional[str] = Query(None, description="銀行代碼：bot (臺灣銀行), esun (玉山銀行)"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     取得最新匯率資料
@@ -31,10 +32,10 @@ def get_latest_rates(
     - 指定 bank='bot'：僅返回臺灣銀行匯率
     - 指定 bank='esun'：僅返回玉山銀行匯率
     """
-    query = db.query(ExchangeRate)
+    query = select(ExchangeRate)
 
     if bank:
-        query = query.filter(ExchangeRate.bank == bank)
+        query = query.where(ExchangeRate.bank == bank)
 
-    rates = query.order_by(ExchangeRate.bank, ExchangeRate.currency_code).all()
-    return rates
+    rates = await db.scalars(query.order_by(ExchangeRate.bank, ExchangeRate.currency_code))
+    return rates.all()
@@ -7,6 +7,7 @@ from app.core.database import get_db
 from app.core.security import get_password_hash
 from app.core.email import send_password_reset_email
 from app.core.config import settings
+from app.core.principal import invalidate_principal
 from app.models.user import User
 from app.models.password_reset import PasswordResetToken
 from app.schemas.password_reset import (
@@ -144,6 +145,7 @@ def confirm_password_reset(
     reset_token.is_used = True
 
     db.commit()
+    invalidate_principal(user.username)
 
     return PasswordResetResponse(
         message="密碼已成功重設，請使用新密碼登入"
@@ -7,19 +7,20 @@ from calendar import monthrange
 import uuid
 
 from app.core.database import get_db
-from app.models.user import User
 from app.models.account import Account
 from app.models.recurring_expense import RecurringExpense
 from app.models.transaction import Transaction
 from app.schemas.recurring_expense import RecurringExpense as RecurringExpenseSchema, RecurringExpenseCreate, RecurringExpenseUpdate
-from app.api.deps import get_current_user
+from app.api.deps import get_current_principal
+from app.core.principal import Principal
 from app.core.timezone import to_utc, TAIPEI_TZ
+from app.services.transaction_sync import snapshot, sync_transaction_changes
 
 router = APIRouter()
 
 @router.get("/", response_model=List[RecurringExpenseSchema])
 def get_recurring_expenses(
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """取得目前使用者的所有固定支出"""
@@ -40,7 +41,7 @@ def get_recurring_expenses(
 @router.post("/", response_model=RecurringExpenseSchema)
 def create_recurring_expense(
     recurring_expense: RecurringExpenseCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """建立新的固定支出"""
@@ -99,7 +100,7 @@ def create_recurring_expense(
 def update_recurring_expense(
     recurring_expense_id: int,
     recurring_expense_update: RecurringExpenseUpdate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """更新固定支出"""
@@ -132,7 +133,7 @@ def delete_recurring_expense(
     recurring_expense_id: int,
     mode: str = Query(..., description="Delete mode: 'single', 'future', 'all'"),
     transaction_id: int = Query(None, description="Transaction ID (required for 'single' and 'future' modes)"),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """
@@ -176,6 +177,7 @@ def delete_recurring_expense(
             account.balance += transaction.amount
 
         db.delete(transaction)
+        sync_transaction_changes(db, current_user.id, removed=[snapshot(transaction)])
         db.commit()
 
         return {"message": "Transaction deleted successfully"}
@@ -221,6 +223,7 @@ def delete_recurring_expense(
                     # Reverse the debit transaction
                     transaction.account.balance += transaction.amount
                 db.delete(transaction)
+            sync_transaction_changes(db, current_user.id, removed=[snapshot(t) for t in transactions_to_delete])
 
             # Flush transaction deletions before deleting recurring expense
             db.flush()
@@ -240,6 +243,7 @@ def delete_recurring_expense(
                     # Reverse the debit transaction
                     transaction.account.balance += transaction.amount
                 db.delete(transaction)
+            sync_transaction_changes(db, current_user.id, removed=[snapshot(t) for t in transactions_to_delete])
 
             # Set end_date on recurring expense to prevent future transactions
             recurring_expense.end_date = target_date
@@ -264,6 +268,7 @@ def delete_recurring_expense(
                 # Reverse the debit transaction
                 transaction.account.balance += transaction.amount
             db.delete(transaction)
+        sync_transaction_changes(db, current_user.id, removed=[snapshot(t) for t in transactions])
 
         # Flush transaction deletions before deleting recurring expense
         db.flush()
@@ -280,7 +285,7 @@ def delete_recurring_expense(
 @router.get("/{recurring_expense_id}", response_model=RecurringExpenseSchema)
 def get_recurring_expense(
     recurring_expense_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """取得單一固定支出"""
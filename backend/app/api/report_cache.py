@@ -0,0 +1,135 @@
+"""
+報表結果快取
+
+以 (user_id, 路徑, 排序後的查詢參數, 使用者資料版本) 為鍵快取報表的 JSON 結果。
+使用者的交易/帳戶/預算/類別異動時 data_version 會遞增，舊的快取不再被命中，
+最後由 LRU 或 TTL 淘汰。
+
+回應帶有 ETag，前端 (或瀏覽器) 以 If-None-Match 重新驗證時，內容未變則回傳 304。
+
+用法：
+
+    @router.get("/overview/monthly", response_model=OverviewReport)
+    @cached_report
+    def get_monthly_overview(...):
+        ...
+"""
+import functools
+import hashlib
+import inspect
+from typing import Optional
+
+from fastapi import Depends, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy.orm import Session
+
+from app.api.deps import get_current_principal
+from app.core.principal import Principal
+from app.core.cache import CacheBackend, MemoryCacheBackend, SharedStoreCacheBackend, InProcessSharedStore
+from app.core.config import settings
+from app.core.database import get_db
+from app.core.metrics import register_metrics
+from app.services.data_version import get_data_version
+
+
+def _create_backend() -> CacheBackend:
+    if settings.REPORT_CACHE_BACKEND == "shared":
+        return SharedStoreCacheBackend(
+            InProcessSharedStore(),
+            prefix="report:",
+            default_ttl=settings.REPORT_CACHE_TTL_SECONDS
+        )
+    return MemoryCacheBackend(
+        max_entries=settings.REPORT_CACHE_MAX_ENTRIES,
+        max_bytes=settings.REPORT_CACHE_MAX_BYTES,
+        default_ttl=settings.REPORT_CACHE_TTL_SECONDS
+    )
+
+
+report_cache_backend = _create_backend()
+register_metrics("report_cache", report_cache_backend.stats)
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+class ReportCache:
+    """單一請求的報表快取操作"""
+
+    def __init__(self, request: Request, user_id: int, data_version: int, backend: CacheBackend):
+        self.request = request
+        self.backend = backend
+        query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+        raw_key = f"{user_id}:{data_version}:{request.url.path}?{query}"
+        self.key = hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+    def _response(self, etag: str, body: bytes, cache_status: str) -> Response:
+        headers = {
+            "ETag": etag,
+            "Cache-Control": "private, no-cache",
+            "X-Cache": cache_status,
+        }
+        if _etag_matches(self.request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def lookup(self) -> Optional[Response]:
+        """命中時回傳快取的回應 (或 304)，否則回傳 None"""
+        if not settings.REPORT_CACHE_ENABLED:
+            return None
+        cached = self.backend.get(self.key)
+        if cached is None:
+            return None
+        etag, body = cached.split(b"\n", 1)
+        return self._response(etag.decode("ascii"), body, "HIT")
+
+    def store(self, result) -> Response:
+        """序列化報表結果、寫入快取並回傳回應"""
+        body = JSONResponse(jsonable_encoder(result)).body
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        if settings.REPORT_CACHE_ENABLED:
+            self.backend.set(self.key, etag.encode("ascii") + b"\n" + body)
+        return self._response(etag, body, "MISS")
+
+
+def get_report_cache(
+    request: Request,
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db)
+) -> ReportCache:
+    # 版本另外查詢，確保讀到的是資料庫中最新的值
+    data_version = get_data_version(db, current_user.id)
+    return ReportCache(request, current_user.id, data_version, report_cache_backend)
+
+
+def cached_report(endpoint):
+    """
+    為同步的報表端點加上結果快取
+
+    會在端點簽章中加入 report_cache 依賴，未命中時執行原端點並快取結果。
+    端點拋出的例外 (例如 HTTPException) 不會被快取。
+    """
+    signature = inspect.signature(endpoint)
+    parameters = list(signature.parameters.values()) + [
+        inspect.Parameter(
+            "report_cache",
+            inspect.Parameter.KEYWORD_ONLY,
+            default=Depends(get_report_cache),
+            annotation=ReportCache
+        )
+    ]
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, report_cache: ReportCache, **kwargs):
+        cached = report_cache.lookup()
+        if cached is not None:
+            return cached
+        return report_cache.store(endpoint(*args, **kwargs))
+
+    wrapper.__signature__ = signature.replace(parameters=parameters)
+    return wrapper
@@ -1,33 +1,35 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
+from typing import List, Optional
 from datetime import datetime, date, timezone
 from calendar import monthrange
 from collections import defaultdict
 
 from app.core.database import get_db
-from app.models.user import User
 from app.models.account import Account
-from app.models.transaction import Transaction
 from app.schemas.report import (
     OverviewReport, DetailsReport, CategoryReport,
-    RankingReport, AccountReport, CategoryStats,
-    AccountStats, TransactionDetail, DailyTransactions
+    RankingReport, AccountReport, CombinedReport
 )
-from app.api.deps import get_current_user
+from app.api.deps import get_current_principal
+from app.core.principal import Principal
+from app.api.report_cache import cached_report
 from app.schemas.budget_report import BudgetReport, BudgetStats, BudgetTransaction
 from app.schemas.ai_financial_report import AIFinancialSummary
 from app.models.budget import Budget
-from app.models.budget_category import BudgetCategory
+from app.services.budget_matcher import (
+    BudgetMatcher, load_budget_rules, load_budget_transactions, get_budget_spent_totals
+)
+from app.services.report_engine import ReportEngine, REPORT_SECTIONS, load_report_transactions
 
 router = APIRouter()
 
 @router.get("/budget/monthly", response_model=BudgetReport)
+@cached_report
 def get_monthly_budget_report(
     year: int,
     month: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get monthly budget report"""
@@ -48,88 +50,8 @@ def get_monthly_budget_report(
 
     total_budget_amount = sum(b.amount for b in budgets)
     
-    # 2. Get transactions that match these budgets
-    # We need to filter transactions that fall into any of the budget categories
-    # OR if the budget is not category-specific (global budget), include all expenses?
-    # Usually budgets are category specific. If category is None, maybe it means all?
-    # Let's assume budgets are either category-based or global.
-    
-    budget_categories = set()
-    has_global_budget = False
-    
-    # Process budgets to pre-load constraints
-    processed_budgets = []
-    for b in budgets:
-        # Fetch categories
-        cats = db.query(BudgetCategory.category_name).filter(BudgetCategory.budget_id == b.id).all()
-        categories = {c[0] for c in cats}
-        if b.category:
-            categories.add(b.category)
-            
-        # Fetch accounts (lazy load, but strictly for filtering)
-        # Note: If no accounts linked, it means all accounts
-        linked_accounts = {acc.id for acc in b.accounts} if b.accounts else set()
-        
-        processed_budgets.append({
-            "budget": b,
-            "categories": categories,
-            "accounts": linked_accounts,
-            "has_categories": bool(categories),
-            "start": b.start_date,
-            "end": b.end_date
-        })
+    budget_transactions, total_spent = get_budget_report_transactions(db, current_user.id, budgets, start_date, end_date)
 
-    transactions = get_user_transactions(db, current_user.id, start_date, end_date)
-    
-    budget_transactions = []
-    total_spent = 0.0
-    
-    for t in transactions:
-        # Only consider expenses
-        if t.transaction_type not in ['debit', 'installment']:
-            continue
-            
-        # Skip transactions excluded from budget
-        if t.exclude_from_budget:
-            continue
-            
-        # Check if transaction matches ANY budget
-        is_included = False
-        
-        for pb in processed_budgets:
-            # 1. Date Check (Strictly for the budget's range)
-            # Transaction query already filters by report range, but budget might be shorter?
-            # Usually budget covers the month context in get_monthly_budget_report, but let's be safe
-            # Use date() comparison to avoid timezone issues (fixed previously)
-            if t.transaction_date.date() < pb["start"].date() or t.transaction_date.date() > pb["end"].date():
-                continue
-
-            # 2. Account Check
-            if pb["accounts"] and t.account_id not in pb["accounts"]:
-                continue
-                
-            # 3. Category Check
-            if pb["has_categories"]:
-                if t.category not in pb["categories"]:
-                    continue
-            # If has_categories is False, it's a global budget (matches all categories)
-            
-            # If we passed all checks, this transaction is included
-            is_included = True
-            break
-            
-        if is_included:
-            total_spent += t.amount
-            budget_transactions.append(BudgetTransaction(
-                id=t.id,
-                description=t.description,
-                amount=t.amount,
-                transaction_type=t.transaction_type,
-                category=t.category,
-                transaction_date=t.transaction_date,
-                account_name=t.account_name
-            ))
-            
     remaining = total_budget_amount - total_spent
     
     # Calculate daily average
@@ -172,9 +94,10 @@ def get_monthly_budget_report(
     )
 
 @router.get("/budget/daily", response_model=BudgetReport)
+@cached_report
 def get_daily_budget_report(
     date_str: str,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get daily budget report"""
@@ -210,73 +133,7 @@ def get_daily_budget_report(
             if period_days > 0:
                 total_daily_budget += b.amount / period_days
     
-    budget_categories = set()
-    has_global_budget = False
-    
-    # Process budgets to pre-load constraints
-    processed_budgets = []
-    for b in budgets:
-        # Fetch categories
-        cats = db.query(BudgetCategory.category_name).filter(BudgetCategory.budget_id == b.id).all()
-        categories = {c[0] for c in cats}
-        if b.category:
-            categories.add(b.category)
-            
-        # Fetch accounts
-        linked_accounts = {acc.id for acc in b.accounts} if b.accounts else set()
-        
-        processed_budgets.append({
-            "budget": b,
-            "categories": categories,
-            "accounts": linked_accounts,
-            "has_categories": bool(categories),
-            "start": b.start_date,
-            "end": b.end_date
-        })
-
-    transactions = get_user_transactions(db, current_user.id, start_date, end_date)
-    
-    budget_transactions = []
-    total_spent = 0.0
-    
-    for t in transactions:
-        if t.transaction_type not in ['debit', 'installment']:
-            continue
-            
-        if t.exclude_from_budget:
-            continue
-            
-        # Check if transaction matches ANY budget
-        is_included = False
-        
-        for pb in processed_budgets:
-            # 1. Date Check
-            if t.transaction_date.date() < pb["start"].date() or t.transaction_date.date() > pb["end"].date():
-                continue
-
-            # 2. Account Check
-            if pb["accounts"] and t.account_id not in pb["accounts"]:
-                continue
-                
-            # 3. Category Check
-            if pb["has_categories"]:
-                if t.category not in pb["categories"]:
-                    continue
-            
-            is_included = True
-            break
-            
-        if is_included:
-            total_spent += t.amount
-            budget_transactions.append(BudgetTransaction(
-                id=t.id,
-                description=t.description,
-                amount=t.amount,
-                transaction_type=t.transaction_type,
-                category=t.category,
-                transaction_date=t.transaction_date,
-                account_name=t.account.name if t.account else "Unknown"
-            ))
+    budget_transactions, total_spent = get_budget_report_transactions(db, current_user.id, budgets, start_date, end_date)
 
     remaining = total_daily_budget - total_spent
     
@@ -298,904 +155,323 @@ def get_daily_budget_report(
 
 def get_user_transactions(db: Session, user_id: int, start_date: datetime, end_date: datetime):
     """Helper function to get user's transactions within date range"""
-    user_account_ids = db.query(Account.id).filter(Account.user_id == user_id).all()
-    account_ids = [acc_id for (acc_id,) in user_account_ids]
-
-    if not account_ids:
-        return []
-
-    transactions = db.query(Transaction, Account).join(
-        Account, Transaction.account_id == Account.id
-    ).filter(
-        Transaction.account_id.in_(account_ids),
-        Transaction.transaction_date >= start_date,
-        Transaction.transaction_date < end_date
-    ).order_by(Transaction.transaction_date.desc()).all()
-
-    return [
-        TransactionDetail(
-            id=trans.id,
-            description=trans.description,
-            amount=trans.amount,
-            transaction_type=trans.transaction_type,
-            category=trans.category,
-            transaction_date=trans.transaction_date,
-            account_id=trans.account_id,
-            account_name=account.name,
-            exclude_from_budget=trans.exclude_from_budget
+    return load_report_transactions(db, user_id, start_date, end_date)
+
+def get_budget_report_transactions(db: Session, user_id: int, budgets, start_date: datetime, end_date: datetime):
+    """取得區間內計入任一預算的支出交易與總額"""
+    matcher = BudgetMatcher(load_budget_rules(db, budgets))
+    transactions = load_budget_transactions(db, user_id, matcher, start_date, end_date)
+
+    budget_transactions = [
+        BudgetTransaction(
+            id=t.id,
+            description=t.description,
+            amount=t.amount,
+            transaction_type=t.transaction_type,
+            category=t.category,
+            transaction_date=t.transaction_date,
+            account_name=t.account_name
         )
-        for trans, account in transactions
+        for t in transactions
     ]
+    return budget_transactions, sum(t.amount for t in transactions)
 
-@router.get("/overview/monthly", response_model=OverviewReport)
-def get_monthly_overview(
-    year: int,
-    month: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Get monthly overview report"""
+def get_month_range(year: int, month: int):
+    """取得月報表的 [start, end) 時間區間"""
     start_date = datetime(year, month, 1)
     if month == 12:
         end_date = datetime(year + 1, 1, 1)
     else:
         end_date = datetime(year, month + 1, 1)
+    return start_date, end_date
 
-    transactions = get_user_transactions(db, current_user.id, start_date, end_date)
+def get_day_range(date_str: str):
+    """取得日報表的時間區間"""
+    try:
+        target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
 
-    # Calculate totals
-    total_credit = sum(t.amount for t in transactions if t.transaction_type == 'credit')
-    total_debit = sum(t.amount for t in transactions if t.transaction_type in ['debit', 'installment'])
-    net_amount = total_credit - total_debit
+    return datetime.combine(target_date, datetime.min.time()), datetime.combine(target_date, datetime.max.time())
 
-    # Calculate category stats
-    category_totals = defaultdict(lambda: {'credit': 0.0, 'debit': 0.0})
-    for t in transactions:
-        if t.transaction_type in ['transfer_out', 'transfer_in']:
-            continue
-        cat = t.category or '未分類'
-        if t.transaction_type == 'credit':
-            category_totals[cat]['credit'] += t.amount
-        elif t.transaction_type in ['debit', 'installment']:
-            category_totals[cat]['debit'] += t.amount
-
-    total_amount = total_debit  # Use debit for percentage calculation
-    category_stats = []
-    for cat, amounts in category_totals.items():
-        amount = amounts['debit']
-        percentage = (amount / total_amount * 100) if total_amount > 0 else 0
-        category_stats.append(CategoryStats(
-            category=cat,
-            amount=amount,
-            percentage=percentage,
-            credit=amounts['credit'],
-            debit=amounts['debit']
-        ))
-
-    category_stats.sort(key=lambda x: x.amount, reverse=True)
-
-    # Get top 5 transactions
-    top_five_income = sorted(
-        [t for t in transactions if t.transaction_type == 'credit'],
-        key=lambda x: x.amount,
-        reverse=True
-    )[:5]
-
-    top_five_expense = sorted(
-        [t for t in transactions if t.transaction_type in ['debit', 'installment']],
-        key=lambda x: x.amount,
-        reverse=True
-    )[:5]
-
-    return OverviewReport(
-        total_credit=total_credit,
-        total_debit=total_debit,
-        net_amount=net_amount,
-        category_stats=category_stats,
-        top_five_income=top_five_income,
-        top_five_expense=top_five_expense
-    )
+def get_custom_range(start_date: str, end_date: str):
+    """取得自訂區間報表的時間區間，結束日包含整天"""
+    try:
+        start = datetime.fromisoformat(start_date)
+        end = datetime.fromisoformat(end_date)
+        end = datetime.combine(end.date(), datetime.max.time())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    return start, end
+
+@router.get("/overview/monthly", response_model=OverviewReport)
+@cached_report
+def get_monthly_overview(
+    year: int,
+    month: int,
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db)
+):
+    """Get monthly overview report"""
+    return ReportEngine(db, current_user.id, *get_month_range(year, month)).overview()
 
 @router.get("/overview/daily", response_model=OverviewReport)
+@cached_report
 def get_daily_overview(
     date_str: str,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get daily overview report"""
-    try:
-        target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
-
-    start_date = datetime.combine(target_date, datetime.min.time())
-    end_date = datetime.combine(target_date, datetime.max.time())
-
-    transactions = get_user_transactions(db, current_user.id, start_date, end_date)
-
-    # Calculate totals
-    total_credit = sum(t.amount for t in transactions if t.transaction_type == 'credit')
-    total_debit = sum(t.amount for t in transactions if t.transaction_type in ['debit', 'installment'])
-    net_amount = total_credit - total_debit
-
-    # Calculate category stats
-    category_totals = defaultdict(lambda: {'credit': 0.0, 'debit': 0.0})
-    for t in transactions:
-        if t.transaction_type in ['transfer_out', 'transfer_in']:
-            continue
-        cat = t.category or '未分類'
-        if t.transaction_type == 'credit':
-            category_totals[cat]['credit'] += t.amount
-        elif t.transaction_type in ['debit', 'installment']:
-            category_totals[cat]['debit'] += t.amount
-
-    total_amount = total_debit
-    category_stats = []
-    for cat, amounts in category_totals.items():
-        amount = amounts['debit']
-        percentage = (amount / total_amount * 100) if total_amount > 0 else 0
-        category_stats.append(CategoryStats(
-            category=cat,
-            amount=amount,
-            percentage=percentage,
-            credit=amounts['credit'],
-            debit=amounts['debit']
-        ))
-
-    category_stats.sort(key=lambda x: x.amount, reverse=True)
-
-    # Get top 5 transactions
-    top_five_income = sorted(
-        [t for t in transactions if t.transaction_type == 'credit'],
-        key=lambda x: x.amount,
-        reverse=True
-    )[:5]
-
-    top_five_expense = sorted(
-        [t for t in transactions if t.transaction_type in ['debit', 'installment']],
-        key=lambda x: x.amount,
-        reverse=True
-    )[:5]
-
-    return OverviewReport(
-        total_credit=total_credit,
-        total_debit=total_debit,
-        net_amount=net_amount,
-        category_stats=category_stats,
-        top_five_income=top_five_income,
-        top_five_expense=top_five_expense
-    )
+    return ReportEngine(db, current_user.id, *get_day_range(date_str)).overview()
 
 @router.get("/details/monthly", response_model=DetailsReport)
+@cached_report
 def get_monthly_details(
     year: int,
     month: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get monthly details report"""
-    start_date = datetime(year, month, 1)
-    if month == 12:
-        end_date = datetime(year + 1, 1, 1)
-    else:
-        end_date = datetime(year, month + 1, 1)
-
-    transactions = get_user_transactions(db, current_user.id, start_date, end_date)
-
-    # Group by date
-    daily_groups = defaultdict(list)
-    for t in transactions:
-        date_str = t.transaction_date.strftime('%Y-%m-%d')
-        daily_groups[date_str].append(t)
-
-    # Create daily transactions
-    daily_transactions = []
-    for date_str in sorted(daily_groups.keys(), reverse=True):
-        day_trans = daily_groups[date_str]
-        total_credit = sum(t.amount for t in day_trans if t.transaction_type == 'credit')
-        total_debit = sum(t.amount for t in day_trans if t.transaction_type == 'debit')
-
-        daily_transactions.append(DailyTransactions(
-            date=date_str,
-            total_credit=total_credit,
-            total_debit=total_debit,
-            transactions=sorted(day_trans, key=lambda x: x.transaction_date, reverse=True)
-        ))
-
-    total_credit = sum(t.amount for t in transactions if t.transaction_type == 'credit')
-    total_debit = sum(t.amount for t in transactions if t.transaction_type in ['debit', 'installment'])
-
-    return DetailsReport(
-        daily_transactions=daily_transactions,
-        total_credit=total_credit,
-        total_debit=total_debit
-    )
+    return ReportEngine(db, current_user.id, *get_month_range(year, month)).details()
 
 @router.get("/details/daily", response_model=DetailsReport)
+@cached_report
 def get_daily_details(
     date_str: str,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get daily details report"""
-    try:
-        target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
-
-    start_date = datetime.combine(target_date, datetime.min.time())
-    end_date = datetime.combine(target_date, datetime.max.time())
-
-    transactions = get_user_transactions(db, current_user.id, start_date, end_date)
-
-    total_credit = sum(t.amount for t in transactions if t.transaction_type == 'credit')
-    total_debit = sum(t.amount for t in transactions if t.transaction_type in ['debit', 'installment'])
-
-    daily_transactions = [DailyTransactions(
-        date=date_str,
-        total_credit=total_credit,
-        total_debit=total_debit,
-        transactions=sorted(transactions, key=lambda x: x.transaction_date, reverse=True)
-    )]
-
-    return DetailsReport(
-        daily_transactions=daily_transactions,
-        total_credit=total_credit,
-        total_debit=total_debit
-    )
+    return ReportEngine(db, current_user.id, *get_day_range(date_str)).details(day_label=date_str)
 
 @router.get("/category/monthly", response_model=CategoryReport)
+@cached_report
 def get_monthly_category_report(
     year: int,
     month: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get monthly category report"""
-    start_date = datetime(year, month, 1)
-    if month == 12:
-        end_date = datetime(year + 1, 1, 1)
-    else:
-        end_date = datetime(year, month + 1, 1)
-
-    transactions = get_user_transactions(db, current_user.id, start_date, end_date)
-
-    # Calculate category stats
-    category_totals = defaultdict(lambda: {'credit': 0.0, 'debit': 0.0})
-    for t in transactions:
-        if t.transaction_type in ['transfer_out', 'transfer_in']:
-            continue
-        cat = t.category or '未分類'
-        if t.transaction_type == 'credit':
-            category_totals[cat]['credit'] += t.amount
-        elif t.transaction_type in ['debit', 'installment']:
-            category_totals[cat]['debit'] += t.amount
-
-    total_debit = sum(amounts['debit'] for amounts in category_totals.values())
-    total_credit = sum(amounts['credit'] for amounts in category_totals.values())
-
-    category_stats = []
-    for cat, amounts in category_totals.items():
-        # Use debit amount for main sorting and percentage (backward compatible)
-        amount = amounts['debit']
-        percentage = (amount / total_debit * 100) if total_debit > 0 else 0
-        category_stats.append(CategoryStats(
-            category=cat,
-            amount=amount,
-            percentage=percentage,
-            credit=amounts['credit'],
-            debit=amounts['debit']
-        ))
-
-    # Sort by total amount (debit + credit) to show most active categories first
-    category_stats.sort(key=lambda x: x.debit + x.credit, reverse=True)
-
-    return CategoryReport(
-        category_stats=category_stats,
-        total_amount=total_debit,  # Backward compatible
-        total_credit=total_credit,
-        total_debit=total_debit
-    )
+    return ReportEngine(db, current_user.id, *get_month_range(year, month)).category()
 
 @router.get("/category/daily", response_model=CategoryReport)
+@cached_report
 def get_daily_category_report(
     date_str: str,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get daily category report"""
-    try:
-        target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
-
-    start_date = datetime.combine(target_date, datetime.min.time())
-    end_date = datetime.combine(target_date, datetime.max.time())
-
-    transactions = get_user_transactions(db, current_user.id, start_date, end_date)
-
-    # Calculate category stats
-    category_totals = defaultdict(lambda: {'credit': 0.0, 'debit': 0.0})
-    for t in transactions:
-        if t.transaction_type in ['transfer_out', 'transfer_in']:
-            continue
-        cat = t.category or '未分類'
-        if t.transaction_type == 'credit':
-            category_totals[cat]['credit'] += t.amount
-        elif t.transaction_type in ['debit', 'installment']:
-            category_totals[cat]['debit'] += t.amount
-
-    total_debit = sum(amounts['debit'] for amounts in category_totals.values())
-    total_credit = sum(amounts['credit'] for amounts in category_totals.values())
-
-    category_stats = []
-    for cat, amounts in category_totals.items():
-        # Use debit amount for main sorting and percentage (backward compatible)
-        amount = amounts['debit']
-        percentage = (amount / total_debit * 100) if total_debit > 0 else 0
-        category_stats.append(CategoryStats(
-            category=cat,
-            amount=amount,
-            percentage=percentage,
-            credit=amounts['credit'],
-            debit=amounts['debit']
-        ))
-
-    # Sort by total amount (debit + credit) to show most active categories first
-    category_stats.sort(key=lambda x: x.debit + x.credit, reverse=True)
-
-    return CategoryReport(
-        category_stats=category_stats,
-        total_amount=total_debit,  # Backward compatible
-        total_credit=total_credit,
-        total_debit=total_debit
-    )
+    return ReportEngine(db, current_user.id, *get_day_range(date_str)).category()
 
 @router.get("/ranking/monthly", response_model=RankingReport)
+@cached_report
 def get_monthly_ranking(
     year: int,
     month: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get monthly ranking report"""
-    start_date = datetime(year, month, 1)
-    if month == 12:
-        end_date = datetime(year + 1, 1, 1)
-    else:
-        end_date = datetime(year, month + 1, 1)
-
-    transactions = get_user_transactions(db, current_user.id, start_date, end_date)
-
-    expense_ranking = sorted(
-        [t for t in transactions if t.transaction_type in ['debit', 'installment']],
-        key=lambda x: x.amount,
-        reverse=True
-    )
-
-    income_ranking = sorted(
-        [t for t in transactions if t.transaction_type == 'credit'],
-        key=lambda x: x.amount,
-        reverse=True
-    )
-
-    return RankingReport(
-        expense_ranking=expense_ranking,
-        income_ranking=income_ranking
-    )
+    return ReportEngine(db, current_user.id, *get_month_range(year, month)).ranking()
 
 @router.get("/ranking/daily", response_model=RankingReport)
+@cached_report
 def get_daily_ranking(
     date_str: str,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get daily ranking report"""
-    try:
-        target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
-
-    start_date = datetime.combine(target_date, datetime.min.time())
-    end_date = datetime.combine(target_date, datetime.max.time())
-
-    transactions = get_user_transactions(db, current_user.id, start_date, end_date)
-
-    expense_ranking = sorted(
-        [t for t in transactions if t.transaction_type in ['debit', 'installment']],
-        key=lambda x: x.amount,
-        reverse=True
-    )
-
-    income_ranking = sorted(
-        [t for t in transactions if t.transaction_type == 'credit'],
-        key=lambda x: x.amount,
-        reverse=True
-    )
-
-    return RankingReport(
-        expense_ranking=expense_ranking,
-        income_ranking=income_ranking
-    )
+    return ReportEngine(db, current_user.id, *get_day_range(date_str)).ranking()
 
 @router.get("/account/monthly", response_model=AccountReport)
+@cached_report
 def get_monthly_account_report(
     year: int,
     month: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get monthly account report"""
-    start_date = datetime(year, month, 1)
-    if month == 12:
-        end_date = datetime(year + 1, 1, 1)
-    else:
-        end_date = datetime(year, month + 1, 1)
-
-    transactions = get_user_transactions(db, current_user.id, start_date, end_date)
-
-    # Get all user accounts
-    accounts = db.query(Account).filter(Account.user_id == current_user.id).all()
-    account_map = {acc.id: acc.name for acc in accounts}
-
-    # Calculate account stats
-    account_totals = defaultdict(lambda: {'credit': 0.0, 'debit': 0.0})
-    for t in transactions:
-        if t.transaction_type in ['transfer_out', 'transfer_in']:
-            continue
-        if t.transaction_type == 'credit':
-            account_totals[t.account_id]['credit'] += t.amount
-        elif t.transaction_type in ['debit', 'installment']:
-            account_totals[t.account_id]['debit'] += t.amount
-
-    total_amount = sum(amounts['debit'] for amounts in account_totals.values())
-
-    account_stats = []
-    for acc_id, amounts in account_totals.items():
-        amount = amounts['debit']
-        percentage = (amount / total_amount * 100) if total_amount > 0 else 0
-        balance = amounts['credit'] - amounts['debit']
-
-        account_stats.append(AccountStats(
-            account_id=acc_id,
-            account_name=account_map.get(acc_id, '未知帳戶'),
-            amount=amount,
-            percentage=percentage,
-            credit=amounts['credit'],
-            debit=amounts['debit'],
-            balance=balance
-        ))
-
-    account_stats.sort(key=lambda x: x.amount, reverse=True)
-
-    return AccountReport(
-        account_stats=account_stats,
-        total_amount=total_amount
-    )
+    return ReportEngine(db, current_user.id, *get_month_range(year, month)).account()
 
 @router.get("/account/daily", response_model=AccountReport)
+@cached_report
 def get_daily_account_report(
     date_str: str,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get daily account report"""
-    try:
-        target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
-
-    start_date = datetime.combine(target_date, datetime.min.time())
-    end_date = datetime.combine(target_date, datetime.max.time())
-
-    transactions = get_user_transactions(db, current_user.id, start_date, end_date)
-
-    # Get all user accounts
-    accounts = db.query(Account).filter(Account.user_id == current_user.id).all()
-    account_map = {acc.id: acc.name for acc in accounts}
-
-    # Calculate account stats
-    account_totals = defaultdict(lambda: {'credit': 0.0, 'debit': 0.0})
-    for t in transactions:
-        if t.transaction_type in ['transfer_out', 'transfer_in']:
-            continue
-        if t.transaction_type == 'credit':
-            account_totals[t.account_id]['credit'] += t.amount
-        elif t.transaction_type in ['debit', 'installment']:
-            account_totals[t.account_id]['debit'] += t.amount
-
-    total_amount = sum(amounts['debit'] for amounts in account_totals.values())
-
-    account_stats = []
-    for acc_id, amounts in account_totals.items():
-        amount = amounts['debit']
-        percentage = (amount / total_amount * 100) if total_amount > 0 else 0
-        balance = amounts['credit'] - amounts['debit']
-
-        account_stats.append(AccountStats(
-            account_id=acc_id,
-            account_name=account_map.get(acc_id, '未知帳戶'),
-            amount=amount,
-            percentage=percentage,
-            credit=amounts['credit'],
-            debit=amounts['debit'],
-            balance=balance
-        ))
-
-    account_stats.sort(key=lambda x: x.amount, reverse=True)
-
-    return AccountReport(
-        account_stats=account_stats,
-        total_amount=total_amount
-    )
+    return ReportEngine(db, current_user.id, *get_day_range(date_str)).account()
 
 # Get category transactions
 @router.get("/category/{category}/transactions/monthly")
+@cached_report
 def get_category_transactions_monthly(
     category: str,
     year: int,
     month: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get transactions for a specific category in a month"""
-    start_date = datetime(year, month, 1)
-    if month == 12:
-        end_date = datetime(year + 1, 1, 1)
-    else:
-        end_date = datetime(year, month + 1, 1)
-
-    transactions = get_user_transactions(db, current_user.id, start_date, end_date)
-
-    # Filter by category
     cat_name = None if category == '未分類' else category
-    filtered = [t for t in transactions if t.category == cat_name]
-
-    return filtered
+    return ReportEngine(db, current_user.id, *get_month_range(year, month)).category_transactions(cat_name)
 
 @router.get("/category/{category}/transactions/daily")
+@cached_report
 def get_category_transactions_daily(
     category: str,
     date_str: str,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get transactions for a specific category on a specific day"""
-    try:
-        target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
-
-    start_date = datetime.combine(target_date, datetime.min.time())
-    end_date = datetime.combine(target_date, datetime.max.time())
-
-    transactions = get_user_transactions(db, current_user.id, start_date, end_date)
-
-    # Filter by category
     cat_name = None if category == '未分類' else category
-    filtered = [t for t in transactions if t.category == cat_name]
-
-    return filtered
+    return ReportEngine(db, current_user.id, *get_day_range(date_str)).category_transactions(cat_name)
 
 # Get account transactions
 @router.get("/account/{account_id}/transactions/monthly")
+@cached_report
 def get_account_transactions_monthly(
     account_id: int,
     year: int,
     month: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get transactions for a specific account in a month"""
-    start_date = datetime(year, month, 1)
-    if month == 12:
-        end_date = datetime(year + 1, 1, 1)
-    else:
-        end_date = datetime(year, month + 1, 1)
-
-    transactions = get_user_transactions(db, current_user.id, start_date, end_date)
-
-    # Filter by account
-    filtered = [t for t in transactions if t.account_id == account_id]
-
-    return filtered
+    return ReportEngine(db, current_user.id, *get_month_range(year, month)).account_transactions(account_id)
 
 @router.get("/account/{account_id}/transactions/daily")
+@cached_report
 def get_account_transactions_daily(
     account_id: int,
     date_str: str,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get transactions for a specific account on a specific day"""
-    try:
-        target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
-
-    start_date = datetime.combine(target_date, datetime.min.time())
-    end_date = datetime.combine(target_date, datetime.max.time())
+    return ReportEngine(db, current_user.id, *get_day_range(date_str)).account_transactions(account_id)
+
+# Combined report endpoint
+
+@router.get("/combined", response_model=CombinedReport, response_model_exclude_none=True)
+@cached_report
+def get_combined_report(
+    sections: str = Query(",".join(REPORT_SECTIONS), description="以逗號分隔的報表區塊"),
+    year: Optional[int] = None,
+    month: Optional[int] = None,
+    date_str: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db)
+):
+    """
+    一次取得多個報表區塊
 
-    transactions = get_user_transactions(db, current_user.id, start_date, end_date)
+    期間以 year+month (月)、date_str (日) 或 start_date+end_date (自訂) 其中一組指定，
+    各區塊內容與對應的單一報表端點相同，區間內的交易只載入一次。
+    """
+    requested = [s.strip() for s in sections.split(",") if s.strip()]
+    unknown = [s for s in requested if s not in REPORT_SECTIONS]
+    if not requested or unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid sections. Choose from: {', '.join(REPORT_SECTIONS)}"
+        )
 
-    # Filter by account
-    filtered = [t for t in transactions if t.account_id == account_id]
+    day_label = None
+    if year is not None and month is not None:
+        start, end = get_month_range(year, month)
+    elif date_str is not None:
+        start, end = get_day_range(date_str)
+        day_label = date_str
+    elif start_date is not None and end_date is not None:
+        start, end = get_custom_range(start_date, end_date)
+    else:
+        raise HTTPException(
+            status_code=400,
+            detail="Specify year and month, date_str, or start_date and end_date"
+        )
 
-    return filtered
+    # 只回傳要求的區塊
+    return ReportEngine(db, current_user.id, start, end).build(requested, day_label=day_label)
 
 # Custom date range report endpoints
 
 @router.get("/custom/overview", response_model=OverviewReport)
+@cached_report
 def get_custom_overview(
     start_date: str,
     end_date: str,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get custom date range overview report"""
-    try:
-        start = datetime.fromisoformat(start_date)
-        end = datetime.fromisoformat(end_date)
-        # Set end to end of day
-        end = datetime.combine(end.date(), datetime.max.time())
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
-    
-    transactions = get_user_transactions(db, current_user.id, start, end)
-    
-    # Calculate totals
-    total_credit = sum(t.amount for t in transactions if t.transaction_type == 'credit')
-    total_debit = sum(t.amount for t in transactions if t.transaction_type in ['debit', 'installment'])
-    net_amount = total_credit - total_debit
-    
-    # Calculate category stats
-    category_totals = defaultdict(lambda: {'credit': 0.0, 'debit': 0.0})
-    for t in transactions:
-        if t.transaction_type in ['transfer_out', 'transfer_in']:
-            continue
-        cat = t.category or '未分類'
-        if t.transaction_type == 'credit':
-            category_totals[cat]['credit'] += t.amount
-        elif t.transaction_type in ['debit', 'installment']:
-            category_totals[cat]['debit'] += t.amount
-
-    total_amount = total_debit  # Use debit for percentage calculation
-    category_stats = []
-    for cat, amounts in category_totals.items():
-        amount = amounts['debit']
-        percentage = (amount / total_amount * 100) if total_amount > 0 else 0
-        category_stats.append(CategoryStats(
-            category=cat,
-            amount=amount,
-            percentage=percentage,
-            credit=amounts['credit'],
-            debit=amounts['debit']
-        ))
-
-    category_stats.sort(key=lambda x: x.amount, reverse=True)
-
-    # Get top 5 transactions
-    top_five_income = sorted(
-        [t for t in transactions if t.transaction_type == 'credit'],
-        key=lambda x: x.amount,
-        reverse=True
-    )[:5]
-
-    top_five_expense = sorted(
-        [t for t in transactions if t.transaction_type in ['debit', 'installment']],
-        key=lambda x: x.amount,
-        reverse=True
-    )[:5]
-    
-    return OverviewReport(
-        total_credit=total_credit,
-        total_debit=total_debit,
-        net_amount=net_amount,
-        category_stats=category_stats,
-        top_five_income=top_five_income,
-        top_five_expense=top_five_expense
-    )
+    return ReportEngine(db, current_user.id, *get_custom_range(start_date, end_date)).overview()
 
 
 @router.get("/custom/details", response_model=DetailsReport)
+@cached_report
 def get_custom_details(
     start_date: str,
     end_date: str,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get custom date range details report"""
-    try:
-        start = datetime.fromisoformat(start_date)
-        end = datetime.fromisoformat(end_date)
-        end = datetime.combine(end.date(), datetime.max.time())
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
-    
-    transactions = get_user_transactions(db, current_user.id, start, end)
-    
-    # Group by date
-    daily_groups = defaultdict(list)
-    for t in transactions:
-        date_str = t.transaction_date.strftime('%Y-%m-%d')
-        daily_groups[date_str].append(t)
-
-    # Create daily transactions
-    daily_transactions = []
-    for date_str in sorted(daily_groups.keys(), reverse=True):
-        day_trans = daily_groups[date_str]
-        total_credit = sum(t.amount for t in day_trans if t.transaction_type == 'credit')
-        total_debit = sum(t.amount for t in day_trans if t.transaction_type == 'debit')
-
-        daily_transactions.append(DailyTransactions(
-            date=date_str,
-            total_credit=total_credit,
-            total_debit=total_debit,
-            transactions=sorted(day_trans, key=lambda x: x.transaction_date, reverse=True)
-        ))
-
-    total_credit = sum(t.amount for t in transactions if t.transaction_type == 'credit')
-    total_debit = sum(t.amount for t in transactions if t.transaction_type in ['debit', 'installment'])
-
-    return DetailsReport(
-        daily_transactions=daily_transactions,
-        total_credit=total_credit,
-        total_debit=total_debit
-    )
+    return ReportEngine(db, current_user.id, *get_custom_range(start_date, end_date)).details()
 
 
 @router.get("/custom/category", response_model=CategoryReport)
+@cached_report
 def get_custom_category_report(
     start_date: str,
     end_date: str,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get custom date range category report"""
-    try:
-        start = datetime.fromisoformat(start_date)
-        end = datetime.fromisoformat(end_date)
-        end = datetime.combine(end.date(), datetime.max.time())
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
-    
-    transactions = get_user_transactions(db, current_user.id, start, end)
-    
-    # Calculate category stats
-    category_totals = defaultdict(lambda: {'credit': 0.0, 'debit': 0.0})
-    for t in transactions:
-        if t.transaction_type in ['transfer_out', 'transfer_in']:
-            continue
-        cat = t.category or '未分類'
-        if t.transaction_type == 'credit':
-            category_totals[cat]['credit'] += t.amount
-        elif t.transaction_type in ['debit', 'installment']:
-            category_totals[cat]['debit'] += t.amount
-
-    total_debit = sum(amounts['debit'] for amounts in category_totals.values())
-    total_credit = sum(amounts['credit'] for amounts in category_totals.values())
-
-    category_stats = []
-    for cat, amounts in category_totals.items():
-        # Use debit amount for main sorting and percentage
-        amount = amounts['debit']
-        percentage = (amount / total_debit * 100) if total_debit > 0 else 0
-        category_stats.append(CategoryStats(
-            category=cat,
-            amount=amount,
-            percentage=percentage,
-            credit=amounts['credit'],
-            debit=amounts['debit']
-        ))
-
-    # Sort by total amount (debit + credit)
-    category_stats.sort(key=lambda x: x.debit + x.credit, reverse=True)
-
-    return CategoryReport(
-        category_stats=category_stats,
-        total_amount=total_debit,
-        total_credit=total_credit,
-        total_debit=total_debit
-    )
+    return ReportEngine(db, current_user.id, *get_custom_range(start_date, end_date)).category()
 
 
 @router.get("/custom/ranking", response_model=RankingReport)
+@cached_report
 def get_custom_ranking(
     start_date: str,
     end_date: str,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get custom date range ranking report"""
-    try:
-        start = datetime.fromisoformat(start_date)
-        end = datetime.fromisoformat(end_date)
-        end = datetime.combine(end.date(), datetime.max.time())
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
-    
-    transactions = get_user_transactions(db, current_user.id, start, end)
-    
-    expense_ranking = sorted(
-        [t for t in transactions if t.transaction_type in ['debit', 'installment']],
-        key=lambda x: x.amount,
-        reverse=True
-    )
-
-    income_ranking = sorted(
-        [t for t in transactions if t.transaction_type == 'credit'],
-        key=lambda x: x.amount,
-        reverse=True
-    )
-
-    return RankingReport(
-        expense_ranking=expense_ranking,
-        income_ranking=income_ranking
-    )
+    return ReportEngine(db, current_user.id, *get_custom_range(start_date, end_date)).ranking()
 
 
 @router.get("/custom/account", response_model=AccountReport)
+@cached_report
 def get_custom_account_report(
     start_date: str,
     end_date: str,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get custom date range account report"""
-    try:
-        start = datetime.fromisoformat(start_date)
-        end = datetime.fromisoformat(end_date)
-        end = datetime.combine(end.date(), datetime.max.time())
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
-    
-    transactions = get_user_transactions(db, current_user.id, start, end)
-    
-    # Get all user accounts
-    accounts = db.query(Account).filter(Account.user_id == current_user.id).all()
-    account_map = {acc.id: acc.name for acc in accounts}
-
-    # Calculate account stats
-    account_totals = defaultdict(lambda: {'credit': 0.0, 'debit': 0.0})
-    for t in transactions:
-        if t.transaction_type in ['transfer_out', 'transfer_in']:
-            continue
-        if t.transaction_type == 'credit':
-            account_totals[t.account_id]['credit'] += t.amount
-        elif t.transaction_type in ['debit', 'installment']:
-            account_totals[t.account_id]['debit'] += t.amount
-
-    total_amount = sum(amounts['debit'] for amounts in account_totals.values())
-
-    account_stats = []
-    for acc_id, amounts in account_totals.items():
-        amount = amounts['debit']
-        percentage = (amount / total_amount * 100) if total_amount > 0 else 0
-        balance = amounts['credit'] - amounts['debit']
-
-        account_stats.append(AccountStats(
-            account_id=acc_id,
-            account_name=account_map.get(acc_id, '未知帳戶'),
-            amount=amount,
-            percentage=percentage,
-            credit=amounts['credit'],
-            debit=amounts['debit'],
-            balance=balance
-        ))
-
-    account_stats.sort(key=lambda x: x.amount, reverse=True)
-
-    return AccountReport(
-        account_stats=account_stats,
-        total_amount=total_amount
-    )
+    return ReportEngine(db, current_user.id, *get_custom_range(start_date, end_date)).account()
 
 
 @router.get("/custom/budget", response_model=BudgetReport)
+@cached_report
 def get_custom_budget_report(
     start_date: str,
     end_date: str,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get custom date range budget report"""
@@ -1215,69 +491,8 @@ def get_custom_budget_report(
     
     total_budget_amount = sum(b.amount for b in budgets)
     
-    processed_budgets = []
-    for b in budgets:
-        # Fetch categories
-        cats = db.query(BudgetCategory.category_name).filter(BudgetCategory.budget_id == b.id).all()
-        categories = {c[0] for c in cats}
-        if b.category:
-            categories.add(b.category)
-            
-        # Fetch accounts
-        linked_accounts = {acc.id for acc in b.accounts} if b.accounts else set()
-        
-        processed_budgets.append({
-            "budget": b,
-            "categories": categories,
-            "accounts": linked_accounts,
-            "has_categories": bool(categories),
-            "start": b.start_date,
-            "end": b.end_date
-        })
+    budget_transactions, total_spent = get_budget_report_transactions(db, current_user.id, budgets, start, end)
 
-    transactions = get_user_transactions(db, current_user.id, start, end)
-    
-    budget_transactions = []
-    total_spent = 0.0
-    
-    for t in transactions:
-        if t.transaction_type not in ['debit', 'installment']:
-            continue
-        if t.exclude_from_budget:
-            continue
-            
-        # Check if transaction matches ANY budget
-        is_included = False
-        
-        for pb in processed_budgets:
-            # 1. Date Check
-            if t.transaction_date.date() < pb["start"].date() or t.transaction_date.date() > pb["end"].date():
-                continue
-
-            # 2. Account Check
-            if pb["accounts"] and t.account_id not in pb["accounts"]:
-                continue
-                
-            # 3. Category Check
-            if pb["has_categories"]:
-                if t.category not in pb["categories"]:
-                    continue
-            
-            is_included = True
-            break
-         
-        if is_included:
-            total_spent += t.amount
-            budget_transactions.append(BudgetTransaction(
-                id=t.id,
-                description=t.description,
-                amount=t.amount,
-                transaction_type=t.transaction_type,
-                category=t.category,
-                transaction_date=t.transaction_date,
-                account_name=t.account_name
-            ))
-            
     remaining = total_budget_amount - total_spent
     
     # Calculate daily average
@@ -1286,7 +501,8 @@ def get_custom_budget_report(
     
     # Projected spending (simple linear projection)
     # For custom range, we can project based on current progress through the range
-    now = datetime.now(timezone.utc)
+    # start/end 為本地時間 (naive)，需與本地的現在時間比較
+    now = datetime.now()
     if start <= now <= end:
         days_passed = (now - start).days + 1
         projected_spending = (total_spent / days_passed) * days_diff if days_passed > 0 else 0
@@ -1315,54 +531,37 @@ def get_custom_budget_report(
 
 
 @router.get("/custom/category/{category}/transactions")
+@cached_report
 def get_custom_category_transactions(
     category: str,
     start_date: str,
     end_date: str,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get transactions for a specific category in custom date range"""
-    try:
-        start = datetime.fromisoformat(start_date)
-        end = datetime.fromisoformat(end_date)
-        end = datetime.combine(end.date(), datetime.max.time())
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
-    
-    transactions = get_user_transactions(db, current_user.id, start, end)
-    filtered = [t for t in transactions if t.category == category]
-    
-    return filtered
+    return ReportEngine(db, current_user.id, *get_custom_range(start_date, end_date)).category_transactions(category)
 
 
 @router.get("/custom/account/{account_id}/transactions")
+@cached_report
 def get_custom_account_transactions(
     account_id: int,
     start_date: str,
     end_date: str,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get transactions for a specific account in custom date range"""
-    try:
-        start = datetime.fromisoformat(start_date)
-        end = datetime.fromisoformat(end_date)
-        end = datetime.combine(end.date(), datetime.max.time())
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
-    
-    transactions = get_user_transactions(db, current_user.id, start, end)
-    filtered = [t for t in transactions if t.account_id == account_id]
-
-    return filtered
+    return ReportEngine(db, current_user.id, *get_custom_range(start_date, end_date)).account_transactions(account_id)
 
 
 @router.get("/ai-financial-summary", response_model=AIFinancialSummary)
+@cached_report
 def get_ai_financial_summary(
     start_date: str,
     end_date: str,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """
@@ -1445,50 +644,11 @@ def get_ai_financial_summary(
     total_budget_spent = 0.0
     budgets_summary = []
 
-    for budget in budgets:
-        # 計算此預算的實際支出
-        budget_categories = set()
-        has_global_budget = False
-
-        cats = db.query(BudgetCategory.category_name).filter(
-            BudgetCategory.budget_id == budget.id
-        ).all()
-        cat_names = [c[0] for c in cats]
-
-        if cat_names:
-            budget_categories.update(cat_names)
-        elif budget.category:
-            budget_categories.add(budget.category)
-        else:
-            has_global_budget = True
-
-        spent = 0.0
-        for t in transactions:
-            if t.transaction_type not in ['debit', 'installment']:
-                continue
-            if t.exclude_from_budget:
-                continue
-
-            # 只計算預算時間段內的交易
-            if t.transaction_date.date() < budget.start_date.date() or t.transaction_date.date() > budget.end_date.date():
-                continue
-
-            # 檢查是否為綁定帳戶的交易
-            # 若預算有綁定帳戶，且此交易不屬於這些帳戶，則排除
-            if budget.accounts:
-                linked_account_ids = {acc.id for acc in budget.accounts}
-                if t.account_id not in linked_account_ids:
-                    continue
-
-            is_included = False
-            if has_global_budget:
-                is_included = True
-            elif t.category in budget_categories:
-                is_included = True
-
-            if is_included:
-                spent += t.amount
+    # 各預算支出以一次分組查詢計算
+    budget_spent = get_budget_spent_totals(db, current_user.id, [b.id for b in budgets], start, end)
 
+    for budget in budgets:
+        spent = budget_spent.get(budget.id, 0.0)
         total_budget_spent += spent
         percentage = round(spent / budget.amount * 100, 2) if budget.amount > 0 else 0.0
 
@@ -1,156 +1,239 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
-from typing import List
-from datetime import datetime, date
+from sqlalchemy import extract, tuple_, insert, select, update, bindparam
+from typing import List, Optional
+from datetime import datetime, date, timedelta
 from calendar import monthrange
 from dateutil.relativedelta import relativedelta
 import uuid
-from app.core.database import get_db
-from app.models.user import User
+from collections import defaultdict
+from app.core.database import get_async_db, get_db, AsyncSessionLocal
 from app.models.account import Account
 from app.models.transaction import Transaction
-from app.schemas.transaction import Transaction as TransactionSchema, TransactionCreate, TransactionUpdate, MonthlyStats, DailyStats, TransferCreate
-from app.api.deps import get_current_user
+from app.schemas.transaction import Transaction as TransactionSchema, TransactionCreate, TransactionUpdate, MonthlyStats, DailyStats, TransferCreate, TransactionBatchCreate
+from app.api.deps import get_current_principal, get_current_principal_async
+from app.core.principal import Principal
 from app.core.timezone import from_iso_string, to_utc, to_taipei_time, TAIPEI_TZ
+from app.core.encryption import encrypt_many, decrypt_field, blind_index
+from app.services.transaction_sync import snapshot, sync_transaction_changes
+from app.services.transaction_rollup import get_daily_type_totals
+from app.utils.pagination import encode_cursor, decode_datetime_cursor
 
 router = APIRouter()
 
-@router.get("/", response_model=List[TransactionSchema])
-def get_transactions(
-    account_id: int = None,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+# 單頁最大筆數
+MAX_PAGE_SIZE = 500
+# 串流模式每批從資料庫取回的筆數
+STREAM_BATCH_SIZE = 500
+
+
+def _parse_local_date(value: str, field: str) -> date:
+    """解析 YYYY-MM-DD 格式的台北日期"""
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {field} format. Use YYYY-MM-DD")
+
+
+def _build_transaction_query(
+    user_id: int,
+    account_id: Optional[int] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    category: Optional[str] = None,
+    transaction_type: Optional[str] = None,
+    cursor: Optional[str] = None,
 ):
-    query = db.query(Transaction).join(Account).filter(Account.user_id == current_user.id)
+    """
+    建立交易列表的 select (依 transaction_date, id 由新到舊排序)
+
+    日期區間以台北時間的整日計算，end_date 包含當日。
+    """
+    query = select(Transaction).join(Account).where(Account.user_id == user_id)
     if account_id:
-        query = query.filter(Transaction.account_id == account_id)
-    transactions = query.all()
-    return transactions
+        query = query.where(Transaction.account_id == account_id)
+    if start_date:
+        start = _parse_local_date(start_date, "start_date")
+        query = query.where(Transaction.transaction_date >= to_utc(datetime.combine(start, datetime.min.time())))
+    if end_date:
+        end = _parse_local_date(end_date, "end_date") + timedelta(days=1)
+        query = query.where(Transaction.transaction_date < to_utc(datetime.combine(end, datetime.min.time())))
+    if category:
+        query = query.where(Transaction.category == category)
+    if transaction_type:
+        query = query.where(Transaction.transaction_type == transaction_type)
+    if cursor:
+        try:
+            cursor_date, cursor_id = decode_datetime_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.where(
+            tuple_(Transaction.transaction_date, Transaction.id) < tuple_(cursor_date, cursor_id)
+        )
+    return query.order_by(Transaction.transaction_date.desc(), Transaction.id.desc())
 
-@router.post("/", response_model=TransactionSchema)
-def create_transaction(
-    transaction: TransactionCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    account = db.query(Account).filter(
-        Account.id == transaction.account_id,
-        Account.user_id == current_user.id
-    ).first()
-    if not account:
-        raise HTTPException(status_code=404, detail="Account not found")
 
-    # Handle installment transactions
-    if transaction.is_installment and transaction.total_installments and transaction.billing_day:
-        return create_installment_transactions(transaction, account, db)
+def _to_schemas(transactions) -> List[TransactionSchema]:
+    """
+    將交易轉換為回應模型
 
-    # Regular transaction
-    # 將前端傳來的台北時間轉換為 UTC 儲存
-    transaction_data = transaction.dict(exclude={'is_installment', 'total_installments', 'billing_day'})
-    if isinstance(transaction_data['transaction_date'], str):
-        transaction_data['transaction_date'] = from_iso_string(transaction_data['transaction_date'])
-    elif transaction_data['transaction_date']:
-        # 如果是 datetime 物件，確保為台北時間
-        transaction_data['transaction_date'] = to_utc(transaction_data['transaction_date'])
+    轉換時會解密 description / note，async 端點以 run_in_threadpool 呼叫，避免解密佔住 event loop
+    """
+    return [TransactionSchema.model_validate(transaction) for transaction in transactions]
 
-    db_transaction = Transaction(**transaction_data)
-    db.add(db_transaction)
 
-    # Update account balance
-    if transaction.transaction_type == "credit":
-        account.balance += transaction.amount
-    elif transaction.transaction_type in ["debit", "installment"]:
-        account.balance -= transaction.amount
+def _to_ndjson(transactions) -> str:
+    return "".join(schema.model_dump_json() + "\n" for schema in _to_schemas(transactions))
 
-    db.commit()
-    db.refresh(db_transaction)
-    return db_transaction
 
+async def _stream_transactions(query):
+    """
+    以 NDJSON 逐批輸出交易
 
-@router.post("/transfer", response_model=List[TransactionSchema])
-def create_transfer(
-    transfer: TransferCreate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    使用獨立的 AsyncSession 與伺服器端游標 (yield_per)，回應期間不會把整個結果集載入記憶體；
+    每批的解密與序列化在執行緒池中進行。
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.stream_scalars(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+        async for transactions in result.partitions():
+            yield await run_in_threadpool(_to_ndjson, transactions)
+
+
+@router.get("/", response_model=List[TransactionSchema])
+async def get_transactions(
+    response: Response,
+    account_id: Optional[int] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    category: Optional[str] = None,
+    transaction_type: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    current_user: Principal = Depends(get_current_principal_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Create a transfer between two accounts.
-    Creates two transactions: one 'transfer_out' and one 'transfer_in'.
+    取得交易列表
+
+    - 篩選：account_id、start_date / end_date (YYYY-MM-DD，台北時間)、category、transaction_type
+    - 分頁：傳入 limit 時只回傳一頁，若還有下一頁會在 X-Next-Cursor header 提供游標，
+      下次請求帶入 cursor 即可接續
+    - 串流：stream=true 時以 NDJSON (application/x-ndjson) 逐筆輸出
     """
-    # Verify source account
-    from_account = db.query(Account).filter(
-        Account.id == transfer.from_account_id,
-        Account.user_id == current_user.id
-    ).first()
-    if not from_account:
-        raise HTTPException(status_code=404, detail="Source account not found")
+    # 參數錯誤在建立查詢時就回傳 400，串流回應開始前不會失敗
+    query = _build_transaction_query(
+        user_id=current_user.id,
+        account_id=account_id,
+        start_date=start_date,
+        end_date=end_date,
+        category=category,
+        transaction_type=transaction_type,
+        cursor=cursor,
+    )
 
-    # Verify destination account
-    to_account = db.query(Account).filter(
-        Account.id == transfer.to_account_id,
-        Account.user_id == current_user.id
-    ).first()
-    if not to_account:
-        raise HTTPException(status_code=404, detail="Destination account not found")
+    if stream:
+        return StreamingResponse(
+            _stream_transactions(query.limit(limit) if limit else query),
+            media_type="application/x-ndjson"
+        )
 
-    # Check for sufficient funds - REMOVED per user request
-    # if from_account.balance < transfer.amount:
-    #     raise HTTPException(status_code=400, detail="Insufficient funds in source account")
+    if not limit:
+        return await run_in_threadpool(_to_schemas, (await db.scalars(query)).all())
+
+    # 多取一筆用來判斷是否還有下一頁
+    transactions = (await db.scalars(query.limit(limit + 1))).all()
+    if len(transactions) > limit:
+        transactions = transactions[:limit]
+        last = transactions[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor([last.transaction_date, last.id])
+    return await run_in_threadpool(_to_schemas, transactions)
+
+# 批次建立時單次請求允許的最大筆數 (交易 + 轉帳)
+MAX_BATCH_SIZE = 1000
+
+# 各交易類型對帳戶餘額的影響方向
+BALANCE_SIGN = {
+    "credit": 1,
+    "transfer_in": 1,
+    "debit": -1,
+    "installment": -1,
+    "transfer_out": -1,
+}
+
+
+def _parse_transaction_date(value) -> datetime:
+    """將前端傳來的台北時間轉換為 UTC 儲存"""
+    if isinstance(value, str):
+        return from_iso_string(value)
+    elif value:
+        # 如果是 datetime 物件，確保為台北時間
+        return to_utc(value)
+    return value
+
+
+def _is_installment_request(transaction: TransactionCreate) -> bool:
+    return bool(transaction.is_installment and transaction.total_installments and transaction.billing_day)
+
+
+def _build_regular_rows(transaction: TransactionCreate):
+    """
+    建立一般交易的欄位資料
+
+    Returns:
+        (rows, balance_delta)
+    """
+    transaction_data = transaction.dict(exclude={'is_installment', 'total_installments', 'billing_day'})
+    transaction_data['transaction_date'] = _parse_transaction_date(transaction_data['transaction_date'])
+    balance_delta = BALANCE_SIGN.get(transaction.transaction_type, 0) * transaction.amount
+    return [transaction_data], balance_delta
+
+
+def _build_transfer_rows(transfer: TransferCreate):
+    """
+    建立轉帳的兩筆交易欄位資料 (transfer_out / transfer_in)
 
-    # Handle timezone for transaction date
-    transaction_date = transfer.transaction_date
-    if isinstance(transaction_date, str):
-        transaction_date = from_iso_string(transaction_date)
-    elif transaction_date:
-        transaction_date = to_utc(transaction_date)
+    Returns:
+        (rows, {account_id: balance_delta})
+    """
+    transaction_date = _parse_transaction_date(transfer.transaction_date)
 
     # Generate transfer pair ID to link both transactions
     transfer_pair_id = str(uuid.uuid4())
 
-    # Create 'transfer_out' transaction
-    out_transaction = Transaction(
-        description=transfer.description,
-        amount=transfer.amount,
-        transaction_type="transfer_out",
-        category="轉帳",
-        note=transfer.note,
-        transaction_date=transaction_date,
-        account_id=from_account.id,
-        exclude_from_budget=True,  # Transfers shouldn't affect budget
-        transfer_pair_id=transfer_pair_id
-    )
-    db.add(out_transaction)
-    from_account.balance -= transfer.amount
-
-    # Create 'transfer_in' transaction
-    in_transaction = Transaction(
-        description=transfer.description,
-        amount=transfer.amount,
-        transaction_type="transfer_in",
-        category="轉帳",
-        note=transfer.note,
-        transaction_date=transaction_date,
-        account_id=to_account.id,
-        exclude_from_budget=True,  # Transfers shouldn't affect budget
-        transfer_pair_id=transfer_pair_id
-    )
-    db.add(in_transaction)
-    to_account.balance += transfer.amount
+    rows = []
+    for transaction_type, account_id in (
+        ("transfer_out", transfer.from_account_id),
+        ("transfer_in", transfer.to_account_id),
+    ):
+        rows.append(dict(
+            description=transfer.description,
+            amount=transfer.amount,
+            transaction_type=transaction_type,
+            category="轉帳",
+            note=transfer.note,
+            transaction_date=transaction_date,
+            account_id=account_id,
+            exclude_from_budget=True,  # Transfers shouldn't affect budget
+            transfer_pair_id=transfer_pair_id
+        ))
 
-    db.commit()
-    db.refresh(out_transaction)
-    db.refresh(in_transaction)
+    deltas = defaultdict(float)
+    deltas[transfer.from_account_id] -= transfer.amount
+    deltas[transfer.to_account_id] += transfer.amount
+    return rows, deltas
 
-    return [out_transaction, in_transaction]
 
+def _build_installment_rows(transaction: TransactionCreate):
+    """
+    建立分期交易的每期欄位資料
 
-def create_installment_transactions(
-    transaction: TransactionCreate,
-    account: Account,
-    db: Session
-) -> TransactionSchema:
-    """Create multiple installment transactions"""
+    Returns:
+        (rows, balance_delta) - balance_delta 為含利息的總扣款金額 (負值)
+    """
     total_amount = transaction.amount
     num_installments = transaction.total_installments
     billing_day = transaction.billing_day
@@ -209,8 +292,7 @@ def create_installment_transactions(
         last_day = monthrange(first_billing_date.year, first_billing_date.month)[1]
         first_billing_date = first_billing_date.replace(day=last_day)
 
-    created_transactions = []
-    first_transaction = None
+    rows = []
 
     for i in range(num_installments):
         # Calculate this installment's amount
@@ -227,12 +309,10 @@ def create_installment_transactions(
         # Calculate remaining amount AFTER this installment
         if annual_rate >= 1:
             # For interest-bearing, calculate based on total with interest
-            total_with_interest = int((total_amount * (annual_rate / 12 / 100) * ((1 + annual_rate / 12 / 100) ** num_installments) / (((1 + annual_rate / 12 / 100) ** num_installments) - 1)) * num_installments)
             paid_so_far = base_amount * (i + 1) if i < num_installments - 1 else total_with_interest
             remaining_after = total_with_interest - paid_so_far
         else:
             # For zero-interest
-            remainder = int(total_amount - (base_amount * num_installments))
             paid_so_far = base_amount * (i + 1) + (remainder if i == 0 else 0)
             remaining_after = total_amount - paid_so_far
 
@@ -253,8 +333,7 @@ def create_installment_transactions(
             second=base_date.second
         )
 
-        # Create installment transaction
-        db_transaction = Transaction(
+        rows.append(dict(
             description=transaction.description,
             amount=installment_amount,
             transaction_type="installment",
@@ -272,27 +351,194 @@ def create_installment_transactions(
             remaining_amount=remaining_after,
             annual_interest_rate=annual_rate if annual_rate >= 1 else None,
             exclude_from_budget=transaction.exclude_from_budget
+        ))
+
+    # Deduct total installment amount including interest
+    if annual_rate >= 1:
+        balance_delta = -total_with_interest
+    else:
+        balance_delta = -total_amount
+
+    return rows, balance_delta
+
+
+@router.post("/", response_model=TransactionSchema)
+def create_transaction(
+    transaction: TransactionCreate,
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db)
+):
+    account = db.query(Account).filter(
+        Account.id == transaction.account_id,
+        Account.user_id == current_user.id
+    ).first()
+    if not account:
+        raise HTTPException(status_code=404, detail="Account not found")
+
+    # Handle installment transactions
+    if _is_installment_request(transaction):
+        return create_installment_transactions(transaction, account, db)
+
+    # Regular transaction
+    rows, balance_delta = _build_regular_rows(transaction)
+
+    db_transaction = Transaction(**rows[0])
+    db.add(db_transaction)
+
+    # Update account balance
+    account.balance += balance_delta
+    sync_transaction_changes(db, current_user.id, added=[db_transaction])
+
+    db.commit()
+    db.refresh(db_transaction)
+    return db_transaction
+
+
+@router.post("/transfer", response_model=List[TransactionSchema])
+def create_transfer(
+    transfer: TransferCreate,
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db)
+):
+    """
+    Create a transfer between two accounts.
+    Creates two transactions: one 'transfer_out' and one 'transfer_in'.
+    """
+    # Verify source account
+    from_account = db.query(Account).filter(
+        Account.id == transfer.from_account_id,
+        Account.user_id == current_user.id
+    ).first()
+    if not from_account:
+        raise HTTPException(status_code=404, detail="Source account not found")
+
+    # Verify destination account
+    to_account = db.query(Account).filter(
+        Account.id == transfer.to_account_id,
+        Account.user_id == current_user.id
+    ).first()
+    if not to_account:
+        raise HTTPException(status_code=404, detail="Destination account not found")
+
+    # Check for sufficient funds - REMOVED per user request
+    # if from_account.balance < transfer.amount:
+    #     raise HTTPException(status_code=400, detail="Insufficient funds in source account")
+
+    rows, _ = _build_transfer_rows(transfer)
+
+    # Create 'transfer_out' / 'transfer_in' transactions
+    out_transaction = Transaction(**rows[0])
+    in_transaction = Transaction(**rows[1])
+    db.add(out_transaction)
+    db.add(in_transaction)
+    from_account.balance -= transfer.amount
+    to_account.balance += transfer.amount
+    sync_transaction_changes(db, current_user.id, added=[out_transaction, in_transaction])
+
+    db.commit()
+    db.refresh(out_transaction)
+    db.refresh(in_transaction)
+
+    return [out_transaction, in_transaction]
+
+
+@router.post("/batch", response_model=List[TransactionSchema])
+def create_transactions_batch(
+    batch: TransactionBatchCreate,
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db)
+):
+    """
+    批次建立交易 (一般交易、分期與轉帳)
+
+    所有帳戶以單一查詢驗證歸屬，交易以一次 executemany 寫入，
+    每個帳戶只做一次彙總後的餘額更新，全部在同一個資料庫交易內完成。
+    回傳所有新建立的交易 (分期會回傳每一期)。
+    """
+    if len(batch.transactions) + len(batch.transfers) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batch too large (max {MAX_BATCH_SIZE} items)")
+
+    account_ids = {t.account_id for t in batch.transactions}
+    for transfer in batch.transfers:
+        account_ids.add(transfer.from_account_id)
+        account_ids.add(transfer.to_account_id)
+    if not account_ids:
+        return []
+
+    owned_ids = {
+        row.id for row in db.query(Account.id).filter(
+            Account.id.in_(account_ids),
+            Account.user_id == current_user.id
+        )
+    }
+    if owned_ids != account_ids:
+        raise HTTPException(status_code=404, detail="Account not found")
+
+    rows = []
+    balance_deltas = defaultdict(float)
+    for transaction in batch.transactions:
+        if _is_installment_request(transaction):
+            new_rows, delta = _build_installment_rows(transaction)
+        else:
+            new_rows, delta = _build_regular_rows(transaction)
+        rows.extend(new_rows)
+        balance_deltas[transaction.account_id] += delta
+    for transfer in batch.transfers:
+        new_rows, deltas = _build_transfer_rows(transfer)
+        rows.extend(new_rows)
+        for account_id, delta in deltas.items():
+            balance_deltas[account_id] += delta
+
+    # 批次寫入時 hybrid setter 不會被呼叫，需先自行加密
+    descriptions = encrypt_many(row['description'] for row in rows)
+    notes = encrypt_many(row.get('note') for row in rows)
+    for row, description, note in zip(rows, descriptions, notes):
+        row['description_hash'] = blind_index(row.pop('description'))
+        row.pop('note', None)
+        row['_description'] = description
+        row['_note'] = note
+
+    created = db.scalars(insert(Transaction).returning(Transaction), rows).all()
+    sync_transaction_changes(db, current_user.id, added=created)
+
+    # 每個帳戶一次原子性的餘額更新
+    balance_params = [
+        {'b_account_id': account_id, 'b_delta': delta}
+        for account_id, delta in balance_deltas.items() if delta
+    ]
+    if balance_params:
+        accounts_table = Account.__table__
+        db.execute(
+            update(accounts_table)
+            .where(accounts_table.c.id == bindparam('b_account_id'))
+            .values(balance=accounts_table.c.balance + bindparam('b_delta')),
+            balance_params
         )
 
-        db.add(db_transaction)
-        created_transactions.append(db_transaction)
+    db.commit()
+    return created
+
+
+def create_installment_transactions(
+    transaction: TransactionCreate,
+    account: Account,
+    db: Session
+) -> TransactionSchema:
+    """Create multiple installment transactions"""
+    rows, balance_delta = _build_installment_rows(transaction)
 
-        if i == 0:
-            first_transaction = db_transaction
+    created_transactions = [Transaction(**row) for row in rows]
+    db.add_all(created_transactions)
 
     # Update account balance (deduct total installment amount including interest)
-    if annual_rate >= 1:
-        monthly_rate = annual_rate / 12 / 100
-        monthly_payment = total_amount * monthly_rate * ((1 + monthly_rate) ** num_installments) / (((1 + monthly_rate) ** num_installments) - 1)
-        total_with_interest = int(monthly_payment * num_installments)
-        account.balance -= total_with_interest
-    else:
-        account.balance -= total_amount
+    account.balance += balance_delta
+    sync_transaction_changes(db, account.user_id, added=created_transactions)
 
     db.commit()
 
     # Refresh and return first transaction
-    if first_transaction:
+    if created_transactions:
+        first_transaction = created_transactions[0]
         db.refresh(first_transaction)
         return first_transaction
 
@@ -301,7 +547,7 @@ def create_installment_transactions(
 @router.get("/{transaction_id}", response_model=TransactionSchema)
 def get_transaction(
     transaction_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     transaction = db.query(Transaction).join(Account).filter(
@@ -316,7 +562,7 @@ def get_transaction(
 def update_transaction(
     transaction_id: int,
     transaction_update: TransactionUpdate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     transaction = db.query(Transaction).join(Account).filter(
@@ -329,6 +575,8 @@ def update_transaction(
     old_amount = transaction.amount
     old_type = transaction.transaction_type
     old_account_id = transaction.account_id
+    removed = [snapshot(transaction)]
+    added = [transaction]
 
     update_data = transaction_update.dict(exclude_unset=True)
 
@@ -400,6 +648,8 @@ def update_transaction(
             pair_old_amount = pair_transaction.amount
             pair_old_type = pair_transaction.transaction_type
             pair_account = pair_transaction.account
+            removed.append(snapshot(pair_transaction))
+            added.append(pair_transaction)
             
             # Revert old balance on pair account
             if pair_old_type == "credit" or pair_old_type == "transfer_in":
@@ -420,6 +670,7 @@ def update_transaction(
             elif pair_transaction.transaction_type in ["debit", "installment", "transfer_out"]:
                 pair_account.balance -= pair_transaction.amount
 
+    sync_transaction_changes(db, current_user.id, removed=removed, added=added)
     db.commit()
     db.refresh(transaction)
     return transaction
@@ -427,7 +678,7 @@ def update_transaction(
 @router.delete("/{transaction_id}")
 def delete_transaction(
     transaction_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     transaction = db.query(Transaction).join(Account).filter(
@@ -444,6 +695,8 @@ def delete_transaction(
     elif transaction.transaction_type in ["debit", "installment", "transfer_out"]:
         account.balance += transaction.amount
 
+    removed = [snapshot(transaction)]
+
     # 連動刪除配對交易（轉帳）
     deleted_pair = False
     if transaction.transfer_pair_id:
@@ -463,9 +716,11 @@ def delete_transaction(
                 pair_account.balance += pair_transaction.amount
             
             db.delete(pair_transaction)
+            removed.append(snapshot(pair_transaction))
             deleted_pair = True
 
     db.delete(transaction)
+    sync_transaction_changes(db, current_user.id, removed=removed)
     db.commit()
     
     if deleted_pair:
@@ -476,7 +731,7 @@ def delete_transaction(
 @router.delete("/installments/group/{group_id}")
 def delete_installment_group(
     group_id: str,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Delete all transactions in an installment group"""
@@ -497,59 +752,34 @@ def delete_installment_group(
     # Delete all transactions
     for transaction in transactions:
         db.delete(transaction)
+    sync_transaction_changes(db, current_user.id, removed=[snapshot(t) for t in transactions])
 
     db.commit()
     return {"message": f"Deleted {len(transactions)} installment transactions successfully"}
 
 @router.get("/stats/monthly", response_model=MonthlyStats)
-def get_monthly_stats(
+async def get_monthly_stats(
     year: int,
     month: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get daily income and expense statistics for a specific month"""
     # Get the number of days in the month
     _, num_days = monthrange(year, month)
 
-    # Get all user's account IDs
-    user_account_ids = db.query(Account.id).filter(Account.user_id == current_user.id).all()
-    account_ids = [acc_id for (acc_id,) in user_account_ids]
-
-    if not account_ids:
-        # No accounts, return empty stats
-        return MonthlyStats(daily_stats=[
-            DailyStats(date=f"{year}-{month:02d}-{day:02d}", credit=0.0, debit=0.0)
-            for day in range(1, num_days + 1)
-        ])
-
-    # Query transactions for the month
-    start_date = datetime(year, month, 1)
-    if month == 12:
-        end_date = datetime(year + 1, 1, 1)
-    else:
-        end_date = datetime(year, month + 1, 1)
-
-    transactions = db.query(
-        func.date(Transaction.transaction_date).label('date'),
-        Transaction.transaction_type,
-        func.sum(Transaction.amount).label('total')
-    ).filter(
-        Transaction.account_id.in_(account_ids),
-        Transaction.transaction_date >= start_date,
-        Transaction.transaction_date < end_date
-    ).group_by(
-        func.date(Transaction.transaction_date),
-        Transaction.transaction_type
-    ).all()
+    # 由每日彙總表讀取當月每日各類型總額
+    daily_totals = await db.run_sync(
+        get_daily_type_totals, current_user.id, date(year, month, 1), date(year, month, num_days)
+    )
 
     # Build a dictionary for quick lookup
     stats_dict = {}
-    for trans in transactions:
-        date_str = trans.date.strftime('%Y-%m-%d')
-        if date_str not in stats_dict:
-            stats_dict[date_str] = {'credit': 0.0, 'debit': 0.0}
-        stats_dict[date_str][trans.transaction_type] = float(trans.total)
+    for local_date, type_totals in daily_totals.items():
+        stats_dict[local_date.strftime('%Y-%m-%d')] = {
+            'credit': type_totals.get('credit', 0.0),
+            'debit': type_totals.get('debit', 0.0),
+        }
 
     # Build the daily stats list with all days in the month
     daily_stats = []
@@ -565,10 +795,10 @@ def get_monthly_stats(
     return MonthlyStats(daily_stats=daily_stats)
 
 @router.get("/stats/daily/{date_str}", response_model=List[TransactionSchema])
-def get_daily_transactions(
+async def get_daily_transactions(
     date_str: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all transactions for a specific date"""
     try:
@@ -577,8 +807,7 @@ def get_daily_transactions(
         raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
 
     # Get all user's account IDs
-    user_account_ids = db.query(Account.id).filter(Account.user_id == current_user.id).all()
-    account_ids = [acc_id for (acc_id,) in user_account_ids]
+    account_ids = (await db.scalars(select(Account.id).where(Account.user_id == current_user.id))).all()
 
     if not account_ids:
         return []
@@ -587,23 +816,24 @@ def get_daily_transactions(
     start_datetime = datetime.combine(target_date, datetime.min.time())
     end_datetime = datetime.combine(target_date, datetime.max.time())
 
-    transactions = db.query(Transaction).filter(
+    transactions = await db.scalars(select(Transaction).where(
         Transaction.account_id.in_(account_ids),
         Transaction.transaction_date >= start_datetime,
         Transaction.transaction_date <= end_datetime
-    ).order_by(Transaction.transaction_date.desc()).all()
+    ).order_by(Transaction.transaction_date.desc()))
 
-    return transactions
+    return await run_in_threadpool(_to_schemas, transactions.all())
 @router.get("/descriptions/list", response_model=List[str])
 def get_transaction_descriptions(
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get all distinct transaction descriptions for the current user"""
-    descriptions = db.query(Transaction.description).join(Account).filter(
+    # 密文每次加密都不同，以盲索引去除重複，每個敘述只解密一次
+    # 空敘述沒有盲索引，會被 IS NOT NULL 條件排除
+    rows = db.query(Transaction._description).join(Account).filter(
         Account.user_id == current_user.id,
-        Transaction.description != None,
-        Transaction.description != ""
-    ).distinct().all()
-    
-    return [desc[0] for desc in descriptions]
+        Transaction.description_hash != None
+    ).distinct(Transaction.description_hash).order_by(Transaction.description_hash).all()
+
+    return [decrypt_field(encrypted) for (encrypted,) in rows]
@@ -0,0 +1,209 @@
+"""
+快取後端
+
+提供統一的 CacheBackend 介面：
+- MemoryCacheBackend: 行程內 LRU 快取，以筆數與總位元組數限制記憶體用量 (預設)
+- SharedStoreCacheBackend: 包裝共用儲存 (例如 Redis) 的 client，多個 worker 共用快取
+- InProcessSharedStore: 共用儲存 client 的本地替身，介面與 redis-py 的 get/set/delete 相同，
+  供開發與單機部署使用
+"""
+from collections import OrderedDict
+from typing import Optional
+import threading
+import time
+
+
+class CacheBackend:
+    """快取後端介面，值一律為 bytes"""
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl: Optional[int] = None) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        """快取統計，後端不支援時回傳空 dict"""
+        return {}
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    行程內 LRU 快取
+
+    超過 max_entries 筆或 max_bytes 位元組 (鍵與值合計) 時，從最久未使用的項目開始淘汰。
+    stats() 提供命中、未命中與淘汰次數。
+    """
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 32 * 1024 * 1024, default_ttl: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: bytes, ttl: Optional[int] = None) -> None:
+        if len(key) + len(value) > self.max_bytes:
+            return
+        ttl = ttl if ttl is not None else self.default_ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, expires_at)
+            self._bytes += len(key) + len(value)
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                oldest_key = next(iter(self._data))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _remove(self, key: str) -> None:
+        value, _ = self._data.pop(key)
+        self._bytes -= len(key) + len(value)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class InProcessSharedStore:
+    """
+    共用儲存 client 的本地替身
+
+    提供與 redis-py 相同的 get / set(ex=) / delete / incr / expire / flushdb 介面，
+    部署多個 worker 時可改為傳入真正的共用儲存 client。過期的鍵在讀取時或定期清除。
+    """
+
+    # 每寫入這麼多次清除一次過期的鍵
+    SWEEP_INTERVAL = 1024
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _sweep(self) -> None:
+        """呼叫端需持有鎖"""
+        self._writes += 1
+        if self._writes % self.SWEEP_INTERVAL:
+            return
+        now = time.monotonic()
+        for key in [k for k, (_, expires_at) in self._data.items() if expires_at is not None and expires_at <= now]:
+            del self._data[key]
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key: str, value: bytes, ex: Optional[int] = None) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ex if ex else None)
+            self._sweep()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        """整數值加上 amount，鍵不存在或已過期時從 0 開始 (保留原本的過期時間)"""
+        with self._lock:
+            value, expires_at = self._data.get(key, (b"0", None))
+            if expires_at is not None and expires_at <= time.monotonic():
+                value, expires_at = b"0", None
+            new_value = int(value) + amount
+            self._data[key] = (str(new_value).encode(), expires_at)
+            self._sweep()
+            return new_value
+
+    def expire(self, key: str, seconds: int) -> bool:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return False
+            self._data[key] = (item[0], time.monotonic() + seconds)
+            return True
+
+    def flushdb(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class SharedStoreCacheBackend(CacheBackend):
+    """以共用儲存 client (get / set(ex=) / delete) 實作的快取後端"""
+
+    def __init__(self, client, prefix: str = "cache:", default_ttl: Optional[int] = None):
+        self.client = client
+        self.prefix = prefix
+        self.default_ttl = default_ttl
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: Optional[int] = None) -> None:
+        ttl = ttl if ttl is not None else self.default_ttl
+        self.client.set(self.prefix + key, value, ex=ttl)
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.prefix + key)
+
+    def clear(self) -> None:
+        self.client.flushdb()
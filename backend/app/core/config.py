@@ -1,9 +1,19 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List
 
 class Settings(BaseSettings):
     # Database
     DATABASE_URL: str
+    # 連線池：同步端點在 anyio 執行緒池 (預設 40 個執行緒) 中執行，
+    # DB_POOL_SIZE + DB_MAX_OVERFLOW 與其相同，尖峰時不會因連線不足而排隊
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 30
+    DB_POOL_TIMEOUT: int = 30  # 取得連線的最長等待秒數，逾時回傳錯誤
+    DB_POOL_RECYCLE: int = 1800  # 連線使用超過此秒數後重新建立，-1 表示不回收
+    DB_POOL_PRE_PING: bool = True  # 取得連線前先檢查連線是否有效 (資料庫重啟或閒置斷線)
+    # async engine 的連線池 (async 端點不佔用執行緒，併發數由連線池限制)
+    DB_ASYNC_POOL_SIZE: int = 20
+    DB_ASYNC_MAX_OVERFLOW: int = 20
 
     # Security
     SECRET_KEY: str
@@ -20,15 +30,55 @@ class Settings(BaseSettings):
     # Data Encryption Key (用於加密匯出的資料)
     DATA_ENCRYPTION_KEY: str = "CHANGE_THIS_DATA_ENCRYPTION_KEY_MIN_32_CHARS"
 
+    # 欄位加密金鑰環: "key_id:secret,key_id:secret"
+    # key id "1" 固定為 DATA_ENCRYPTION_KEY (舊資料與盲索引使用)，輪替時新增金鑰並切換 ACTIVE_KEY_ID
+    DATA_ENCRYPTION_KEYS: str = ""
+    DATA_ENCRYPTION_ACTIVE_KEY_ID: str = "1"
+
+    # 重新加密任務
+    REENCRYPTION_CHUNK_SIZE: int = 500
+    REENCRYPTION_ROWS_PER_SECOND: int = 1000  # 0 表示不限速
+
+    # 資料匯入任務
+    IMPORT_MAX_WORKERS: int = 2  # 同時執行的匯入任務數，其餘排隊等候
+    IMPORT_CHUNK_SIZE: int = 5000
+
+    # 密碼雜湊 (bcrypt) 專用執行緒池：同時雜湊數與排隊上限，超過時回傳 503
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_QUEUE_SIZE: int = 16
+
     # CORS
     ALLOWED_ORIGINS: str = "http://localhost:5173,http://localhost:3000"
 
     # Environment
     ENVIRONMENT: str = "production"
 
-    # Rate Limiting
+    # Rate Limiting (每個 IP 每分鐘的請求數，各類路由分別計算)
     RATE_LIMIT_ENABLED: bool = True
-    RATE_LIMIT_PER_MINUTE: int = 60
+    RATE_LIMIT_PER_MINUTE: int = 60  # 其他請求 (寫入等)
+    RATE_LIMIT_AUTH_PER_MINUTE: int = 10  # 登入、註冊、密碼重設
+    RATE_LIMIT_READ_PER_MINUTE: int = 120  # GET 請求
+    RATE_LIMIT_BACKEND: str = "memory"  # 'memory' (行程內) 或 'shared' (Redis，多個 worker 共用計數)
+    RATE_LIMIT_SHARED_URL: str = ""  # shared 後端的 Redis URL，例如 redis://redis:6379/0
+    RATE_LIMIT_MAX_KEYS: int = 100000  # memory 後端最多追蹤的 IP/規則組合數
+
+    # Report Cache
+    REPORT_CACHE_ENABLED: bool = True
+    REPORT_CACHE_BACKEND: str = "memory"  # 'memory' (行程內 LRU) 或 'shared' (共用儲存)
+    REPORT_CACHE_MAX_ENTRIES: int = 1000
+    REPORT_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    REPORT_CACHE_TTL_SECONDS: int = 600
+
+    # Field Decrypt Cache (以密文為鍵的行程內 LRU，保存解密後的明文)
+    FIELD_DECRYPT_CACHE_ENABLED: bool = True
+    FIELD_DECRYPT_CACHE_MAX_ENTRIES: int = 100000
+    FIELD_DECRYPT_CACHE_MAX_BYTES: int = 16 * 1024 * 1024
+    FIELD_DECRYPT_CACHE_TTL_SECONDS: int = 600
+
+    # Principal Cache (以 token subject 為鍵的行程內快取，保存使用者 ID、管理員與封鎖狀態)
+    PRINCIPAL_CACHE_ENABLED: bool = True
+    PRINCIPAL_CACHE_MAX_ENTRIES: int = 10000
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 30  # 多個 worker 時，其他 worker 最多延遲這麼久才看到封鎖/權限變更
 
     # Security Headers
     ENABLE_SECURITY_HEADERS: bool = True
@@ -64,6 +114,39 @@ class Settings(BaseSettings):
             return []
         return [email.strip() for email in self.STARTUP_NOTIFICATION_EMAILS.split(',') if email.strip()]
 
+    @property
+    def data_encryption_key_ring(self) -> Dict[str, str]:
+        """Parse DATA_ENCRYPTION_KEYS into {key_id: secret}, key id "1" is DATA_ENCRYPTION_KEY"""
+        key_ring = {}
+        for entry in self.DATA_ENCRYPTION_KEYS.split(','):
+            key_id, _, secret = entry.strip().partition(':')
+            if key_id and secret:
+                key_ring[key_id.strip()] = secret.strip()
+        key_ring["1"] = self.DATA_ENCRYPTION_KEY
+        return key_ring
+
+    def validate_encryption_keys(self):
+        """Validate the field encryption key ring, so a bad key id fails at startup instead of on every read"""
+        if not self.DATA_ENCRYPTION_KEY:
+            raise ValueError("DATA_ENCRYPTION_KEY must not be empty")
+        key_ids = set()
+        for entry in self.DATA_ENCRYPTION_KEYS.split(','):
+            if not entry.strip():
+                continue
+            key_id, _, secret = entry.strip().partition(':')
+            key_id, secret = key_id.strip(), secret.strip()
+            if not key_id or not secret:
+                raise ValueError(f"DATA_ENCRYPTION_KEYS entry must be 'key_id:secret', got {key_id or entry.strip()!r}")
+            if key_id == "1":
+                raise ValueError("DATA_ENCRYPTION_KEYS must not redefine key id '1' (it is DATA_ENCRYPTION_KEY)")
+            if key_id in key_ids:
+                raise ValueError(f"DATA_ENCRYPTION_KEYS defines key id {key_id!r} more than once")
+            key_ids.add(key_id)
+        if self.DATA_ENCRYPTION_ACTIVE_KEY_ID not in self.data_encryption_key_ring:
+            raise ValueError(
+                f"DATA_ENCRYPTION_ACTIVE_KEY_ID {self.DATA_ENCRYPTION_ACTIVE_KEY_ID!r} is not in DATA_ENCRYPTION_KEYS"
+            )
+
     def validate_security(self):
         """Validate security settings"""
         if len(self.SECRET_KEY) < 32:
@@ -80,6 +163,9 @@ settings = Settings()
 if settings.DATABASE_URL.startswith("postgresql://"):
     settings.DATABASE_URL = settings.DATABASE_URL.replace("postgresql://", "postgresql+psycopg://", 1)
 
+# 金鑰環設定錯誤時所有讀取都會失敗，因此不分環境都在啟動時檢查
+settings.validate_encryption_keys()
+
 # Validate security settings in production
 if settings.ENVIRONMENT == "production":
     settings.validate_security()
@@ -1,11 +1,46 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from .config import settings
+from .db_pool import PoolMetrics
+from .metrics import register_metrics
+
+pool_metrics = PoolMetrics()
+
+engine = create_engine(
+    settings.DATABASE_URL,
+    poolclass=pool_metrics.pool_class(QueuePool),
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+)
+pool_metrics.attach(engine)
+register_metrics("db_pool", lambda: pool_metrics.stats(engine.pool))
 
-engine = create_engine(settings.DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# async 端點使用的 engine (psycopg async)，與同步 engine 各自擁有連線池；
+# 連線數不受執行緒池限制，池大小另外設定
+async_pool_metrics = PoolMetrics()
+
+async_engine = create_async_engine(
+    settings.DATABASE_URL,
+    poolclass=async_pool_metrics.pool_class(AsyncAdaptedQueuePool),
+    pool_size=settings.DB_ASYNC_POOL_SIZE,
+    max_overflow=settings.DB_ASYNC_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+)
+async_pool_metrics.attach(async_engine.sync_engine)
+register_metrics("db_pool_async", lambda: async_pool_metrics.stats(async_engine.pool))
+
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 def get_db():
@@ -14,3 +49,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
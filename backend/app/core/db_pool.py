@@ -0,0 +1,98 @@
+"""
+資料庫連線池指標
+
+PoolMetrics 以連線池事件 (checkout / checkin / connect / invalidate) 記錄使用中的連線數與峰值，
+並以 pool_class() 產生的連線池子類別計時每次取得連線的等待時間 (含建立新連線與 pre-ping)
+以及逾時次數 (逾時不計入等待時間)。指標由 GET /api/admin/metrics 提供：
+
+    pool_metrics = PoolMetrics()
+    engine = create_engine(url, poolclass=pool_metrics.pool_class(QueuePool))
+    pool_metrics.attach(engine)
+    register_metrics("db_pool", lambda: pool_metrics.stats(engine.pool))
+"""
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app.core.metrics import Counter
+
+
+class PoolMetrics:
+    """單一連線池的累計指標"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.checkouts = Counter()
+        self.timeouts = Counter()
+        self.connects = Counter()
+        self.invalidations = Counter()
+        self.wait_seconds = Counter()
+        self.max_wait_seconds = 0.0
+
+    def pool_class(self, base):
+        """回傳計時取得連線的 base 子類別 (engine.dispose() 重建連線池時沿用同一類別)"""
+        metrics = self
+
+        class TimedPool(base):
+            def connect(self):
+                started_at = time.perf_counter()
+                try:
+                    connection = super().connect()
+                except PoolTimeoutError:
+                    metrics.timeouts.inc()
+                    raise
+                metrics._record_wait(time.perf_counter() - started_at)
+                return connection
+
+        TimedPool.__name__ = f"Timed{base.__name__}"
+        return TimedPool
+
+    def _record_wait(self, seconds: float) -> None:
+        self.wait_seconds.inc(seconds)
+        with self._lock:
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def attach(self, engine) -> None:
+        """註冊連線池事件"""
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "invalidate", self._on_invalidate)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.checkouts.inc()
+        with self._lock:
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.in_use -= 1
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        self.connects.inc()
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        self.invalidations.inc()
+
+    def stats(self, pool) -> dict:
+        """pool 為目前的連線池 (engine.pool)"""
+        checkouts = self.checkouts.value
+        return {
+            "pool_size": pool.size(),
+            "max_overflow": getattr(pool, "_max_overflow", 0),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "peak_checked_out": self.peak_in_use,
+            "checkouts": checkouts,
+            "timeouts": self.timeouts.value,
+            "connects": self.connects.value,
+            "invalidations": self.invalidations.value,
+            "avg_wait_ms": round(self.wait_seconds.value / checkouts * 1000, 2) if checkouts else 0.0,
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 2),
+        }
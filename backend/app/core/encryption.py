@@ -1,13 +1,23 @@
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 import base64
-from typing import Optional
+import hashlib
+import hmac
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+from app.core.cache import MemoryCacheBackend
 from app.core.config import settings
+from app.core.metrics import Counter, register_metrics
 
 # ===== 快取機制：避免重複計算金鑰 =====
 _cached_encryption_key: Optional[bytes] = None
 _cached_fernet: Optional[Fernet] = None
+_cached_blind_index_key: Optional[bytes] = None
 
 def _get_encryption_key() -> bytes:
     """
@@ -83,7 +93,293 @@ def decrypt_data(encrypted_data: str) -> str:
         raise ValueError(f"解密失敗: 檔案可能已損壞或不是由此應用程式匯出")
 
 
+_cached_export_cipher: Optional[AESGCM] = None
+
+def _get_export_cipher() -> AESGCM:
+    """
+    取得串流匯出檔使用的 AES-GCM 實例 (由 Fernet 金鑰以 HKDF 派生)
+
+    ⚡ 效能優化：AES-GCM 實例會被快取並重複使用
+    """
+    global _cached_export_cipher
+
+    if _cached_export_cipher is not None:
+        return _cached_export_cipher
+
+    hkdf = HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=b'accounting_app_export_v2'
+    )
+    _cached_export_cipher = AESGCM(hkdf.derive(base64.urlsafe_b64decode(_get_encryption_key())))
+    return _cached_export_cipher
+
+def encrypt_chunk(data: bytes, associated_data: bytes) -> bytes:
+    """
+    加密串流匯出的一個區塊
+    返回 nonce + 密文與驗證標籤，associated_data 用於綁定區塊順序
+    """
+    nonce = os.urandom(_NONCE_SIZE)
+    return nonce + _get_export_cipher().encrypt(nonce, data, associated_data)
+
+def decrypt_chunk(sealed: bytes, associated_data: bytes) -> bytes:
+    """
+    解密串流匯出的一個區塊
+    區塊被竄改、順序錯誤或金鑰不符時拋出 ValueError
+    """
+    try:
+        return _get_export_cipher().decrypt(sealed[:_NONCE_SIZE], sealed[_NONCE_SIZE:], associated_data)
+    except Exception:
+        raise ValueError("解密失敗: 檔案可能已損壞或不是由此應用程式匯出")
+
+
 # ===== 欄位加密功能 (用於資料庫敏感欄位) =====
+#
+# 欄位密文格式：
+# - v2:<key_id>:<base64(nonce + AES-GCM 密文與驗證標籤)>  目前寫入的格式
+# - Fernet token (gAAAAA 開頭)                              舊格式，仍可讀取
+#
+# key_id 對應 settings.data_encryption_key_ring 中的金鑰，新資料以
+# DATA_ENCRYPTION_ACTIVE_KEY_ID 加密；舊金鑰保留在金鑰環中即可繼續解密，
+# 再由重新加密任務 (app.services.reencryption) 逐步改寫為新金鑰。
+#
+# AES-GCM 只需一次加密運算且密文較短，適合大量短字串；
+# 報表、匯出等大量讀寫的路徑請使用 encrypt_many / decrypt_many。
+#
+# 解密結果可快取在行程內的 LRU (FIELD_DECRYPT_CACHE_*)，以密文為鍵：
+# 每次加密的 nonce 都不同，密文即代表唯一的明文，快取不會過期失效；
+# 欄位被改寫時以 evict_decrypted 移除舊密文，釋放記憶體。
+
+FIELD_CIPHER_PREFIX = 'v2:'
+FERNET_TOKEN_PREFIX = 'gAAAAA'  # Fernet token 版本位元組 0x80 的 base64 編碼
+LEGACY_FIELD_KEY_ID = '1'  # 由 DATA_ENCRYPTION_KEY 派生的金鑰
+_NONCE_SIZE = 12
+
+_cached_field_ciphers: Dict[str, AESGCM] = {}
+
+_decrypt_cache: Optional[MemoryCacheBackend] = None
+_decrypt_cache_lock = threading.Lock()
+# 未命中時實際解密的筆數與耗時，用於估算快取省下的解密時間
+_decrypt_miss_count = Counter()
+_decrypt_miss_seconds = Counter()
+
+
+class FieldDecryptionError(ValueError):
+    """密文格式的欄位值無法解密 (金鑰不在金鑰環中、金鑰錯誤或資料損壞)"""
+
+    def __init__(self, index: int, message: str):
+        super().__init__(message)
+        self.index = index  # 在輸入中的位置
+
+
+def _get_decrypt_cache() -> Optional[MemoryCacheBackend]:
+    """取得解密快取，未啟用時回傳 None"""
+    global _decrypt_cache
+
+    if not settings.FIELD_DECRYPT_CACHE_ENABLED:
+        return None
+    if _decrypt_cache is None:
+        with _decrypt_cache_lock:
+            if _decrypt_cache is None:
+                _decrypt_cache = MemoryCacheBackend(
+                    max_entries=settings.FIELD_DECRYPT_CACHE_MAX_ENTRIES,
+                    max_bytes=settings.FIELD_DECRYPT_CACHE_MAX_BYTES,
+                    default_ttl=settings.FIELD_DECRYPT_CACHE_TTL_SECONDS
+                )
+    return _decrypt_cache
+
+
+def evict_decrypted(*encrypted_texts: Optional[str]) -> None:
+    """從解密快取移除即將被改寫或刪除的密文"""
+    cache = _decrypt_cache
+    if cache is None:
+        return
+    for encrypted_text in encrypted_texts:
+        if encrypted_text:
+            cache.delete(encrypted_text)
+
+
+def get_decrypt_cache_metrics() -> dict:
+    """解密快取的命中統計與估算省下的解密時間"""
+    cache = _decrypt_cache
+    metrics = {"enabled": settings.FIELD_DECRYPT_CACHE_ENABLED}
+    if cache is not None:
+        metrics.update(cache.stats())
+    decrypted = _decrypt_miss_count.value
+    avg_seconds = _decrypt_miss_seconds.value / decrypted if decrypted else 0.0
+    metrics.update({
+        "decrypted": decrypted,
+        "decrypt_seconds": round(_decrypt_miss_seconds.value, 6),
+        "avg_decrypt_us": round(avg_seconds * 1e6, 3),
+        "estimated_saved_seconds": round(metrics.get("hits", 0) * avg_seconds, 6),
+    })
+    return metrics
+
+
+register_metrics("field_decrypt_cache", get_decrypt_cache_metrics)
+
+
+def get_active_field_key_id() -> str:
+    """目前用於加密新資料的金鑰 ID"""
+    return settings.DATA_ENCRYPTION_ACTIVE_KEY_ID
+
+
+def _get_field_cipher(key_id: Optional[str] = None) -> AESGCM:
+    """
+    取得指定金鑰 ID 的 AES-GCM 實例，未指定時為目前使用的金鑰
+
+    金鑰以 HKDF 派生：key id "1" 由 Fernet 金鑰派生 (不需要再執行一次 PBKDF2)，
+    其他金鑰由金鑰環中的密鑰派生，並以 key id 作為 salt
+
+    ⚡ 效能優化：AES-GCM 實例會依金鑰 ID 快取並重複使用
+    """
+    if key_id is None:
+        key_id = get_active_field_key_id()
+
+    cipher = _cached_field_ciphers.get(key_id)
+    if cipher is not None:
+        return cipher
+
+    if key_id == LEGACY_FIELD_KEY_ID:
+        key_material = base64.urlsafe_b64decode(_get_encryption_key())
+        salt = None
+    else:
+        secret = settings.data_encryption_key_ring.get(key_id)
+        if secret is None:
+            raise ValueError(f"Unknown field key id: {key_id}")
+        key_material = secret.encode('utf-8')
+        salt = f'accounting_app_field_key:{key_id}'.encode('utf-8')
+
+    hkdf = HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        info=b'accounting_app_field_v2'
+    )
+    cipher = AESGCM(hkdf.derive(key_material))
+    _cached_field_ciphers[key_id] = cipher
+    return cipher
+
+
+def encrypt_many(texts: Iterable[Optional[str]]) -> List[Optional[str]]:
+    """
+    批次加密資料庫欄位文字 (使用目前的金鑰)
+
+    共用同一個 AES-GCM 實例，並一次產生所有 nonce
+
+    Args:
+        texts: 要加密的文字，可包含 None 或空字串
+
+    Returns:
+        與輸入順序相同的加密結果，None 或空字串維持原值
+    """
+    texts = list(texts)
+    key_id = get_active_field_key_id()
+    cipher = _get_field_cipher(key_id)
+    nonces = os.urandom(_NONCE_SIZE * len(texts))
+    prefix = f'{FIELD_CIPHER_PREFIX}{key_id}:'
+
+    result = []
+    for i, text in enumerate(texts):
+        if not text:
+            result.append(text)
+            continue
+        nonce = nonces[i * _NONCE_SIZE:(i + 1) * _NONCE_SIZE]
+        sealed = cipher.encrypt(nonce, text.encode('utf-8'), None)
+        result.append(prefix + base64.urlsafe_b64encode(nonce + sealed).decode('ascii'))
+    return result
+
+
+def _decrypt_value(encrypted_text: str, fernet: Fernet) -> str:
+    """依密文格式與金鑰 ID 解密單一值，失敗時拋出例外"""
+    if encrypted_text.startswith(FIELD_CIPHER_PREFIX):
+        key_id, _, payload = encrypted_text[len(FIELD_CIPHER_PREFIX):].partition(':')
+        raw = memoryview(base64.urlsafe_b64decode(payload))
+        return _get_field_cipher(key_id).decrypt(raw[:_NONCE_SIZE], raw[_NONCE_SIZE:], None).decode('utf-8')
+    return fernet.decrypt(encrypted_text.encode('utf-8')).decode('utf-8')
+
+
+def is_field_ciphertext(text: str) -> bool:
+    """值是否為欄位密文格式 (v2 或 Fernet token)，其他值視為未加密的舊資料"""
+    return text.startswith(FIELD_CIPHER_PREFIX) or text.startswith(FERNET_TOKEN_PREFIX)
+
+
+def decrypt_many(
+    encrypted_texts: Iterable[Optional[str]],
+    use_cache: bool = True,
+    strict: bool = False
+) -> List[Optional[str]]:
+    """
+    批次解密資料庫欄位文字，新舊格式與不同金鑰可混合
+
+    Args:
+        encrypted_texts: 加密的文字，可包含 None 或空字串
+        use_cache: 是否使用解密快取 (全表掃描等一次性讀取請關閉)
+        strict: 密文格式的值解密失敗時拋出 FieldDecryptionError，而不是返回原始文字；
+            不是密文格式的值 (未加密的舊資料) 仍原樣返回
+
+    Returns:
+        與輸入順序相同的解密結果，規則與 decrypt_field 相同
+
+    Raises:
+        FieldDecryptionError: strict 模式下密文無法解密
+    """
+    cache = _get_decrypt_cache() if use_cache else None
+    key_id = get_active_field_key_id()
+    fernet = _get_fernet()
+    # 目前金鑰的密文走快速路徑，迴圈內使用區域變數，避免每筆重複查找屬性
+    prefix = f'{FIELD_CIPHER_PREFIX}{key_id}:'
+    prefix_length = len(prefix)
+    b64decode = base64.urlsafe_b64decode
+    aead_decrypt = _get_field_cipher(key_id).decrypt
+
+    perf_counter = time.perf_counter
+    decrypted = 0
+    decrypt_seconds = 0.0
+
+    result = []
+    append = result.append
+    for encrypted_text in encrypted_texts:
+        if not encrypted_text:
+            append(encrypted_text)
+            continue
+        if cache is not None:
+            cached = cache.get(encrypted_text)
+            if cached is not None:
+                append(cached.decode('utf-8'))
+                continue
+            started = perf_counter()
+        try:
+            if encrypted_text.startswith(prefix):
+                raw = memoryview(b64decode(encrypted_text[prefix_length:]))
+                text = aead_decrypt(raw[:_NONCE_SIZE], raw[_NONCE_SIZE:], None).decode('utf-8')
+            else:
+                text = _decrypt_value(encrypted_text, fernet)
+        except Exception as e:
+            if strict and is_field_ciphertext(encrypted_text):
+                raise FieldDecryptionError(len(result), f"Cannot decrypt field value: {str(e) or type(e).__name__}")
+            # 解密失敗，可能是未加密的舊資料，返回原始文字以保持向後兼容 (不快取)
+            append(encrypted_text)
+            continue
+        if cache is not None:
+            decrypt_seconds += perf_counter() - started
+            decrypted += 1
+            cache.set(encrypted_text, text.encode('utf-8'))
+        append(text)
+
+    if decrypted:
+        _decrypt_miss_count.inc(decrypted)
+        _decrypt_miss_seconds.inc(decrypt_seconds)
+    return result
+
+
+def needs_reencryption(encrypted_text: Optional[str]) -> bool:
+    """欄位值是否需要改寫為目前金鑰的 v2 格式 (舊金鑰、Fernet 或未加密的舊資料)"""
+    if not encrypted_text:
+        return False
+    return not encrypted_text.startswith(f'{FIELD_CIPHER_PREFIX}{get_active_field_key_id()}:')
+
 
 def encrypt_field(text: Optional[str]) -> Optional[str]:
     """
@@ -93,18 +389,15 @@ def encrypt_field(text: Optional[str]) -> Optional[str]:
         text: 要加密的文字，可為 None 或空字串
 
     Returns:
-        加密後的文字，如果輸入為 None 或空字串則返回原值
+        加密後的文字 (v2 格式)，如果輸入為 None 或空字串則返回原值
 
-    ⚡ 效能優化：使用快取的 Fernet 實例
+    ⚡ 效能優化：使用快取的 AES-GCM 實例
     """
     if not text:
         return text
 
     try:
-        f = _get_fernet()  # 使用快取的 Fernet 實例
-        encrypted_bytes = f.encrypt(text.encode('utf-8'))
-        # 直接返回 bytes 解碼後的字串（Fernet 輸出已經是 base64 格式）
-        return encrypted_bytes.decode('utf-8')
+        return encrypt_many([text])[0]
     except Exception as e:
         # 如果加密失敗，記錄錯誤但返回原始文字（確保系統可用性）
         print(f"Field encryption error: {e}")
@@ -113,7 +406,7 @@ def encrypt_field(text: Optional[str]) -> Optional[str]:
 
 def decrypt_field(encrypted_text: Optional[str]) -> Optional[str]:
     """
-    解密資料庫欄位文字
+    解密資料庫欄位文字 (v2 與舊版 Fernet 格式皆可)
 
     Args:
         encrypted_text: 加密的文字，可為 None 或空字串
@@ -122,16 +415,46 @@ def decrypt_field(encrypted_text: Optional[str]) -> Optional[str]:
         解密後的文字，如果輸入為 None 或空字串則返回原值
         如果解密失敗（舊資料未加密），返回原始文字以保持向後相容
 
-    ⚡ 效能優化：使用快取的 Fernet 實例
+    ⚡ 效能優化：使用快取的 AES-GCM / Fernet 實例與解密快取
     """
     if not encrypted_text:
         return encrypted_text
 
-    try:
-        f = _get_fernet()  # 使用快取的 Fernet 實例
-        decrypted_bytes = f.decrypt(encrypted_text.encode('utf-8'))
-        return decrypted_bytes.decode('utf-8')
-    except Exception as e:
-        # 如果解密失敗，可能是未加密的舊資料
-        # 返回原始文字以保持向後兼容
-        return encrypted_text
+    return decrypt_many([encrypted_text])[0]
+
+
+# ===== 盲索引 (用於加密欄位的等值查詢) =====
+
+def _get_blind_index_key() -> bytes:
+    """
+    由加密金鑰派生盲索引專用的 HMAC 金鑰，與加密金鑰分開使用
+
+    ⚡ 效能優化：金鑰會被快取
+    """
+    global _cached_blind_index_key
+
+    if _cached_blind_index_key is not None:
+        return _cached_blind_index_key
+
+    _cached_blind_index_key = hmac.new(
+        _get_encryption_key(), b'accounting_app_blind_index_v1', hashlib.sha256
+    ).digest()
+    return _cached_blind_index_key
+
+
+def blind_index(text: Optional[str]) -> Optional[str]:
+    """
+    計算加密欄位的盲索引 (HMAC-SHA256 十六進位字串)
+
+    Fernet 密文每次加密都不同，無法在 SQL 中比對；相同明文的盲索引相同，
+    可用於等值查詢、去除重複與 DISTINCT，且不需要解密。
+
+    Args:
+        text: 明文，可為 None 或空字串
+
+    Returns:
+        64 字元的十六進位字串，如果輸入為 None 或空字串則返回 None
+    """
+    if not text:
+        return None
+    return hmac.new(_get_blind_index_key(), text.encode('utf-8'), hashlib.sha256).hexdigest()
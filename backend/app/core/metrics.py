@@ -0,0 +1,58 @@
+"""
+行程內指標
+
+各模組以 register_metrics(name, provider) 註冊回傳 dict 的函式，
+collect_metrics() 收集所有指標的快照，由 GET /api/admin/metrics 提供。
+指標只反映目前這個 worker 行程。
+
+累計數值可使用 Counter：
+
+    requests_rejected = Counter()
+    requests_rejected.inc()
+    register_metrics("auth", lambda: {"rejected": requests_rejected.value})
+"""
+import logging
+import threading
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+_providers: Dict[str, Callable[[], dict]] = {}
+_providers_lock = threading.Lock()
+
+
+class Counter:
+    """執行緒安全的累計計數器"""
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1) -> None:
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+
+def register_metrics(name: str, provider: Callable[[], dict]) -> None:
+    """註冊指標來源，同名的來源會被取代"""
+    with _providers_lock:
+        _providers[name] = provider
+
+
+def collect_metrics() -> Dict[str, dict]:
+    """收集所有指標，單一來源失敗不影響其他來源"""
+    with _providers_lock:
+        providers = list(_providers.items())
+
+    result = {}
+    for name, provider in sorted(providers):
+        try:
+            result[name] = provider()
+        except Exception as e:
+            logger.error(f"Failed to collect metrics '{name}': {e}")
+            result[name] = {"error": str(e)}
+    return result
@@ -0,0 +1,97 @@
+"""
+已驗證使用者 (principal) 的查詢與快取
+
+每個需要登入的請求都要由 JWT 的 subject (username) 找到使用者。Principal 只包含授權需要的
+欄位 (ID、管理員、封鎖狀態)，以 username 為鍵保存在行程內的短期快取，
+快取未命中時才查詢 users 資料表 (只讀取這幾個欄位)。
+
+封鎖、解除封鎖、修改使用者、刪除使用者與變更密碼後必須在提交後呼叫 invalidate_principal，
+本行程立即生效；其他 worker 的快取最多在 PRINCIPAL_CACHE_TTL_SECONDS 後過期。
+"""
+import json
+import threading
+from typing import NamedTuple, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.cache import MemoryCacheBackend
+from app.core.config import settings
+from app.core.metrics import register_metrics
+from app.models.user import User
+
+
+class Principal(NamedTuple):
+    """已驗證的使用者，只需要 current_user.id 的端點不必載入完整的 User"""
+    id: int
+    username: str
+    is_admin: bool
+    is_blocked: bool
+
+
+_principal_cache = MemoryCacheBackend(
+    max_entries=settings.PRINCIPAL_CACHE_MAX_ENTRIES,
+    max_bytes=settings.PRINCIPAL_CACHE_MAX_ENTRIES * 256,
+    default_ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS
+)
+register_metrics("principal_cache", _principal_cache.stats)
+
+# 每次失效都遞增；查詢資料庫期間若發生失效，結果可能已過時，不寫入快取
+_invalidations = 0
+_invalidation_lock = threading.Lock()
+
+
+def _principal_query(username: str):
+    return select(User.id, User.username, User.is_admin, User.is_blocked).where(User.username == username)
+
+
+def _get_cached(username: str) -> Optional[Principal]:
+    if not settings.PRINCIPAL_CACHE_ENABLED:
+        return None
+    cached = _principal_cache.get(username)
+    return Principal(*json.loads(cached)) if cached is not None else None
+
+
+def _store(username: str, row, generation: int) -> Optional[Principal]:
+    if row is None:
+        return None
+
+    principal = Principal(row.id, row.username, bool(row.is_admin), bool(row.is_blocked))
+    if settings.PRINCIPAL_CACHE_ENABLED:
+        with _invalidation_lock:
+            if generation == _invalidations:
+                _principal_cache.set(username, json.dumps(principal).encode("utf-8"))
+    return principal
+
+
+def get_principal(db: Session, username: str) -> Optional[Principal]:
+    """依 username 取得 principal，使用者不存在時回傳 None (不快取)"""
+    principal = _get_cached(username)
+    if principal is not None:
+        return principal
+
+    generation = _invalidations
+    row = db.execute(_principal_query(username)).first()
+    return _store(username, row, generation)
+
+
+async def get_principal_async(db: AsyncSession, username: str) -> Optional[Principal]:
+    """get_principal 的 AsyncSession 版本 (與同步版本共用快取)"""
+    principal = _get_cached(username)
+    if principal is not None:
+        return principal
+
+    generation = _invalidations
+    row = (await db.execute(_principal_query(username))).first()
+    return _store(username, row, generation)
+
+
+def invalidate_principal(*usernames: str) -> None:
+    """清除使用者的快取 principal (改名時需同時傳入新舊 username)"""
+    global _invalidations
+    with _invalidation_lock:
+        _invalidations += 1
+        for username in usernames:
+            if username:
+                _principal_cache.delete(username)
@@ -0,0 +1,291 @@
+"""
+API 速率限制
+
+以滑動視窗計數器 (sliding window counter) 限制每個用戶端 IP 的請求數：每個鍵只保存
+目前與上一個固定視窗的計數，估計值 = 上一視窗計數 × 上一視窗仍在滑動視窗內的比例 + 目前視窗計數，
+每次請求的工作量固定 (O(1))。只有被允許的請求會計入視窗：計數先加一 (多個 worker 之間為原子操作)，
+超過限制時再扣回。
+
+- RateLimitBackend: 計數儲存介面
+  - MemoryRateLimitBackend: 行程內計數，閒置的鍵自動淘汰，並以 max_keys 限制記憶體用量
+  - SharedStoreRateLimitBackend: 使用共用儲存 (redis-py 相容的 incr / expire / get)，多個 worker 共用計數；
+    RATE_LIMIT_BACKEND=shared 時連線到 RATE_LIMIT_SHARED_URL 的 Redis
+    (測試可傳入 app.core.cache.InProcessSharedStore)
+- 路由規則依路徑前綴與 HTTP 方法選擇限制 (認證較嚴格、讀取較寬鬆)，各規則分別計數
+- 回應附上 RateLimit-Limit / RateLimit-Remaining / RateLimit-Reset / RateLimit-Policy，
+  超過限制時回傳 429 與 Retry-After
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, NamedTuple, Optional, Tuple
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.metrics import Counter
+from app.core.middleware import RawHeaders, append_headers, encode_headers
+
+# 認證相關路由 (較嚴格的限制)
+AUTH_PATH_PREFIXES = ("/api/auth/", "/api/password-reset/", "/api/login/google")
+
+
+class RateLimitPolicy(NamedTuple):
+    name: str
+    limit: int
+    window: int  # 秒
+
+
+class RateLimitRule(NamedTuple):
+    """路徑符合任一前綴 (且方法符合，methods 為 None 表示不限) 時套用 policy"""
+    policy: RateLimitPolicy
+    path_prefixes: Tuple[str, ...] = ("",)
+    methods: Optional[Tuple[str, ...]] = None
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    policy: RateLimitPolicy
+    remaining: int
+    reset: int  # 目前視窗結束前的秒數
+    retry_after: int  # 被拒絕時建議等待的秒數
+
+
+class RateLimitBackend:
+    """計數儲存介面"""
+
+    def hit(self, key: str, window: int, now: float) -> Tuple[int, int]:
+        """
+        目前視窗的計數加一
+
+        Returns:
+            (目前視窗計數 (含本次), 上一視窗計數)
+        """
+        raise NotImplementedError
+
+    def undo(self, key: str, window: int, now: float) -> None:
+        """撤銷同一個 now 的 hit (請求被拒絕，不計入視窗)"""
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """
+    行程內計數
+
+    鍵依最近使用時間排序，超過兩個視窗未使用的鍵在之後的請求中從最舊的開始淘汰，
+    鍵數超過 max_keys 時淘汰最久未使用的鍵。
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._data = OrderedDict()  # key -> [視窗序號, 目前計數, 上一視窗計數, 最後使用時間, 視窗秒數]
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def hit(self, key: str, window: int, now: float) -> Tuple[int, int]:
+        index = int(now // window)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                entry = [index, 0, 0, now, window]
+                self._data[key] = entry
+            else:
+                self._data.move_to_end(key)
+                if entry[0] != index:
+                    entry[2] = entry[1] if entry[0] == index - 1 else 0
+                    entry[1] = 0
+                    entry[0] = index
+                entry[3] = now
+            entry[1] += 1
+            current, previous = entry[1], entry[2]
+            self._evict(now)
+        return current, previous
+
+    def undo(self, key: str, window: int, now: float) -> None:
+        index = int(now // window)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return
+            # 期間若已有下一個視窗的請求，本次的計數已移到上一視窗
+            if entry[0] == index and entry[1] > 0:
+                entry[1] -= 1
+            elif entry[0] == index + 1 and entry[2] > 0:
+                entry[2] -= 1
+
+    def _evict(self, now: float) -> None:
+        while self._data:
+            oldest_key, oldest = next(iter(self._data.items()))
+            if len(self._data) <= self.max_keys and now - oldest[3] < 2 * oldest[4]:
+                break
+            del self._data[oldest_key]
+            self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {"keys": len(self._data), "max_keys": self.max_keys, "evictions": self.evictions}
+
+
+class SharedStoreRateLimitBackend(RateLimitBackend):
+    """以共用儲存 client 實作的計數，每個視窗一個鍵，兩個視窗後自動過期"""
+
+    def __init__(self, client, prefix: str = "ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+
+    def hit(self, key: str, window: int, now: float) -> Tuple[int, int]:
+        index = int(now // window)
+        current_key = f"{self.prefix}{key}:{index}"
+        current = int(self.client.incr(current_key))
+        if current == 1:
+            self.client.expire(current_key, 2 * window)
+        previous = self.client.get(f"{self.prefix}{key}:{index - 1}")
+        return current, int(previous or 0)
+
+    def undo(self, key: str, window: int, now: float) -> None:
+        self.client.incr(f"{self.prefix}{key}:{int(now // window)}", -1)
+
+
+class RateLimiter:
+    """依路由規則選擇限制並計算是否允許請求"""
+
+    def __init__(self, backend: RateLimitBackend, rules: Iterable[RateLimitRule], default: RateLimitPolicy):
+        self.backend = backend
+        self.rules = list(rules)
+        self.default = default
+        self.allowed = Counter()
+        self.limited = Counter()
+
+    def policy_for(self, method: str, path: str) -> RateLimitPolicy:
+        for rule in self.rules:
+            if rule.methods is not None and method not in rule.methods:
+                continue
+            if any(path.startswith(prefix) for prefix in rule.path_prefixes):
+                return rule.policy
+        return self.default
+
+    def check(self, client_key: str, policy: RateLimitPolicy, now: Optional[float] = None) -> RateLimitResult:
+        now = time.time() if now is None else now
+        key = f"{policy.name}:{client_key}"
+        current, previous = self.backend.hit(key, policy.window, now)
+
+        elapsed = now % policy.window
+        # 上一視窗仍落在滑動視窗內的比例
+        weight = (policy.window - elapsed) / policy.window
+        estimated = previous * weight + current
+        reset = max(1, math.ceil(policy.window - elapsed))
+
+        if estimated <= policy.limit:
+            self.allowed.inc()
+            return RateLimitResult(True, policy, int(policy.limit - estimated), reset, 0)
+
+        # 被拒絕的請求不計入視窗，否則持續重試的用戶端永遠無法恢復
+        self.backend.undo(key, policy.window, now)
+        self.limited.inc()
+        retry_after = _retry_after(policy, previous, current - 1, elapsed)
+        return RateLimitResult(False, policy, 0, reset, retry_after)
+
+    def stats(self) -> dict:
+        return {
+            "allowed": self.allowed.value,
+            "limited": self.limited.value,
+            **self.backend.stats()
+        }
+
+
+def _retry_after(policy: RateLimitPolicy, previous: int, current: int, elapsed: float) -> int:
+    """
+    沒有新請求時，下一個請求 (估計值含本身) 不超過限制所需等待的秒數
+
+    Args:
+        previous / current: 上一視窗與目前視窗已允許的請求數
+        elapsed: 目前視窗已經過的秒數
+    """
+    window, limit = policy.window, policy.limit
+    if current + 1 <= limit:
+        # 目前視窗內等待上一視窗的權重下降：previous × (window - t) / window + current + 1 <= limit
+        target = window - (limit - current - 1) * window / previous
+        wait = target - elapsed
+    else:
+        # 需要等到下一個視窗，目前視窗的計數成為上一視窗：current × (window - t) / window + 1 <= limit
+        target = window - (limit - 1) * window / current if limit >= 1 else window
+        wait = (window - elapsed) + max(0.0, target)
+    return max(1, math.ceil(wait))
+
+
+def rate_limit_headers(result: RateLimitResult) -> RawHeaders:
+    headers = [
+        ("RateLimit-Limit", str(result.policy.limit)),
+        ("RateLimit-Remaining", str(result.remaining)),
+        ("RateLimit-Reset", str(result.reset)),
+        ("RateLimit-Policy", f"{result.policy.limit};w={result.policy.window}"),
+    ]
+    if not result.allowed:
+        headers.append(("Retry-After", str(result.retry_after)))
+    return encode_headers(headers)
+
+
+class RateLimitMiddleware:
+    """以用戶端 IP 為鍵套用 RateLimiter (ASGI middleware)"""
+
+    def __init__(self, app: ASGIApp, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        client = scope.get("client")
+        client_ip = client[0] if client else "unknown"
+        policy = self.limiter.policy_for(scope["method"], scope["path"])
+        result = self.limiter.check(client_ip, policy)
+        headers = rate_limit_headers(result)
+
+        if not result.allowed:
+            response = JSONResponse(
+                status_code=429,
+                content={"detail": "Too many requests. Please try again later."}
+            )
+            response.raw_headers.extend(headers)
+            await response(scope, receive, send)
+            return
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                append_headers(message, headers)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+def _create_shared_client():
+    """依 RATE_LIMIT_SHARED_URL 建立 Redis client；設定不完整時在啟動時就失敗，而不是退回行程內計數"""
+    if not settings.RATE_LIMIT_SHARED_URL:
+        raise RuntimeError("RATE_LIMIT_BACKEND=shared requires RATE_LIMIT_SHARED_URL (e.g. redis://redis:6379/0)")
+    try:
+        import redis
+    except ImportError as e:
+        raise RuntimeError("RATE_LIMIT_BACKEND=shared requires the 'redis' package") from e
+    return redis.Redis.from_url(settings.RATE_LIMIT_SHARED_URL)
+
+
+def create_rate_limiter() -> RateLimiter:
+    """依設定建立 RateLimiter：認證路由、GET 請求與其他請求各自計數"""
+    if settings.RATE_LIMIT_BACKEND == "shared":
+        backend = SharedStoreRateLimitBackend(_create_shared_client())
+    else:
+        backend = MemoryRateLimitBackend(max_keys=settings.RATE_LIMIT_MAX_KEYS)
+    rules = [
+        RateLimitRule(RateLimitPolicy("auth", settings.RATE_LIMIT_AUTH_PER_MINUTE, 60), AUTH_PATH_PREFIXES),
+        RateLimitRule(RateLimitPolicy("read", settings.RATE_LIMIT_READ_PER_MINUTE, 60), methods=("GET", "HEAD")),
+    ]
+    return RateLimiter(backend, rules, default=RateLimitPolicy("default", settings.RATE_LIMIT_PER_MINUTE, 60))
@@ -6,6 +6,8 @@ from app.services.crawler_esun import fetch_esun_exchange_rates
 from app.services.recurring_expense_processor import process_recurring_expenses
 from app.services.budget_stats import update_all_active_budgets_stats
 from app.tasks.budget_recurring import create_next_period_budgets
+from app.services.transaction_rollup import ensure_rollups_initialized
+from app.services.budget_spent import check_budgets_spent, ensure_budgets_spent_initialized
 from app.core.database import SessionLocal
 import logging
 
@@ -59,13 +61,51 @@ def run_budget_stats_job():
     logger.info("Starting budget stats update")
     db = SessionLocal()
     try:
-        updated_count = update_all_active_budgets_stats(db)
-        logger.info(f"Budget stats job completed. Updated {updated_count} budgets")
+        result = update_all_active_budgets_stats(db)
+        logger.info(
+            f"Budget stats job completed. Checked {result['budgets']} budgets, "
+            f"updated {result['updated_budgets']} budgets ({result['days']} days)"
+        )
     except Exception as e:
         logger.error(f"Budget stats job failed: {e}")
     finally:
         db.close()
 
+def run_rollup_init_job():
+    """初始化交易每日彙總 - 彙總表為空時由交易表重建"""
+    db = SessionLocal()
+    try:
+        ensure_rollups_initialized(db)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Rollup init job failed: {e}")
+    finally:
+        db.close()
+
+def run_budget_spent_init_job():
+    """初始化預算已使用金額 - 只重算 spent 為 NULL 的預算"""
+    db = SessionLocal()
+    try:
+        ensure_budgets_spent_initialized(db)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Budget spent init job failed: {e}")
+    finally:
+        db.close()
+
+def run_budget_spent_check_job():
+    """預算已使用金額一致性檢查 - 與完整重算比對並修復誤差"""
+    logger.info("Starting budget spent check")
+    db = SessionLocal()
+    try:
+        drifts = check_budgets_spent(db, repair=True)
+        logger.info(f"Budget spent check completed. Repaired {len(drifts)} budgets")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Budget spent check job failed: {e}")
+    finally:
+        db.close()
+
 scheduler = BackgroundScheduler()
 
 def start_scheduler():
@@ -89,8 +129,12 @@ def start_scheduler():
     budget_stats_trigger = CronTrigger(hour=0, minute=10)
     scheduler.add_job(run_budget_stats_job, trigger=budget_stats_trigger, id="budget_stats_updater", replace_existing=True)
 
+    # 預算已使用金額檢查：每天凌晨 00:15 執行
+    budget_spent_trigger = CronTrigger(hour=0, minute=15)
+    scheduler.add_job(run_budget_spent_check_job, trigger=budget_spent_trigger, id="budget_spent_checker", replace_existing=True)
+
     scheduler.start()
-    logger.info("Scheduler started - BOT (hourly), E.SUN (hourly), Recurring Expenses (daily at 00:01), Budget Recurring (daily at 00:05), Budget Stats (daily at 00:10)")
+    logger.info("Scheduler started - BOT (hourly), E.SUN (hourly), Recurring Expenses (daily at 00:01), Budget Recurring (daily at 00:05), Budget Stats (daily at 00:10), Budget Spent Check (daily at 00:15)")
 
 def stop_scheduler():
     scheduler.shutdown()
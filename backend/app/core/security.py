@@ -1,20 +1,119 @@
 from datetime import datetime, timedelta
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Optional
+import asyncio
+import threading
+import time
 from jose import JWTError, jwt
 import bcrypt
+from fastapi import HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from .config import settings
+from .metrics import Counter, register_metrics
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+
+class PasswordHashPool:
+    """
+    bcrypt 專用的有界執行緒池
+
+    bcrypt 每次約需數百毫秒 CPU (執行期間會釋放 GIL)。同時執行 max_workers 個，
+    最多再排隊 max_queue 個，已滿時立即回傳 503，登入尖峰不會佔滿 API 的執行緒或卡住事件迴圈。
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.capacity = max_workers + max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.completed = Counter()
+        self.rejected = Counter()
+        self.wait_seconds = Counter()
+        self.hash_seconds = Counter()
+        self.max_hash_seconds = 0.0
+
+    def _run(self, fn, args, submitted_at: float):
+        started_at = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - started_at
+            self.wait_seconds.inc(started_at - submitted_at)
+            self.hash_seconds.inc(elapsed)
+            self.completed.inc()
+            with self._lock:
+                self.max_hash_seconds = max(self.max_hash_seconds, elapsed)
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+
+    def submit(self, fn, *args) -> Future:
+        with self._lock:
+            if self._pending >= self.capacity:
+                self.rejected.inc()
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="伺服器忙碌中，請稍後再試",
+                    headers={"Retry-After": "1"},
+                )
+            self._pending += 1
+        try:
+            future = self._executor.submit(self._run, fn, args, time.perf_counter())
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def run(self, fn, *args):
+        """在池中執行並等待結果 (同步端點使用)"""
+        return self.submit(fn, *args).result()
+
+    async def run_async(self, fn, *args):
+        """在池中執行並 await 結果，不佔用事件迴圈 (async 端點使用)"""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def stats(self) -> dict:
+        completed = self.completed.value
+        return {
+            "workers": self.max_workers,
+            "capacity": self.capacity,
+            "pending": self._pending,
+            "completed": completed,
+            "rejected": self.rejected.value,
+            "avg_hash_ms": round(self.hash_seconds.value / completed * 1000, 2) if completed else 0.0,
+            "max_hash_ms": round(self.max_hash_seconds * 1000, 2),
+            "avg_wait_ms": round(self.wait_seconds.value / completed * 1000, 2) if completed else 0.0,
+        }
+
+
+password_hash_pool = PasswordHashPool(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_QUEUE_SIZE)
+register_metrics("password_hash_pool", password_hash_pool.stats)
+
+
+def _checkpw(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
-def get_password_hash(password: str) -> str:
+def _hashpw(password: str) -> str:
     salt = bcrypt.gensalt()
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return password_hash_pool.run(_checkpw, plain_password, hashed_password)
+
+def get_password_hash(password: str) -> str:
+    return password_hash_pool.run(_hashpw, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_hash_pool.run_async(_checkpw, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await password_hash_pool.run_async(_hashpw, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     # 設定過期時間為當天 23:59:59
@@ -1,16 +1,15 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.responses import JSONResponse
 from starlette.middleware.sessions import SessionMiddleware
-from app.core.database import engine, Base
+from app.core.database import async_engine, engine, Base
 from app.core.config import settings
+from app.core.metrics import register_metrics
+from app.core.middleware import SecurityHeadersMiddleware
+from app.core.rate_limit import RateLimitMiddleware, create_rate_limiter
 from app.api import auth, accounts, transactions, budgets, users, categories, reports, description_history, exchange_rates, password_reset, google_auth, admin, recurring_expenses
-from app.core.scheduler import start_scheduler, stop_scheduler, run_bot_crawler_job, run_esun_crawler_job, run_recurring_expense_job, run_budget_recurring_job
-from starlette.middleware.base import BaseHTTPMiddleware
-import time
-from collections import defaultdict
-from datetime import datetime, timedelta
+from app.core.scheduler import start_scheduler, stop_scheduler, run_bot_crawler_job, run_esun_crawler_job, run_recurring_expense_job, run_budget_recurring_job, run_rollup_init_job, run_budget_spent_init_job
+from datetime import datetime
 from contextlib import asynccontextmanager
 import threading
 import logging
@@ -26,6 +25,11 @@ Base.metadata.create_all(bind=engine)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # 首次部署時回填交易每日彙總，需在開始處理請求前完成，報表才會正確
+    run_rollup_init_job()
+    # 首次部署時由交易重算預算已使用金額 (只處理尚未初始化的預算，完整校正由每日排程執行)
+    run_budget_spent_init_job()
+
     # Start scheduler
     start_scheduler()
 
@@ -148,6 +152,8 @@ async def lifespan(app: FastAPI):
     yield
     # Stop scheduler
     stop_scheduler()
+    # 關閉 async engine 的連線 (需在事件迴圈結束前)
+    await async_engine.dispose()
 
 app = FastAPI(
     title="Accounting API",
@@ -157,61 +163,12 @@ app = FastAPI(
     lifespan=lifespan
 )
 
-# Rate limiting middleware
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app, enabled: bool = True, rate_limit: int = 60):
-        super().__init__(app)
-        self.enabled = enabled
-        self.rate_limit = rate_limit
-        self.requests = defaultdict(list)
-
-    async def dispatch(self, request: Request, call_next):
-        if not self.enabled:
-            return await call_next(request)
-
-        # Get client IP
-        client_ip = request.client.host
-
-        # Clean old requests
-        now = datetime.now()
-        self.requests[client_ip] = [
-            req_time for req_time in self.requests[client_ip]
-            if now - req_time < timedelta(minutes=1)
-        ]
-
-        # Check rate limit
-        if len(self.requests[client_ip]) >= self.rate_limit:
-            return JSONResponse(
-                status_code=429,
-                content={"detail": "Too many requests. Please try again later."}
-            )
-
-        # Add current request
-        self.requests[client_ip].append(now)
-
-        response = await call_next(request)
-        return response
-
-# Security headers middleware
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
-        if settings.ENABLE_SECURITY_HEADERS:
-            response.headers["X-Content-Type-Options"] = "nosniff"
-            response.headers["X-Frame-Options"] = "DENY"
-            response.headers["X-XSS-Protection"] = "1; mode=block"
-            response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-            response.headers["Content-Security-Policy"] = "default-src 'self'; script-src 'self' https://challenges.cloudflare.com https://static.cloudflareinsights.com; style-src 'self' 'unsafe-inline'; img-src 'self' data:; font-src 'self'; connect-src 'self' https://challenges.cloudflare.com https://cloudflareinsights.com; frame-src 'self' https://challenges.cloudflare.com"
-            response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-            # response.headers["Permissions-Policy"] = "geolocation=(), microphone=(), camera=()"
-        return response
-
 from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
 
 # ...
 
 # Add security headers middleware
-app.add_middleware(SecurityHeadersMiddleware)
+app.add_middleware(SecurityHeadersMiddleware, enabled=settings.ENABLE_SECURITY_HEADERS)
 
 # Add ProxyHeadersMiddleware to trust X-Forwarded-Proto from Nginx/Synology
 app.add_middleware(ProxyHeadersMiddleware, trusted_hosts="*")
@@ -230,11 +187,9 @@ app.add_middleware(
 
 # Add rate limiting middleware
 if settings.RATE_LIMIT_ENABLED:
-    app.add_middleware(
-        RateLimitMiddleware,
-        enabled=settings.RATE_LIMIT_ENABLED,
-        rate_limit=settings.RATE_LIMIT_PER_MINUTE
-    )
+    rate_limiter = create_rate_limiter()
+    register_metrics("rate_limit", rate_limiter.stats)
+    app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
 
 # CORS middleware - use dynamic origins from config
 app.add_middleware(
@@ -9,5 +9,10 @@ from .description_history import DescriptionHistory
 from .exchange_rate import ExchangeRate
 from .password_reset import PasswordResetToken
 from .recurring_expense import RecurringExpense
+from .transaction_daily_rollup import TransactionDailyRollup
+from .budget_daily_stat import BudgetDailyStat
+from .reencryption_job import ReencryptionJob
+from .import_job import ImportJob
+from .change_log import ChangeLog
 
-__all__ = ["User", "Account", "Transaction", "Budget", "BudgetAccount", "BudgetCategory", "Category", "DescriptionHistory", "ExchangeRate", "PasswordResetToken", "RecurringExpense"]
+__all__ = ["User", "Account", "Transaction", "Budget", "BudgetAccount", "BudgetCategory", "Category", "DescriptionHistory", "ExchangeRate", "PasswordResetToken", "RecurringExpense", "TransactionDailyRollup", "BudgetDailyStat", "ReencryptionJob", "ImportJob", "ChangeLog"]
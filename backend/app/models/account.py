@@ -12,7 +12,7 @@ class Account(Base):
     balance = Column(Float, default=0.0)
     currency = Column(String, default="USD")
     description = Column(String)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
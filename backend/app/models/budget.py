@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Date, Boolean
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Date, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
@@ -52,5 +52,13 @@ class Budget(Base):
         backref="budgets"
     )
 
+    # 綁定的類別（唯讀，類別關聯仍直接寫入 budget_categories）
+    budget_categories = relationship("BudgetCategory", viewonly=True)
+
     # 自引用關係: 用於追蹤週期鏈
     parent_budget = relationship("Budget", remote_side=[id], foreign_keys=[parent_budget_id])
+
+    __table_args__ = (
+        # 依使用者查詢與期間重疊的預算 (end_date >= 區間起點)
+        Index("ix_budgets_user_end_date", "user_id", "end_date"),
+    )
@@ -7,6 +7,6 @@ class BudgetAccount(Base):
     __tablename__ = "budget_accounts"
 
     id = Column(Integer, primary_key=True, index=True)
-    budget_id = Column(Integer, ForeignKey("budgets.id", ondelete="CASCADE"), nullable=False)
+    budget_id = Column(Integer, ForeignKey("budgets.id", ondelete="CASCADE"), nullable=False, index=True)
     account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
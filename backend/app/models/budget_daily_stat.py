@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, Float, ForeignKey, Date, Boolean, UniqueConstraint
+from app.core.database import Base
+
+class BudgetDailyStat(Base):
+    """
+    預算每日淨支出
+
+    記錄預算每個已結束日期的淨支出 (支出 - 收入)，超支天數與預算內天數由此統計。
+    過去日期的交易異動時只將該日標記為 is_dirty，由每日排程重新計算。
+    """
+    __tablename__ = "budget_daily_stats"
+
+    id = Column(Integer, primary_key=True, index=True)
+    budget_id = Column(Integer, ForeignKey("budgets.id", ondelete="CASCADE"), nullable=False)
+    stat_date = Column(Date, nullable=False)  # 台北時間日期
+    net_spent = Column(Float, nullable=False, default=0.0)
+    is_dirty = Column(Boolean, nullable=False, default=False)
+
+    __table_args__ = (
+        UniqueConstraint("budget_id", "stat_date", name="uq_budget_daily_stats_budget_date"),
+    )
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+class ChangeLog(Base):
+    """
+    使用者資料的異動紀錄 (增量同步用)
+
+    seq 即異動當下的 users.data_version，同一使用者內單調遞增；
+    刪除以 op='delete' 的墓碑保存，無法逐筆追蹤的批次操作以 entity_type='all'、op='reset' 記錄。
+    """
+    __tablename__ = "change_log"
+    __table_args__ = (
+        UniqueConstraint('user_id', 'seq', name='uq_change_log_user_seq'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    seq = Column(Integer, nullable=False)
+    # 'transaction', 'account', 'budget', 'category', 'all'
+    entity_type = Column(String, nullable=False)
+    entity_id = Column(Integer, nullable=True)
+    # 'upsert', 'delete', 'reset'
+    op = Column(String, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
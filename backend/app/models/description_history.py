@@ -2,7 +2,7 @@ from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.sql import func
 from app.core.database import Base
-from app.core.encryption import encrypt_field, decrypt_field
+from app.core.encryption import encrypt_field, decrypt_field, blind_index, evict_decrypted
 
 
 class DescriptionHistory(Base):
@@ -12,6 +12,7 @@ class DescriptionHistory(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     _description = Column("description", String, nullable=False, index=True)  # 加密儲存
+    description_hash = Column(String(64), nullable=True, index=True)  # description 的盲索引，用於等值查詢
     last_used_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
@@ -23,5 +24,7 @@ class DescriptionHistory(Base):
 
     @description.setter
     def description(self, value):
-        """加密 description"""
+        """加密 description 並更新盲索引，舊密文從解密快取移除"""
+        evict_decrypted(self._description)
         self._description = encrypt_field(value)
+        self.description_hash = blind_index(value)
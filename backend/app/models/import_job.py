@@ -0,0 +1,29 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+class ImportJob(Base):
+    """
+    使用者資料匯入任務
+
+    上傳的檔案在背景解析並批次寫入，前端以任務 ID 查詢進度與結果。
+    """
+    __tablename__ = "import_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    # 狀態: 'pending', 'running', 'completed', 'failed'
+    status = Column(String, nullable=False, default='pending')
+    # 目前階段: 'parsing', 'accounts', 'categories', 'budgets', 'transactions', 'finalizing'
+    stage = Column(String, nullable=True)
+
+    # 進度
+    total_transactions = Column(Integer, nullable=False, default=0)
+    processed_transactions = Column(Integer, nullable=False, default=0)
+    stats = Column(Text, nullable=True)  # 完成後的統計 (JSON)
+    error = Column(Text, nullable=True)
+
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,33 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+class ReencryptionJob(Base):
+    """
+    加密欄位重新加密任務
+
+    依資料表順序、以 id 遞增分批將加密欄位改寫為目前的金鑰，
+    每批完成後記錄 current_table / last_id，中斷後可從檢查點繼續。
+    """
+    __tablename__ = "reencryption_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # 狀態: 'pending', 'running', 'paused', 'completed', 'failed'
+    status = Column(String, nullable=False, default='pending')
+    target_key_id = Column(String, nullable=False)  # 改寫成的金鑰 ID
+    rows_per_second = Column(Integer, nullable=False, default=0)  # 0 表示不限速
+
+    # 檢查點
+    current_table = Column(String, nullable=True)
+    last_id = Column(Integer, nullable=False, default=0)
+
+    # 進度
+    total_rows = Column(Integer, nullable=False, default=0)
+    rows_processed = Column(Integer, nullable=False, default=0)
+    rows_updated = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
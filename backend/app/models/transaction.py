@@ -1,15 +1,16 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Date, Boolean
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Date, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.sql import func
 from app.core.database import Base
-from app.core.encryption import encrypt_field, decrypt_field
+from app.core.encryption import encrypt_field, decrypt_field, blind_index, evict_decrypted
 
 class Transaction(Base):
     __tablename__ = "transactions"
 
     id = Column(Integer, primary_key=True, index=True)
     _description = Column("description", String, nullable=False)  # 加密儲存
+    description_hash = Column(String(64), nullable=True, index=True)  # description 的盲索引，用於等值查詢
     amount = Column(Float, nullable=False)
     transaction_type = Column(String, nullable=False)  # 'debit', 'credit', or 'installment'
     category = Column(String)
@@ -22,8 +23,10 @@ class Transaction(Base):
 
     @description.setter
     def description(self, value):
-        """加密 description"""
+        """加密 description 並更新盲索引，舊密文從解密快取移除"""
+        evict_decrypted(self._description)
         self._description = encrypt_field(value)
+        self.description_hash = blind_index(value)
 
     @hybrid_property
     def note(self):
@@ -32,7 +35,8 @@ class Transaction(Base):
 
     @note.setter
     def note(self, value):
-        """加密 note"""
+        """加密 note，舊密文從解密快取移除"""
+        evict_decrypted(self._note)
         self._note = encrypt_field(value)
     foreign_amount = Column(Float, nullable=True)
     foreign_currency = Column(String, nullable=True)
@@ -60,3 +64,12 @@ class Transaction(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     account = relationship("Account", back_populates="transactions")
+
+    __table_args__ = (
+        # 報表、統計與預算查詢皆以 account_id IN (...) 加上日期區間篩選，
+        # 常用欄位放在 INCLUDE 中，彙總查詢可只讀索引 (index-only scan)
+        Index(
+            "ix_transactions_account_date", "account_id", "transaction_date",
+            postgresql_include=["amount", "transaction_type", "category", "exclude_from_budget"]
+        ),
+    )
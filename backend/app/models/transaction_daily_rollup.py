@@ -0,0 +1,29 @@
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Date, Boolean, UniqueConstraint, Index
+from app.core.database import Base
+
+class TransactionDailyRollup(Base):
+    """
+    交易每日彙總表
+
+    以 (使用者, 帳戶, 類別, 台北日期, 交易類型, 是否排除預算) 為鍵，
+    記錄金額總和與筆數，由交易寫入路徑同步維護，供報表彙總查詢使用。
+    """
+    __tablename__ = "transaction_daily_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    account_id = Column(Integer, ForeignKey("accounts.id", ondelete="CASCADE"), nullable=False)
+    category = Column(String, nullable=False, default="")  # 未分類以空字串儲存，讓唯一鍵可用於 upsert
+    local_date = Column(Date, nullable=False)  # 台北時間日期
+    transaction_type = Column(String, nullable=False)
+    exclude_from_budget = Column(Boolean, nullable=False, default=False)
+    total_amount = Column(Float, nullable=False, default=0.0)
+    transaction_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "user_id", "account_id", "category", "local_date", "transaction_type", "exclude_from_budget",
+            name="uq_transaction_daily_rollups_key"
+        ),
+        Index("ix_transaction_daily_rollups_user_date", "user_id", "local_date"),
+    )
@@ -15,6 +15,7 @@ class User(Base):
     two_factor_enabled = Column(Boolean, default=False, nullable=False)
     two_factor_secret = Column(String, nullable=True)
     last_login_at = Column(DateTime(timezone=True), nullable=True)
+    data_version = Column(Integer, default=0, server_default="0", nullable=False)  # 交易/帳戶/預算/類別異動時遞增，用於報表快取失效
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
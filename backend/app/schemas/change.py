@@ -0,0 +1,17 @@
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+
+class ChangeEntry(BaseModel):
+    """單一實體的異動；op='delete' 時 data 為 None"""
+    seq: int
+    entity_type: str
+    entity_id: Optional[int] = None
+    op: str
+    data: Optional[Dict[str, Any]] = None
+
+class ChangeFeed(BaseModel):
+    """增量同步的一頁異動"""
+    changes: List[ChangeEntry]
+    cursor: int  # 下一次請求的 since
+    has_more: bool
+    reset: bool = False  # 期間有批次操作，需重新下載完整資料後從 cursor 繼續
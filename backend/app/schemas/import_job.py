@@ -0,0 +1,17 @@
+from pydantic import BaseModel
+from typing import Dict, Optional
+from datetime import datetime
+
+class ImportJobStatus(BaseModel):
+    """資料匯入任務進度"""
+    id: int
+    status: str
+    stage: Optional[str] = None
+    total_transactions: int
+    processed_transactions: int
+    progress_percent: float
+    stats: Optional[Dict[str, int]] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
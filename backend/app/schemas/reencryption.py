@@ -0,0 +1,25 @@
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+
+class ReencryptionStart(BaseModel):
+    """啟動重新加密任務"""
+    rows_per_second: Optional[int] = None  # 未指定時使用 REENCRYPTION_ROWS_PER_SECOND，0 表示不限速
+
+class ReencryptionJobStatus(BaseModel):
+    """重新加密任務進度"""
+    id: int
+    status: str
+    target_key_id: str
+    active_key_id: str
+    rows_per_second: int
+    current_table: Optional[str] = None
+    last_id: int
+    total_rows: int
+    rows_processed: int
+    rows_updated: int
+    progress_percent: float
+    error: Optional[str] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
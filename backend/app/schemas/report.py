@@ -63,3 +63,10 @@ class RankingReport(BaseModel):
 class AccountReport(BaseModel):
     account_stats: List[AccountStats]
     total_amount: float
+
+class CombinedReport(BaseModel):
+    overview: Optional[OverviewReport] = None
+    details: Optional[DetailsReport] = None
+    category: Optional[CategoryReport] = None
+    ranking: Optional[RankingReport] = None
+    account: Optional[AccountReport] = None
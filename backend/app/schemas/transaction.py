@@ -30,6 +30,10 @@ class TransferCreate(BaseModel):
     description: str
     note: Optional[str] = None
 
+class TransactionBatchCreate(BaseModel):
+    transactions: List[TransactionCreate] = []
+    transfers: List[TransferCreate] = []
+
 class TransactionUpdate(BaseModel):
     account_id: Optional[int] = None
     description: Optional[str] = None
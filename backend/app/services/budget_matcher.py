@@ -0,0 +1,186 @@
+"""
+預算與交易的比對
+
+報表需要判斷每筆支出是否落在某個預算內 (日期區間、綁定帳戶、綁定類別)。
+BudgetMatcher 先把每個預算整理為 BudgetRule，並以 (帳戶, 類別) 建立索引，
+每筆交易只需檢查可能符合的預算，而不是逐一比對所有預算。
+
+只需要各預算支出總額時，使用 get_budget_spent_totals 以一次分組查詢在資料庫中計算。
+"""
+from collections import defaultdict, namedtuple
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, exists, func, or_, select
+from sqlalchemy.orm import Session
+
+from app.models.account import Account
+from app.models.budget import Budget
+from app.models.budget_account import BudgetAccount
+from app.models.budget_category import BudgetCategory
+from app.models.transaction import Transaction
+from app.services.report_engine import load_report_transactions
+from app.services.transaction_rollup import DEBIT_TYPES, ROLLUP_TIMEZONE
+
+# 預算的比對條件，accounts / categories 為空集合表示不限
+BudgetRule = namedtuple("BudgetRule", ["budget", "start", "end", "accounts", "categories"])
+
+
+def load_budget_rules(db: Session, budgets: List[Budget]) -> List[BudgetRule]:
+    """
+    批次載入預算綁定的類別與帳戶並建立比對條件
+
+    類別為 budget_categories 與舊版 category 欄位的聯集；日期以日為單位，含首尾。
+    """
+    budget_ids = [b.id for b in budgets]
+    categories = defaultdict(set)
+    accounts = defaultdict(set)
+    if budget_ids:
+        for budget_id, category_name in db.query(
+            BudgetCategory.budget_id, BudgetCategory.category_name
+        ).filter(BudgetCategory.budget_id.in_(budget_ids)):
+            categories[budget_id].add(category_name)
+        for budget_id, account_id in db.query(
+            BudgetAccount.budget_id, BudgetAccount.account_id
+        ).filter(BudgetAccount.budget_id.in_(budget_ids)):
+            accounts[budget_id].add(account_id)
+
+    rules = []
+    for b in budgets:
+        budget_categories = categories[b.id]
+        if b.category:
+            budget_categories.add(b.category)
+        rules.append(BudgetRule(
+            budget=b,
+            start=b.start_date.date(),
+            end=b.end_date.date(),
+            accounts=frozenset(accounts[b.id]),
+            categories=frozenset(budget_categories),
+        ))
+    return rules
+
+
+class BudgetMatcher:
+    """
+    以 (帳戶, 類別) 索引預算，快速找出交易符合的預算
+
+    索引鍵中的 None 表示該預算不限帳戶或不限類別，
+    一筆交易最多只需查詢四個鍵。
+    """
+
+    def __init__(self, rules: Iterable[BudgetRule]):
+        self.rules = list(rules)
+        self._index = defaultdict(list)
+        for rule in self.rules:
+            for account_id in rule.accounts or (None,):
+                for category in rule.categories or (None,):
+                    self._index[(account_id, category)].append(rule)
+
+    def candidates(self, account_id: int, category: Optional[str]) -> List[BudgetRule]:
+        """取得帳戶與類別符合的預算 (尚未檢查日期)"""
+        result = []
+        for key in ((account_id, category), (account_id, None), (None, category), (None, None)):
+            result.extend(self._index.get(key, ()))
+        return result
+
+    def match(self, account_id: int, category: Optional[str], local_date) -> Optional[BudgetRule]:
+        """回傳第一個符合的預算，皆不符合時回傳 None"""
+        for rule in self.candidates(account_id, category):
+            if rule.start <= local_date <= rule.end:
+                return rule
+        return None
+
+    def filter_transactions(self, transactions) -> list:
+        """篩選出計入任一預算的支出交易 (排除不計入預算者)"""
+        return [
+            t for t in transactions
+            if t.transaction_type in DEBIT_TYPES
+            and not t.exclude_from_budget
+            and self.match(t.account_id, t.category, t.transaction_date.date()) is not None
+        ]
+
+    def transaction_filters(self) -> list:
+        """
+        依所有預算的帳戶/類別條件產生 SQL 預先篩選條件
+
+        只有在每個預算都限定帳戶 (或類別) 時才能預先篩選，否則回傳空清單。
+        """
+        filters = []
+        if self.rules and all(rule.accounts for rule in self.rules):
+            filters.append(Transaction.account_id.in_(set().union(*(rule.accounts for rule in self.rules))))
+        if self.rules and all(rule.categories for rule in self.rules):
+            filters.append(Transaction.category.in_(set().union(*(rule.categories for rule in self.rules))))
+        return filters
+
+
+def load_budget_transactions(db: Session, user_id: int, matcher: BudgetMatcher,
+                             start_date: datetime, end_date: datetime) -> list:
+    """
+    取得 [start_date, end_date) 區間內計入任一預算的支出交易 (TransactionDetail)
+
+    類型、不計入預算與可預先判斷的帳戶/類別條件在 SQL 中篩選，其餘再交給 matcher 比對。
+    """
+    if not matcher.rules:
+        return []
+    transactions = load_report_transactions(
+        db, user_id, start_date, end_date,
+        Transaction.transaction_type.in_(DEBIT_TYPES),
+        Transaction.exclude_from_budget == False,
+        *matcher.transaction_filters()
+    )
+    return matcher.filter_transactions(transactions)
+
+
+def get_budget_spent_totals(db: Session, user_id: int, budget_ids: List[int],
+                            start_date: datetime, end_date: datetime) -> Dict[int, float]:
+    """
+    以一次分組查詢計算各預算在 [start_date, end_date) 區間內的支出
+
+    每個預算各自計算 (一筆交易可同時計入多個預算)。類別規則：有綁定類別時只看綁定類別，
+    否則使用舊版 category 欄位，兩者皆無則為不限類別。
+
+    Returns:
+        {budget_id: spent}，沒有支出的預算不會出現在結果中
+    """
+    if not budget_ids:
+        return {}
+
+    local_date = func.date(func.timezone(ROLLUP_TIMEZONE, Transaction.transaction_date))
+    has_accounts = exists().where(BudgetAccount.budget_id == Budget.id)
+    account_bound = exists().where(
+        BudgetAccount.budget_id == Budget.id,
+        BudgetAccount.account_id == Transaction.account_id
+    )
+    has_categories = exists().where(BudgetCategory.budget_id == Budget.id)
+    category_bound = exists().where(
+        BudgetCategory.budget_id == Budget.id,
+        BudgetCategory.category_name == Transaction.category
+    )
+
+    query = select(
+        Budget.id,
+        func.sum(Transaction.amount)
+    ).select_from(Budget).join(
+        Account, Account.user_id == Budget.user_id
+    ).join(
+        Transaction, Transaction.account_id == Account.id
+    ).where(
+        Budget.id.in_(budget_ids),
+        Budget.user_id == user_id,
+        Transaction.transaction_type.in_(DEBIT_TYPES),
+        Transaction.exclude_from_budget == False,
+        Transaction.transaction_date >= start_date,
+        Transaction.transaction_date < end_date,
+        local_date >= func.date(Budget.start_date),
+        local_date <= func.date(Budget.end_date),
+        or_(~has_accounts, account_bound),
+        or_(
+            category_bound,
+            and_(
+                ~has_categories,
+                or_(func.coalesce(Budget.category, '') == '', Budget.category == Transaction.category)
+            )
+        )
+    ).group_by(Budget.id)
+
+    return {budget_id: spent or 0.0 for budget_id, spent in db.execute(query)}
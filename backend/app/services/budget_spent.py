@@ -0,0 +1,256 @@
+"""
+預算已使用金額計算服務
+
+已使用金額 = 總支出 - 總收入，計算規則：
+- 如果預算沒有綁定帳戶：計算使用者所有帳戶的交易
+- 如果預算綁定了帳戶：只計算這些帳戶的交易
+- 如果預算沒有綁定類別：計算所有類別的交易
+- 如果預算綁定了類別：只計算這些類別的交易
+- 排除 exclude_from_budget=True 的交易
+- 支出包含：debit, installment；收入包含：credit
+- 收入大於支出時已使用金額為 0
+
+budgets.spent 欄位保存未截斷的淨支出 (可為負)，由交易寫入時以
+apply_budget_spent_changes 增量維護，讀取時再以 clamp_spent 截斷為 0。
+預算的日期或綁定變更時以 recompute_budgets_spent 重新計算，
+check_budgets_spent 比對欄位與完整重算的結果並可修復誤差。
+spent 為 NULL 表示尚未初始化 (例如首次部署)，增量更新不會改變 NULL，
+啟動時由 ensure_budgets_spent_initialized 重算。
+"""
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import bindparam, case, exists, func, or_, update
+from sqlalchemy.orm import Session
+
+from app.core.timezone import TAIPEI_TZ, to_taipei_time
+from app.models.account import Account
+from app.models.budget import Budget
+from app.models.budget_account import BudgetAccount
+from app.models.budget_category import BudgetCategory
+from app.models.transaction import Transaction
+from app.services.transaction_rollup import CREDIT_TYPES, DEBIT_TYPES
+
+logger = logging.getLogger(__name__)
+
+# 一次完整重算的預算數量
+SPENT_CHECK_BATCH_SIZE = 500
+
+# 浮點數累加誤差容許值
+SPENT_TOLERANCE = 0.005
+
+
+def clamp_spent(net_spent: Optional[float]) -> float:
+    """淨支出轉換為顯示用的已使用金額，收入大於支出時以 0 計"""
+    return net_spent if net_spent and net_spent > 0 else 0.0
+
+
+def calculate_budgets_net_spent(db: Session, budget_ids: Iterable[int]) -> Dict[int, float]:
+    """以一次分組查詢計算多個預算的淨支出 (總支出 - 總收入，未截斷)
+
+    Returns:
+        {budget_id: net_spent}，沒有任何交易的預算為 0
+    """
+    budget_ids = list(budget_ids)
+    if not budget_ids:
+        return {}
+
+    has_accounts = exists().where(BudgetAccount.budget_id == Budget.id)
+    account_bound = exists().where(
+        BudgetAccount.budget_id == Budget.id,
+        BudgetAccount.account_id == Transaction.account_id
+    )
+    has_categories = exists().where(BudgetCategory.budget_id == Budget.id)
+    category_bound = exists().where(
+        BudgetCategory.budget_id == Budget.id,
+        BudgetCategory.category_name == Transaction.category
+    )
+
+    rows = db.query(
+        Budget.id,
+        func.sum(case((Transaction.transaction_type.in_(DEBIT_TYPES), Transaction.amount), else_=0)).label('total_expense'),
+        func.sum(case((Transaction.transaction_type.in_(CREDIT_TYPES), Transaction.amount), else_=0)).label('total_income')
+    ).join(
+        Account, Account.user_id == Budget.user_id
+    ).join(
+        Transaction, Transaction.account_id == Account.id
+    ).filter(
+        Budget.id.in_(budget_ids),
+        Transaction.transaction_date >= Budget.start_date,
+        Transaction.transaction_date <= Budget.end_date,
+        Transaction.exclude_from_budget == False,  # 排除不計入預算的交易
+        or_(~has_accounts, account_bound),
+        or_(~has_categories, category_bound)
+    ).group_by(Budget.id).all()
+
+    net_spent = {budget_id: 0.0 for budget_id in budget_ids}
+    for row in rows:
+        net_spent[row.id] = (row.total_expense or 0.0) - (row.total_income or 0.0)
+    return net_spent
+
+
+def _budget_sign(item) -> int:
+    """交易對預算淨支出的方向：支出 +1、收入 -1、不計入 0"""
+    if item.exclude_from_budget:
+        return 0
+    if item.transaction_type in DEBIT_TYPES:
+        return 1
+    if item.transaction_type in CREDIT_TYPES:
+        return -1
+    return 0
+
+
+def _write_spent(db: Session, values: Dict[int, float], increment: bool):
+    """依預算 ID 順序寫入 spent，increment 時為原子累加"""
+    if not values:
+        return
+    budgets_table = Budget.__table__
+    new_value = bindparam('b_spent')
+    if increment:
+        # 尚未初始化 (NULL) 的預算維持 NULL，等待完整重算
+        new_value = budgets_table.c.spent + new_value
+    # 固定的更新順序可避免並行寫入時互相鎖死；spent 為衍生資料，不更新 updated_at
+    db.execute(
+        update(budgets_table)
+        .where(budgets_table.c.id == bindparam('b_budget_id'))
+        .values(spent=new_value, updated_at=budgets_table.c.updated_at),
+        [{'b_budget_id': budget_id, 'b_spent': values[budget_id]} for budget_id in sorted(values)]
+    )
+
+
+def apply_budget_spent_changes(db: Session, user_id: int, removed: Iterable = (), added: Iterable = ()) -> List[int]:
+    """
+    依交易異動增量更新預算的 spent
+
+    只載入日期區間涵蓋異動交易的預算及其帳戶/類別綁定，
+    每筆交易計入所有符合的預算，最後以一次批次 UPDATE 累加差額。
+
+    Args:
+        removed: 被刪除或修改前的交易快照
+        added: 新增或修改後的交易
+
+    Returns:
+        spent 有變動的預算 ID
+    """
+    # 交易時間轉為台北時間，與預算的日期 (台北時間) 比較
+    changes = []
+    for items, direction in ((removed, -1), (added, 1)):
+        for item in items:
+            sign = _budget_sign(item) * direction
+            if sign:
+                changes.append((item, to_taipei_time(item.transaction_date), sign))
+    if not changes:
+        return []
+
+    first = min(local_dt for _, local_dt, _ in changes).replace(tzinfo=None)
+    last = max(local_dt for _, local_dt, _ in changes).replace(tzinfo=None)
+
+    budgets = db.query(Budget.id, Budget.start_date, Budget.end_date).filter(
+        Budget.user_id == user_id,
+        Budget.start_date <= last,
+        Budget.end_date >= first
+    ).all()
+    if not budgets:
+        return []
+
+    budget_ids = [b.id for b in budgets]
+    accounts = defaultdict(set)
+    categories = defaultdict(set)
+    for budget_id, account_id in db.query(
+        BudgetAccount.budget_id, BudgetAccount.account_id
+    ).filter(BudgetAccount.budget_id.in_(budget_ids)):
+        accounts[budget_id].add(account_id)
+    for budget_id, category_name in db.query(
+        BudgetCategory.budget_id, BudgetCategory.category_name
+    ).filter(BudgetCategory.budget_id.in_(budget_ids)):
+        categories[budget_id].add(category_name)
+
+    deltas = defaultdict(float)
+    for b in budgets:
+        start = TAIPEI_TZ.localize(b.start_date)
+        end = TAIPEI_TZ.localize(b.end_date)
+        for item, local_dt, sign in changes:
+            if not start <= local_dt <= end:
+                continue
+            if accounts[b.id] and item.account_id not in accounts[b.id]:
+                continue
+            if categories[b.id] and item.category not in categories[b.id]:
+                continue
+            deltas[b.id] += sign * item.amount
+
+    deltas = {budget_id: delta for budget_id, delta in deltas.items() if delta}
+    _write_spent(db, deltas, increment=True)
+    return sorted(deltas)
+
+
+def recompute_budgets_spent(db: Session, budget_ids: Iterable[int]) -> Dict[int, float]:
+    """
+    以完整重算覆寫預算的 spent，用於預算日期或綁定變更後
+
+    Returns:
+        {budget_id: net_spent}
+    """
+    db.flush()
+    net_spent = calculate_budgets_net_spent(db, budget_ids)
+    _write_spent(db, net_spent, increment=False)
+    return net_spent
+
+
+def recompute_user_budgets_spent(db: Session, user_id: int) -> Dict[int, float]:
+    """重新計算使用者所有預算的 spent (批次刪除/匯入等無法逐筆追蹤的操作後使用)"""
+    db.flush()
+    budget_ids = [budget_id for (budget_id,) in db.query(Budget.id).filter(Budget.user_id == user_id)]
+    return recompute_budgets_spent(db, budget_ids)
+
+
+def ensure_budgets_spent_initialized(db: Session, batch_size: int = SPENT_CHECK_BATCH_SIZE) -> int:
+    """
+    重算尚未初始化 (spent 為 NULL) 的預算，例如首次部署後；其餘預算不重算
+
+    Returns:
+        重算的預算數
+    """
+    budget_ids = [budget_id for (budget_id,) in db.query(Budget.id).filter(Budget.spent == None).order_by(Budget.id)]
+    for offset in range(0, len(budget_ids), batch_size):
+        recompute_budgets_spent(db, budget_ids[offset:offset + batch_size])
+        db.commit()
+    if budget_ids:
+        logger.info(f"Initialized spent for {len(budget_ids)} budgets")
+    return len(budget_ids)
+
+
+def check_budgets_spent(db: Session, user_id: Optional[int] = None, repair: bool = False,
+                        batch_size: int = SPENT_CHECK_BATCH_SIZE) -> List[dict]:
+    """
+    比對 budgets.spent 與完整重算的結果
+
+    Args:
+        user_id: 只檢查指定使用者，None 表示全部預算
+        repair: 是否將有誤差的預算改寫為重算結果 (每批各自提交)
+
+    Returns:
+        有誤差的預算清單 [{"budget_id", "user_id", "stored", "expected"}]
+    """
+    query = db.query(Budget.id, Budget.user_id, Budget.spent).order_by(Budget.id)
+    if user_id is not None:
+        query = query.filter(Budget.user_id == user_id)
+    budgets = query.all()
+
+    drifts = []
+    for offset in range(0, len(budgets), batch_size):
+        batch = budgets[offset:offset + batch_size]
+        expected = calculate_budgets_net_spent(db, [b.id for b in batch])
+        batch_drifts = [
+            {"budget_id": b.id, "user_id": b.user_id, "stored": b.spent, "expected": expected[b.id]}
+            for b in batch
+            if b.spent is None or abs(b.spent - expected[b.id]) > SPENT_TOLERANCE
+        ]
+        if repair and batch_drifts:
+            _write_spent(db, {d["budget_id"]: d["expected"] for d in batch_drifts}, increment=False)
+            db.commit()
+        drifts.extend(batch_drifts)
+
+    if drifts:
+        logger.warning(f"Found {len(drifts)} budgets with spent drift" + (" (repaired)" if repair else ""))
+    return drifts
@@ -4,95 +4,153 @@ Budget statistics calculator service
 """
 
 from datetime import datetime, timedelta, date
-from typing import List
+from typing import Dict, Iterable, List, Optional
 from sqlalchemy import func, case
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
+import logging
 import pytz
 
 from app.models.budget import Budget
-from app.models.transaction import Transaction
-from app.models.account import Account
 from app.models.budget_category import BudgetCategory
+from app.models.budget_daily_stat import BudgetDailyStat
+from app.models.transaction_daily_rollup import TransactionDailyRollup
+from app.services.data_version import bump_data_version
+from app.services.transaction_rollup import CREDIT_TYPES, DEBIT_TYPES
+
+logger = logging.getLogger(__name__)
 
 # Taipei timezone
 TAIPEI_TZ = pytz.timezone('Asia/Taipei')
 
+# 每日排程每處理幾個預算提交一次
+STATS_COMMIT_BATCH_SIZE = 100
+
 
-def calculate_daily_spent(
+def calculate_daily_spent_by_date(
     db: Session,
     budget: Budget,
-    target_date: date,
+    start_date: date,
+    end_date: date,
     category_names: List[str] = None
-) -> float:
-    """計算指定日期的淨支出金額（支出 - 收入）
+) -> Dict[date, float]:
+    """以一次查詢計算區間內每日的淨支出金額（支出 - 收入）
+
+    由每日彙總表依台北日期分組加總，沒有交易的日期不會出現在結果中。
 
     Args:
         db: Database session
         budget: Budget object
-        target_date: 目標日期
+        start_date: 起始日期（含）
+        end_date: 結束日期（含）
         category_names: 類別名稱列表（可選）
 
     Returns:
-        該日的淨支出金額
+        {日期: 淨支出金額}
     """
-    # 獲取預算綁定的帳戶ID列表
     account_ids = [acc.id for acc in budget.accounts]
 
-    # 設置日期範圍：從當天 00:00:00 到 23:59:59
-    start_datetime = datetime.combine(target_date, datetime.min.time())
-    end_datetime = datetime.combine(target_date, datetime.max.time())
-
-    # 轉換為 UTC（資料庫儲存為 UTC）
-    start_datetime = TAIPEI_TZ.localize(start_datetime).astimezone(pytz.UTC)
-    end_datetime = TAIPEI_TZ.localize(end_datetime).astimezone(pytz.UTC)
+    amount = TransactionDailyRollup.total_amount
+    transaction_type = TransactionDailyRollup.transaction_type
+    net_spent = (
+        func.sum(case((transaction_type.in_(DEBIT_TYPES), amount), else_=0))
+        - func.sum(case((transaction_type.in_(CREDIT_TYPES), amount), else_=0))
+    )
 
-    # 建立基礎查詢 - 使用 case 做條件加總
-    # income: transactions where type is 'credit'
-    # expense: transactions where type is 'debit' or 'installment'
     query = db.query(
-        func.sum(case((Transaction.transaction_type == 'credit', Transaction.amount), else_=0)).label('total_income'),
-        func.sum(case((Transaction.transaction_type.in_(['debit', 'installment']), Transaction.amount), else_=0)).label('total_expense')
+        TransactionDailyRollup.local_date,
+        net_spent.label('net_spent')
     ).filter(
-        Transaction.transaction_date >= start_datetime,
-        Transaction.transaction_date <= end_datetime,
-        Transaction.exclude_from_budget == False
+        TransactionDailyRollup.user_id == budget.user_id,
+        TransactionDailyRollup.local_date >= start_date,
+        TransactionDailyRollup.local_date <= end_date,
+        TransactionDailyRollup.exclude_from_budget == False,
+        transaction_type.in_(CREDIT_TYPES + DEBIT_TYPES)
     )
 
-    # 如果有綁定帳戶，只計算這些帳戶的交易
+    # 如果有綁定帳戶，只計算這些帳戶的交易；否則計算該使用者所有帳戶
     if account_ids:
-        query = query.filter(Transaction.account_id.in_(account_ids))
-    else:
-        # 沒有綁定帳戶，計算該使用者所有帳戶的交易
-        user_account_ids = db.query(Account.id).filter(
-            Account.user_id == budget.user_id
-        ).all()
-        user_account_ids = [acc_id[0] for acc_id in user_account_ids]
-        query = query.filter(Transaction.account_id.in_(user_account_ids))
+        query = query.filter(TransactionDailyRollup.account_id.in_(account_ids))
 
     # 如果有指定類別列表且不為空，則只計算這些類別的交易
     if category_names and len(category_names) > 0:
-        query = query.filter(Transaction.category.in_(category_names))
+        query = query.filter(TransactionDailyRollup.category.in_(category_names))
 
-    result = query.first()
-    
-    total_income = result.total_income or 0.0
-    total_expense = result.total_expense or 0.0
-    
-    spent = total_expense - total_income
-    
-    return spent
+    rows = query.group_by(TransactionDailyRollup.local_date).all()
+    return {row.local_date: row.net_spent or 0.0 for row in rows}
 
 
-def calculate_budget_stats(db: Session, budget: Budget) -> tuple:
-    """計算預算的統計資訊
+def _get_stats_range(budget: Budget) -> tuple:
+    """取得預算統計的日期範圍 (start_date, end_date, last_date)
+
+    只統計已經過去的日期（不包含今天及未來），last_date 為最後一個要統計的日期
+    """
+    today = datetime.now(TAIPEI_TZ).date()
+    start_date = budget.start_date.astimezone(TAIPEI_TZ).date()
+    end_date = budget.end_date.astimezone(TAIPEI_TZ).date()
+    last_date = min(today - timedelta(days=1), end_date)
+    return start_date, end_date, last_date
+
+
+def _get_daily_limit(budget: Budget, start_date: date, end_date: date) -> float:
+    """計算用於判斷超支的每日預算限額"""
+    if budget.daily_limit_mode == 'manual':
+        # Manual 模式：使用用戶設定的 daily_limit
+        return budget.daily_limit or 0
+
+    # Auto 模式：使用平均值（總預算 / 總天數）
+    total_days = (end_date - start_date).days + 1
+    return budget.amount / total_days if total_days > 0 else 0
+
+
+def refresh_budget_daily_stats(db: Session, budget: Budget, incremental: bool = False) -> int:
+    """重新計算預算的每日淨支出並寫入 budget_daily_stats
 
     Args:
         db: Database session
         budget: Budget object
+        incremental: True 時只計算尚未統計的新日期與被標記為 dirty 的日期，
+                     False 時重新計算整個預算期間
 
     Returns:
-        (over_budget_days, within_budget_days) tuple
+        重新計算的天數
     """
+    start_date, _, last_date = _get_stats_range(budget)
+
+    # 清除期間外的資料（預算日期可能已修改）
+    stale_query = db.query(BudgetDailyStat).filter(BudgetDailyStat.budget_id == budget.id)
+    if start_date <= last_date:
+        stale_query = stale_query.filter(
+            (BudgetDailyStat.stat_date < start_date) | (BudgetDailyStat.stat_date > last_date)
+        )
+    stale_query.delete(synchronize_session=False)
+
+    # 如果預算還未開始，沒有需要統計的日期
+    if start_date > last_date:
+        return 0
+
+    if incremental:
+        watermark, = db.query(func.max(BudgetDailyStat.stat_date)).filter(
+            BudgetDailyStat.budget_id == budget.id
+        ).one()
+        dirty_dates = [
+            stat_date for stat_date, in db.query(BudgetDailyStat.stat_date).filter(
+                BudgetDailyStat.budget_id == budget.id,
+                BudgetDailyStat.is_dirty == True
+            )
+        ]
+        first_new_date = watermark + timedelta(days=1) if watermark else start_date
+    else:
+        dirty_dates = []
+        first_new_date = start_date
+
+    dates = sorted(set(dirty_dates) | {
+        first_new_date + timedelta(days=offset)
+        for offset in range((last_date - first_new_date).days + 1)
+    })
+    if not dates:
+        return 0
+
     # 獲取綁定的類別名稱列表
     category_names = list(set([
         bc.category_name
@@ -101,110 +159,184 @@ def calculate_budget_stats(db: Session, budget: Budget) -> tuple:
         ).all()
     ]))
 
-    # 計算日期範圍
-    today = datetime.now(TAIPEI_TZ).date()
-    start_date = budget.start_date.astimezone(TAIPEI_TZ).date()
-    end_date = budget.end_date.astimezone(TAIPEI_TZ).date()
+    # 一次取得所有日期的支出，沒有交易的日期支出為 0
+    daily_spent_by_date = calculate_daily_spent_by_date(
+        db,
+        budget,
+        dates[0],
+        dates[-1],
+        category_names
+    )
 
-    # 只統計已經過去的日期（不包含今天及未來）
-    last_date = min(today - timedelta(days=1), end_date)
+    rows = [
+        dict(
+            budget_id=budget.id,
+            stat_date=stat_date,
+            net_spent=daily_spent_by_date.get(stat_date, 0.0),
+            is_dirty=False,
+        )
+        for stat_date in dates
+    ]
+    stmt = pg_insert(BudgetDailyStat)
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_budget_daily_stats_budget_date",
+        set_={"net_spent": stmt.excluded.net_spent, "is_dirty": False}
+    )
+    db.execute(stmt, rows)
 
-    # 如果預算還未開始，或已結束很久，返回 (0, 0)
-    if start_date > last_date:
-        return (0, 0)
+    return len(dates)
 
-    # 計算總天數（用於 auto 模式的平均計算）
-    total_days = (end_date - start_date).days + 1
 
-    # 計算每日預算限額
-    if budget.daily_limit_mode == 'manual':
-        # Manual 模式：使用用戶設定的 daily_limit
-        daily_limit = budget.daily_limit or 0
-    else:
-        # Auto 模式：使用平均值（總預算 / 總天數）
-        daily_limit = budget.amount / total_days if total_days > 0 else 0
-
-    # 初始化計數器
-    over_budget_days = 0
-    within_budget_days = 0
-
-    # 遍歷每一天進行統計
-    current_date = start_date
-    while current_date <= last_date:
-        # 計算該天的支出
-        daily_spent = calculate_daily_spent(
-            db,
-            budget,
-            current_date,
-            category_names
-        )
+def count_budget_days(db: Session, budget: Budget) -> tuple:
+    """依 budget_daily_stats 統計超支天數與預算內天數
 
-        # 判斷是否超支
-        if daily_spent > daily_limit:
-            over_budget_days += 1
-        else:
-            within_budget_days += 1
+    每日限額在查詢時才套用，修改預算金額或每日限額不需要重新計算每日支出
 
-        # 移動到下一天
-        current_date += timedelta(days=1)
+    Returns:
+        (over_budget_days, within_budget_days) tuple
+    """
+    start_date, end_date, last_date = _get_stats_range(budget)
+    if start_date > last_date:
+        return (0, 0)
+
+    daily_limit = _get_daily_limit(budget, start_date, end_date)
+    over_budget_days, within_budget_days = db.query(
+        func.count(case((BudgetDailyStat.net_spent > daily_limit, 1))),
+        func.count(case((BudgetDailyStat.net_spent <= daily_limit, 1)))
+    ).filter(
+        BudgetDailyStat.budget_id == budget.id,
+        BudgetDailyStat.stat_date >= start_date,
+        BudgetDailyStat.stat_date <= last_date
+    ).one()
 
     return (over_budget_days, within_budget_days)
 
 
-def update_budget_stats(db: Session, budget: Budget) -> Budget:
-    """更新預算的統計資訊並保存到資料庫
+def calculate_budget_stats(db: Session, budget: Budget, incremental: bool = False) -> tuple:
+    """計算預算的統計資訊
+
+    會先更新 budget_daily_stats 中需要重新計算的日期
 
     Args:
         db: Database session
         budget: Budget object
+        incremental: 是否只計算新日期與 dirty 日期
 
     Returns:
-        Updated Budget object
+        (over_budget_days, within_budget_days) tuple
     """
-    over_budget_days, within_budget_days = calculate_budget_stats(db, budget)
+    refresh_budget_daily_stats(db, budget, incremental=incremental)
+    return count_budget_days(db, budget)
 
+
+def apply_budget_stats(budget: Budget, over_budget_days: int, within_budget_days: int):
+    """將統計結果寫入預算物件 (不 commit，由呼叫端決定交易範圍)"""
     budget.over_budget_days = over_budget_days
     budget.within_budget_days = within_budget_days
     budget.last_stats_update = datetime.now(pytz.UTC)
 
+
+def update_budget_stats(db: Session, budget: Budget) -> Budget:
+    """重新計算預算整個期間的統計資訊並保存到資料庫
+
+    用於建立/修改預算、手動重新計算與匯入
+
+    Args:
+        db: Database session
+        budget: Budget object
+
+    Returns:
+        Updated Budget object
+    """
+    over_budget_days, within_budget_days = calculate_budget_stats(db, budget)
+    apply_budget_stats(budget, over_budget_days, within_budget_days)
+    bump_data_version(db, budget.user_id)
+
     db.commit()
     db.refresh(budget)
 
     return budget
 
 
-def update_all_active_budgets_stats(db: Session) -> int:
-    """更新所有活躍預算的統計資訊
+def mark_budget_days_dirty(db: Session, user_id: int, dates: Optional[Iterable[date]] = None):
+    """將使用者預算在指定日期的每日統計標記為需要重新計算
+
+    只影響已統計過的日期；今天及未來的日期尚未統計，不需要標記。
 
-    用於定時任務，每日更新所有預算的統計
+    Args:
+        db: Database session
+        user_id: 使用者 ID
+        dates: 台北時間日期，None 表示全部日期
+    """
+    query = db.query(BudgetDailyStat).filter(
+        BudgetDailyStat.budget_id.in_(
+            db.query(Budget.id).filter(Budget.user_id == user_id).scalar_subquery()
+        ),
+        BudgetDailyStat.is_dirty == False
+    )
+    if dates is not None:
+        today = datetime.now(TAIPEI_TZ).date()
+        dates = sorted({d for d in dates if d < today})
+        if not dates:
+            return
+        query = query.filter(BudgetDailyStat.stat_date.in_(dates))
+
+    query.update({BudgetDailyStat.is_dirty: True}, synchronize_session=False)
+
+
+def update_all_active_budgets_stats(db: Session, batch_size: int = STATS_COMMIT_BATCH_SIZE) -> dict:
+    """增量更新預算的統計資訊
+
+    用於定時任務，每日執行。每個預算只重新計算上次統計之後新經過的日期，
+    以及因補登/修改過去交易而被標記為 dirty 的日期，並以批次提交。
 
     Args:
         db: Database session
+        batch_size: 每處理幾個預算提交一次
 
     Returns:
-        更新的預算數量
+        {"budgets": 檢查的預算數, "updated_budgets": 有重新計算的預算數, "days": 重新計算的天數}
     """
     from sqlalchemy.orm import joinedload
 
     today = datetime.now(TAIPEI_TZ).date()
-    today_datetime = TAIPEI_TZ.localize(
-        datetime.combine(today, datetime.min.time())
+    yesterday_datetime = TAIPEI_TZ.localize(
+        datetime.combine(today - timedelta(days=1), datetime.min.time())
     ).astimezone(pytz.UTC)
 
-    # 查詢所有活躍的預算（結束日期 >= 今天）
-    active_budgets = db.query(Budget).options(
+    # 查詢需要更新的預算：尚未結束 (含昨天結束，最後一天才剛經過)，或有 dirty 日期
+    has_dirty_days = db.query(BudgetDailyStat.id).filter(
+        BudgetDailyStat.budget_id == Budget.id,
+        BudgetDailyStat.is_dirty == True
+    ).exists()
+    budgets = db.query(Budget).options(
         joinedload(Budget.accounts)
     ).filter(
-        Budget.end_date >= today_datetime
-    ).all()
+        (Budget.end_date >= yesterday_datetime) | has_dirty_days
+    ).order_by(Budget.id).all()
 
-    updated_count = 0
-    for budget in active_budgets:
+    updated_budgets = 0
+    updated_days = 0
+    touched_user_ids = set()
+    for index, budget in enumerate(budgets, start=1):
         try:
-            update_budget_stats(db, budget)
-            updated_count += 1
+            with db.begin_nested():
+                days = refresh_budget_daily_stats(db, budget, incremental=True)
+                if days:
+                    apply_budget_stats(budget, *count_budget_days(db, budget))
         except Exception as e:
-            print(f"Failed to update stats for budget {budget.id}: {str(e)}")
+            logger.error(f"Failed to update stats for budget {budget.id}: {str(e)}")
             continue
 
-    return updated_count
+        if days:
+            updated_budgets += 1
+            updated_days += days
+            touched_user_ids.add(budget.user_id)
+
+        if index % batch_size == 0 or index == len(budgets):
+            for user_id in touched_user_ids:
+                bump_data_version(db, user_id)
+            touched_user_ids.clear()
+            db.commit()
+
+    return {"budgets": len(budgets), "updated_budgets": updated_budgets, "days": updated_days}
@@ -0,0 +1,209 @@
+"""
+使用者資料異動紀錄 (增量同步)
+
+交易、帳戶、預算與類別的每次寫入都以 record_changes 記錄異動的實體，
+序號 (seq) 與 users.data_version 共用：record_changes 遞增資料版本後，
+以遞增後的版本號依序分配給本次的異動。遞增 users 的 UPDATE 會鎖住使用者的資料列
+直到提交，因此同一使用者已提交的序號不會再出現更小的值，用戶端可安全地以
+最後讀到的序號作為游標。
+
+- 新增與修改記錄為 op='upsert'，刪除保留 op='delete' 的墓碑
+- 批次匯入、清除資料等無法逐筆追蹤的操作記錄 RESET (entity_type='all')，
+  用戶端讀到後需重新下載完整資料；RESET 之前的紀錄已無用途，記錄時一併刪除
+
+    record_changes(db, user_id, [Change('category', category.id, 'upsert')])
+
+get_changes 讀取游標之後的異動，同一頁內同一實體只保留最後一筆，
+並附上實體目前的內容 (與匯出檔相同的欄位，另含資料庫 ID)。
+"""
+from collections import namedtuple
+from typing import Iterable, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.encryption import decrypt_many
+from app.models.account import Account
+from app.models.budget import Budget
+from app.models.budget_account import BudgetAccount
+from app.models.budget_category import BudgetCategory
+from app.models.category import Category
+from app.models.change_log import ChangeLog
+from app.models.transaction import Transaction
+from app.services.data_export import account_record, budget_record, category_record, transaction_record
+from app.services.data_version import bump_data_version
+
+# 每頁最多回傳的異動筆數
+CHANGE_FEED_DEFAULT_LIMIT = 500
+CHANGE_FEED_MAX_LIMIT = 1000
+
+Change = namedtuple("Change", ["entity_type", "entity_id", "op"])
+
+RESET = Change("all", None, "reset")
+
+
+def upserts(entity_type: str, entity_ids: Iterable[int]) -> List[Change]:
+    return [Change(entity_type, entity_id, "upsert") for entity_id in entity_ids]
+
+
+def deletes(entity_type: str, entity_ids: Iterable[int]) -> List[Change]:
+    return [Change(entity_type, entity_id, "delete") for entity_id in entity_ids]
+
+
+def record_changes(db: Session, user_id: int, changes: Iterable[Change]) -> int:
+    """
+    遞增使用者的資料版本並記錄異動，不提交
+
+    沒有異動時只遞增資料版本。新建立的實體需先 flush 取得 ID。
+
+    Returns:
+        遞增後的資料版本 (即最後一筆異動的序號)
+    """
+    changes = list(dict.fromkeys(changes))  # 去除重複並保留順序
+    version = bump_data_version(db, user_id, max(len(changes), 1))
+    if not changes:
+        return version
+
+    first_seq = version - len(changes) + 1
+    reset_seqs = [first_seq + i for i, change in enumerate(changes) if change == RESET]
+    if reset_seqs:
+        db.query(ChangeLog).filter(
+            ChangeLog.user_id == user_id, ChangeLog.seq < reset_seqs[-1]
+        ).delete(synchronize_session=False)
+        changes = changes[reset_seqs[-1] - first_seq:]
+        first_seq = reset_seqs[-1]
+
+    # 以陣列參數一次寫入，筆數多時 (如刪除帳戶的所有交易) 不需逐列 executemany
+    db.execute(text(
+        "INSERT INTO change_log (user_id, seq, entity_type, entity_id, op) "
+        "SELECT :user_id, c.seq, c.entity_type, c.entity_id, c.op FROM unnest("
+        "CAST(:seqs AS integer[]), CAST(:entity_types AS varchar[]), "
+        "CAST(:entity_ids AS integer[]), CAST(:ops AS varchar[])"
+        ") AS c(seq, entity_type, entity_id, op)"
+    ), {
+        "user_id": user_id,
+        "seqs": list(range(first_seq, first_seq + len(changes))),
+        "entity_types": [change.entity_type for change in changes],
+        "entity_ids": [change.entity_id for change in changes],
+        "ops": [change.op for change in changes],
+    })
+    return version
+
+
+def _load_transactions(db: Session, user_id: int, ids: List[int]) -> dict:
+    transactions = Transaction.__table__
+    rows = db.execute(
+        transactions.select().join(Account.__table__, transactions.c.account_id == Account.id).where(
+            transactions.c.id.in_(ids), Account.user_id == user_id
+        )
+    ).all()
+    descriptions = decrypt_many(row.description for row in rows)
+    notes = decrypt_many(row.note for row in rows)
+    return {
+        row.id: {
+            "id": row.id,
+            "account_id": row.account_id,
+            "transfer_pair_id": row.transfer_pair_id,
+            **transaction_record(row, description, note)
+        }
+        for row, description, note in zip(rows, descriptions, notes)
+    }
+
+
+def _load_accounts(db: Session, user_id: int, ids: List[int]) -> dict:
+    return {
+        acc.id: {"id": acc.id, **account_record(acc)}
+        for acc in db.query(Account).filter(Account.id.in_(ids), Account.user_id == user_id)
+    }
+
+
+def _load_categories(db: Session, user_id: int, ids: List[int]) -> dict:
+    return {
+        cat.id: {"id": cat.id, **category_record(cat)}
+        for cat in db.query(Category).filter(Category.id.in_(ids), Category.user_id == user_id)
+    }
+
+
+def _load_budgets(db: Session, user_id: int, ids: List[int]) -> dict:
+    budgets = db.query(Budget).filter(Budget.id.in_(ids), Budget.user_id == user_id).all()
+    category_names = {budget.id: [] for budget in budgets}
+    account_ids = {budget.id: [] for budget in budgets}
+    if budgets:
+        for budget_id, category_name in db.query(
+            BudgetCategory.budget_id, BudgetCategory.category_name
+        ).filter(BudgetCategory.budget_id.in_(category_names)).order_by(BudgetCategory.id):
+            category_names[budget_id].append(category_name)
+        for budget_id, account_id in db.query(
+            BudgetAccount.budget_id, BudgetAccount.account_id
+        ).filter(BudgetAccount.budget_id.in_(account_ids)).order_by(BudgetAccount.id):
+            account_ids[budget_id].append(account_id)
+    return {
+        budget.id: {"id": budget.id, **budget_record(budget, category_names[budget.id]), "account_ids": account_ids[budget.id]}
+        for budget in budgets
+    }
+
+
+_LOADERS = {
+    "transaction": _load_transactions,
+    "account": _load_accounts,
+    "category": _load_categories,
+    "budget": _load_budgets,
+}
+
+
+def get_changes(db: Session, user_id: int, since: int, limit: int = CHANGE_FEED_DEFAULT_LIMIT) -> dict:
+    """
+    讀取序號大於 since 的異動
+
+    Returns:
+        {"changes": [...], "cursor": 下一頁的游標, "has_more": 是否還有下一頁, "reset": 是否需要重新下載完整資料}
+    """
+    rows = db.query(ChangeLog.seq, ChangeLog.entity_type, ChangeLog.entity_id, ChangeLog.op).filter(
+        ChangeLog.user_id == user_id, ChangeLog.seq > since
+    ).order_by(ChangeLog.seq).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    cursor = rows[-1].seq if rows else since
+
+    # RESET 之前的異動已被完整資料取代
+    reset = False
+    for i in range(len(rows) - 1, -1, -1):
+        if rows[i].op == "reset":
+            reset = True
+            rows = rows[i + 1:]
+            break
+
+    # 同一實體只保留最後一筆異動
+    latest = {}
+    for row in rows:
+        latest.pop((row.entity_type, row.entity_id), None)
+        latest[(row.entity_type, row.entity_id)] = row
+
+    upsert_ids = {}
+    for row in latest.values():
+        if row.op == "upsert":
+            upsert_ids.setdefault(row.entity_type, []).append(row.entity_id)
+    data = {
+        entity_type: _LOADERS[entity_type](db, user_id, ids)
+        for entity_type, ids in upsert_ids.items()
+        if entity_type in _LOADERS
+    }
+
+    changes = []
+    for row in latest.values():
+        record: Optional[dict] = None
+        op = row.op
+        if op == "upsert":
+            record = data.get(row.entity_type, {}).get(row.entity_id)
+            if record is None:
+                # 實體已在之後的異動中刪除，墓碑會出現在後續頁面
+                op = "delete"
+        changes.append({
+            "seq": row.seq,
+            "entity_type": row.entity_type,
+            "entity_id": row.entity_id,
+            "op": op,
+            "data": record
+        })
+
+    return {"changes": changes, "cursor": cursor, "has_more": has_more, "reset": reset}
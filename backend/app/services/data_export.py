@@ -0,0 +1,307 @@
+"""
+使用者資料的串流匯出與讀取
+
+匯出檔格式 (版本 2.0)：
+
+    EXPORT_MAGIC
+    frame*    每個 frame = 4 bytes 長度 (big-endian) + encrypt_chunk(區塊)
+
+區塊內容串接後為 gzip 壓縮的 NDJSON，每行一筆記錄，以 "type" 區分：
+header、account、category、budget、transaction。每個 frame 的 associated data
+包含序號與是否為最後一個 frame，順序錯亂或檔案被截斷都無法解密。
+
+匯出時交易以伺服器端游標分批讀取、分批解密，逐行序列化、壓縮與加密，
+記憶體用量與資料量無關。read_export 將檔案還原為與舊版 JSON 匯出相同結構的 dict，
+匯入流程可同時處理新舊兩種格式。
+"""
+import json
+import logging
+import struct
+import zlib
+from collections import defaultdict
+from datetime import datetime
+from typing import Iterator, List
+
+from sqlalchemy import select
+
+from app.core.database import SessionLocal
+from app.core.encryption import decrypt_chunk, decrypt_many, encrypt_chunk
+from app.models.account import Account
+from app.models.budget import Budget
+from app.models.budget_account import BudgetAccount
+from app.models.budget_category import BudgetCategory
+from app.models.category import Category
+from app.models.transaction import Transaction
+from app.services.budget_spent import clamp_spent
+from app.services.data_version import get_data_version
+
+logger = logging.getLogger(__name__)
+
+EXPORT_MAGIC = b"ACCTEXP2"
+EXPORT_FORMAT_VERSION = "2.0"
+EXPORT_FILE_EXTENSION = ".acctx"
+
+# 每個 frame 的壓縮資料大小上限
+EXPORT_FRAME_SIZE = 64 * 1024
+
+# 每次從游標讀取並解密的交易筆數
+EXPORT_BATCH_SIZE = 1000
+
+_LENGTH = struct.Struct(">I")
+_FRAME_AAD = struct.Struct(">QB")
+
+# NDJSON 記錄類型對應到舊版匯出格式的清單欄位
+_RECORD_LISTS = {
+    "account": "accounts",
+    "category": "categories",
+    "budget": "budgets",
+    "transaction": "transactions",
+}
+
+
+def _frame_aad(index: int, final: bool) -> bytes:
+    return EXPORT_MAGIC + _FRAME_AAD.pack(index, final)
+
+
+class _FrameWriter:
+    """將資料串流壓縮後切成固定大小的加密 frame"""
+
+    def __init__(self):
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip 格式
+        self._buffer = bytearray()
+        self._index = 0
+
+    def _frame(self, data: bytes, final: bool) -> bytes:
+        sealed = encrypt_chunk(data, _frame_aad(self._index, final))
+        self._index += 1
+        return _LENGTH.pack(len(sealed)) + sealed
+
+    def _drain(self, keep_last: bool) -> List[bytes]:
+        frames = []
+        while len(self._buffer) > EXPORT_FRAME_SIZE or (not keep_last and len(self._buffer) == EXPORT_FRAME_SIZE):
+            frames.append(self._frame(bytes(self._buffer[:EXPORT_FRAME_SIZE]), final=False))
+            del self._buffer[:EXPORT_FRAME_SIZE]
+        return frames
+
+    def write(self, data: bytes) -> List[bytes]:
+        self._buffer += self._compressor.compress(data)
+        return self._drain(keep_last=False)
+
+    def close(self) -> List[bytes]:
+        """輸出剩餘資料，最後一個 frame 標記為結尾"""
+        self._buffer += self._compressor.flush()
+        frames = self._drain(keep_last=True)
+        frames.append(self._frame(bytes(self._buffer), final=True))
+        self._buffer.clear()
+        return frames
+
+
+def _line(record_type: str, record: dict) -> bytes:
+    return json.dumps({"type": record_type, **record}, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def account_record(acc: Account) -> dict:
+    return {
+        "name": acc.name,
+        "account_type": acc.account_type,
+        "balance": float(acc.balance),
+        "currency": acc.currency,
+        "description": acc.description,
+        "created_at": _isoformat(acc.created_at)
+    }
+
+
+def category_record(cat: Category) -> dict:
+    return {
+        "name": cat.name,
+        "order_index": cat.order_index,
+        "created_at": _isoformat(cat.created_at)
+    }
+
+
+def budget_record(budget: Budget, category_names: List[str]) -> dict:
+    return {
+        "name": budget.name,
+        "category_names": category_names,
+        "amount": float(budget.amount),
+        "daily_limit": float(budget.daily_limit) if budget.daily_limit else None,
+        "daily_limit_mode": budget.daily_limit_mode,
+        "spent": clamp_spent(budget.spent),
+        "range_mode": budget.range_mode,
+        "period": budget.period,
+        "start_date": _isoformat(budget.start_date),
+        "end_date": _isoformat(budget.end_date),
+        "is_primary": budget.is_primary,
+        "created_at": _isoformat(budget.created_at)
+    }
+
+
+def transaction_record(row, description, note) -> dict:
+    """row 為 transactions 資料表的一列 (欄位名稱與資料表相同)"""
+    return {
+        "description": description,
+        "amount": float(row.amount),
+        "transaction_type": row.transaction_type,
+        "category": row.category,
+        "note": note,
+        "foreign_amount": float(row.foreign_amount) if row.foreign_amount else None,
+        "foreign_currency": row.foreign_currency,
+        "transaction_date": _isoformat(row.transaction_date),
+        "is_installment": row.is_installment,
+        "installment_group_id": row.installment_group_id,
+        "installment_number": row.installment_number,
+        "total_installments": row.total_installments,
+        "total_amount": float(row.total_amount) if row.total_amount else None,
+        "remaining_amount": float(row.remaining_amount) if row.remaining_amount else None,
+        "exclude_from_budget": row.exclude_from_budget,
+        "created_at": _isoformat(row.created_at)
+    }
+
+
+def _iter_records(db, user_id: int, username: str) -> Iterator[bytes]:
+    """依序產生匯出檔的 NDJSON 行"""
+    # 匯出前的資料版本，之後的異動可由增量同步 (since=cursor) 取得
+    yield _line("header", {
+        "version": EXPORT_FORMAT_VERSION,
+        "exported_at": datetime.now().isoformat(),
+        "cursor": get_data_version(db, user_id),
+        "user": {"username": username}
+    })
+
+    accounts = db.query(Account).filter(Account.user_id == user_id).order_by(Account.id).all()
+    # 帳戶 ID 映射（舊 ID -> 匯出索引）
+    account_id_map = {acc.id: idx for idx, acc in enumerate(accounts)}
+    for acc in accounts:
+        yield _line("account", {"index": account_id_map[acc.id], **account_record(acc)})
+
+    for cat in db.query(Category).filter(Category.user_id == user_id).order_by(Category.order_index):
+        yield _line("category", category_record(cat))
+
+    # 預算的類別與帳戶綁定各以一次查詢載入
+    budgets = db.query(Budget).filter(Budget.user_id == user_id).order_by(Budget.id).all()
+    budget_ids = [b.id for b in budgets]
+    category_names = defaultdict(list)
+    account_indices = defaultdict(list)
+    if budget_ids:
+        for budget_id, category_name in db.query(
+            BudgetCategory.budget_id, BudgetCategory.category_name
+        ).filter(BudgetCategory.budget_id.in_(budget_ids)).order_by(BudgetCategory.id):
+            category_names[budget_id].append(category_name)
+        for budget_id, account_id in db.query(
+            BudgetAccount.budget_id, BudgetAccount.account_id
+        ).filter(BudgetAccount.budget_id.in_(budget_ids)).order_by(BudgetAccount.id):
+            if account_id in account_id_map:
+                account_indices[budget_id].append(account_id_map[account_id])
+    for budget in budgets:
+        yield _line("budget", {
+            **budget_record(budget, category_names[budget.id]),
+            "account_indices": account_indices[budget.id]
+        })
+
+    if not account_id_map:
+        return
+
+    # 交易以伺服器端游標分批讀取，敘述與備註逐批解密 (不寫入解密快取)
+    transactions = Transaction.__table__
+    query = select(transactions).where(
+        transactions.c.account_id.in_(list(account_id_map))
+    ).order_by(transactions.c.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    for rows in db.execute(query).partitions():
+        descriptions = decrypt_many((row.description for row in rows), use_cache=False)
+        notes = decrypt_many((row.note for row in rows), use_cache=False)
+        for row, description, note in zip(rows, descriptions, notes):
+            yield _line("transaction", {
+                "account_index": account_id_map[row.account_id],
+                **transaction_record(row, description, note)
+            })
+
+
+def iter_export(user_id: int, username: str) -> Iterator[bytes]:
+    """
+    產生使用者資料的加密匯出檔內容，供 StreamingResponse 使用
+
+    使用獨立的資料庫 session，回應串流期間不依賴請求的 session
+    """
+    db = SessionLocal()
+    try:
+        writer = _FrameWriter()
+        yield EXPORT_MAGIC
+        for line in _iter_records(db, user_id, username):
+            for frame in writer.write(line):
+                yield frame
+        for frame in writer.close():
+            yield frame
+    except Exception as e:
+        # 回應已開始傳送，無法再回傳錯誤狀態；缺少結尾 frame 的檔案無法匯入
+        logger.error(f"Export failed for user {user_id}: {e}")
+        raise
+    finally:
+        db.close()
+
+
+def is_streaming_export(content: bytes) -> bool:
+    return content.startswith(EXPORT_MAGIC)
+
+
+def read_export(content: bytes) -> dict:
+    """
+    解密並解壓縮串流匯出檔，回傳與舊版 JSON 匯出相同結構的 dict
+
+    Raises:
+        ValueError: 檔案不完整、被竄改或不是由此應用程式匯出
+    """
+    if not is_streaming_export(content):
+        raise ValueError("無效的匯出檔案格式")
+
+    data = {list_name: [] for list_name in _RECORD_LISTS.values()}
+    decompressor = zlib.decompressobj(31)
+    pending = b""
+    position = len(EXPORT_MAGIC)
+    index = 0
+    finished = False
+
+    def parse_lines(text: bytes, final: bool) -> bytes:
+        lines = text.split(b"\n")
+        remainder = lines.pop()
+        if final and remainder.strip():
+            lines.append(remainder)
+            remainder = b""
+        for line in lines:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            record_type = record.pop("type", None)
+            if record_type == "header":
+                data.update(record)
+            elif record_type in _RECORD_LISTS:
+                data[_RECORD_LISTS[record_type]].append(record)
+        return remainder
+
+    while not finished:
+        if position + _LENGTH.size > len(content):
+            raise ValueError("匯出檔案不完整")
+        (length,) = _LENGTH.unpack_from(content, position)
+        position += _LENGTH.size
+        if position + length > len(content):
+            raise ValueError("匯出檔案不完整")
+        sealed = content[position:position + length]
+        position += length
+        finished = position == len(content)
+
+        chunk = decrypt_chunk(sealed, _frame_aad(index, finished))
+        index += 1
+        try:
+            text = decompressor.decompress(chunk)
+            if finished:
+                text += decompressor.flush()
+        except zlib.error:
+            raise ValueError("匯出檔案已損壞")
+        pending = parse_lines(pending + text, finished)
+
+    if "version" not in data:
+        raise ValueError("匯出檔案缺少標頭")
+    return data
@@ -0,0 +1,474 @@
+"""
+使用者資料匯入任務
+
+上傳的檔案交給背景執行緒 (最多 IMPORT_MAX_WORKERS 個同時執行) 處理，請求立即回傳任務 ID：
+
+1. 解析檔案 (串流匯出格式或舊版 JSON)
+2. 預先載入使用者現有的帳戶、類別與預算為 dict，比對時不再逐筆查詢
+3. 帳戶：名稱、類型、幣別相同者覆蓋，其餘新增
+4. 交易：覆蓋帳戶的舊交易依 (帳戶, 日期, 敘述盲索引) 與檔案內的交易逐筆配對
+   (相同內容可出現多次)，配對到的交易更新，其餘新增；沒有配對到的舊交易刪除，
+   結果與刪除舊交易後全部重新寫入相同。每 IMPORT_CHUNK_SIZE 筆批次加密後以 executemany 寫入
+5. 類別與預算同樣以 dict 比對覆蓋或新增，預算綁定以批次刪除/寫入
+6. 重建每日彙總與預算已使用金額，整個匯入在同一個資料庫交易中提交
+
+進度以獨立的 session 寫入 import_jobs，匯入失敗時資料全部回復。
+
+用法：
+
+    job = start_import_job(db, user_id)
+    submit_import_job(job.id, content)
+"""
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict, deque
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Set
+
+from sqlalchemy import delete, insert, select, text, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.encryption import blind_index, decrypt_data, encrypt_many
+from app.models.account import Account
+from app.models.budget import Budget
+from app.models.budget_account import BudgetAccount
+from app.models.budget_category import BudgetCategory
+from app.models.category import Category
+from app.models.import_job import ImportJob
+from app.models.transaction import Transaction
+from app.services.budget_stats import apply_budget_stats, calculate_budget_stats
+from app.services.data_export import is_streaming_export, read_export
+from app.services.transaction_sync import resync_user
+
+logger = logging.getLogger(__name__)
+
+# 尚未結束的任務狀態
+UNFINISHED_STATUSES = ("pending", "running")
+
+# 未結束的任務超過此時間沒有進度，視為執行中的行程已中斷
+STALE_JOB_SECONDS = 600
+
+# 配對到舊交易時更新的欄位 (帳戶、日期與敘述為配對條件，沿用原本的值與密文)
+_TRANSACTION_UPDATE_COLUMNS = (
+    "amount", "transaction_type", "category", "note", "foreign_amount", "foreign_currency",
+    "is_installment", "installment_group_id", "installment_number", "total_installments",
+    "total_amount", "remaining_amount", "exclude_from_budget"
+)
+
+# 新增交易時寫入的欄位
+_TRANSACTION_INSERT_COLUMNS = (
+    "account_id", "description", "description_hash", "transaction_date"
+) + _TRANSACTION_UPDATE_COLUMNS + ("is_from_recurring",)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+class ImportJobConflict(Exception):
+    """使用者已有匯入任務在執行中"""
+
+
+def get_import_job(db: Session, user_id: int, job_id: int) -> Optional[ImportJob]:
+    return db.query(ImportJob).filter(ImportJob.id == job_id, ImportJob.user_id == user_id).first()
+
+
+def start_import_job(db: Session, user_id: int) -> ImportJob:
+    """
+    建立匯入任務
+
+    Raises:
+        ImportJobConflict: 使用者已有匯入任務在執行中
+    """
+    stale_before = datetime.now(timezone.utc) - timedelta(seconds=STALE_JOB_SECONDS)
+    active = db.query(ImportJob.id).filter(
+        ImportJob.user_id == user_id,
+        ImportJob.status.in_(UNFINISHED_STATUSES),
+        ImportJob.updated_at >= stale_before
+    ).first()
+    if active is not None:
+        raise ImportJobConflict(f"Import job {active.id} is still running")
+
+    job = ImportJob(user_id=user_id, status="pending", total_transactions=0, processed_transactions=0)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def parse_import_file(content: bytes) -> dict:
+    """
+    解析匯入檔案 (串流匯出格式、舊版加密 JSON 或未加密 JSON)
+
+    Raises:
+        ValueError: 檔案格式錯誤或無法解密
+    """
+    if is_streaming_export(content):
+        import_data = read_export(content)
+    else:
+        try:
+            file_data = json.loads(content)
+        except ValueError:
+            raise ValueError("無效的 JSON 檔案格式")
+
+        # 檢查是否為加密檔案
+        if isinstance(file_data, dict) and file_data.get("encrypted") is True:
+            # 驗證是否為此應用程式匯出的檔案
+            if file_data.get("app") != "accounting_app":
+                raise ValueError("此檔案不是由本應用程式匯出")
+
+            encrypted_data = file_data.get("data")
+            if not encrypted_data:
+                raise ValueError("找不到加密資料")
+            import_data = json.loads(decrypt_data(encrypted_data))
+        else:
+            # 未加密的舊格式檔案（向後相容）
+            import_data = file_data
+
+    # 驗證資料格式
+    if not isinstance(import_data, dict) or "version" not in import_data or "accounts" not in import_data:
+        raise ValueError("無效的匯入檔案格式")
+    return import_data
+
+
+def _update_job(job_id: int, **values):
+    """以獨立的 session 更新任務狀態，不影響匯入本身的資料庫交易"""
+    with SessionLocal() as db:
+        db.execute(update(ImportJob).where(ImportJob.id == job_id).values(**values))
+        db.commit()
+
+
+def _parse_datetime(value) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _import_accounts(db: Session, user_id: int, accounts_data: list, stats: dict):
+    """匯入帳戶，回傳 ({匯出索引: 帳戶 ID}, 覆蓋的既有帳戶 ID)"""
+    existing = {
+        (acc.name, acc.account_type, acc.currency): acc
+        for acc in db.query(Account).filter(Account.user_id == user_id)
+    }
+
+    account_by_index = {}
+    overwritten_ids = set()
+    for acc_data in accounts_data:
+        key = (acc_data["name"], acc_data["account_type"], acc_data.get("currency", "TWD"))
+        account = existing.get(key)
+        if account is not None:
+            # 覆蓋現有帳戶（直接使用匯出時保存的餘額）
+            account.balance = acc_data["balance"]
+            account.description = acc_data.get("description")
+            if account.id is not None:
+                overwritten_ids.add(account.id)
+            stats["accounts_updated"] += 1
+        else:
+            # 新增帳戶（直接使用匯出時保存的餘額）
+            account = Account(
+                user_id=user_id,
+                name=key[0],
+                account_type=key[1],
+                balance=acc_data["balance"],
+                currency=key[2],
+                description=acc_data.get("description")
+            )
+            db.add(account)
+            existing[key] = account
+            stats["accounts_created"] += 1
+        account_by_index[acc_data["index"]] = account
+
+    db.flush()
+    return {index: account.id for index, account in account_by_index.items()}, overwritten_ids
+
+
+def _copy_rows(db: Session, table_name: str, columns, rows):
+    """
+    以 COPY 將 rows (dict) 寫入資料表
+
+    逐列 executemany 的主要成本在用戶端的參數處理，大量寫入時 COPY 快一個數量級
+    """
+    cursor = db.connection().connection.driver_connection.cursor()
+    try:
+        with cursor.copy(f"COPY {table_name} ({', '.join(columns)}) FROM STDIN") as copy:
+            for row in rows:
+                copy.write_row([row[column] for column in columns])
+    finally:
+        cursor.close()
+
+
+def _load_existing_transactions(db: Session, account_ids: Set[int]) -> dict:
+    """載入覆蓋帳戶的舊交易，{(帳戶, 日期, 敘述盲索引): deque(交易 ID)}"""
+    existing = defaultdict(deque)
+    if account_ids:
+        rows = db.execute(
+            select(Transaction.id, Transaction.account_id, Transaction.transaction_date, Transaction.description_hash)
+            .where(Transaction.account_id.in_(account_ids))
+            .order_by(Transaction.id)
+        )
+        for row in rows:
+            existing[(row.account_id, row.transaction_date, row.description_hash)].append(row.id)
+    return existing
+
+
+def _import_transactions(db: Session, job_id: int, transactions_data: list,
+                         account_index_to_id: dict, overwritten_ids: Set[int], stats: dict):
+    """匯入交易：與覆蓋帳戶的舊交易配對更新，其餘批次寫入，未配對的舊交易刪除"""
+    existing = _load_existing_transactions(db, overwritten_ids)
+    new_rows = []
+    updated_rows = []
+    for trans_data in transactions_data:
+        account_id = account_index_to_id.get(trans_data["account_index"])
+        if account_id is None:
+            continue  # 跳過無效的交易
+
+        trans_date = _parse_datetime(trans_data.get("transaction_date")) or datetime.now()
+        description_hash = blind_index(trans_data["description"])
+        row = {
+            "account_id": account_id,
+            "description": trans_data["description"],
+            "description_hash": description_hash,
+            "amount": trans_data["amount"],
+            "transaction_type": trans_data["transaction_type"],
+            "category": trans_data.get("category"),
+            "note": trans_data.get("note"),
+            "foreign_amount": trans_data.get("foreign_amount"),
+            "foreign_currency": trans_data.get("foreign_currency"),
+            "transaction_date": trans_date,
+            "is_installment": trans_data.get("is_installment", False),
+            "installment_group_id": trans_data.get("installment_group_id"),
+            "installment_number": trans_data.get("installment_number"),
+            "total_installments": trans_data.get("total_installments"),
+            "total_amount": trans_data.get("total_amount"),
+            "remaining_amount": trans_data.get("remaining_amount"),
+            "exclude_from_budget": trans_data.get("exclude_from_budget", False),
+            "is_from_recurring": False
+        }
+
+        # 同一帳戶、日期與敘述的舊交易視為同一筆，更新其餘欄位
+        matches = existing.get((account_id, trans_date, description_hash))
+        if matches:
+            row["id"] = matches.popleft()
+            updated_rows.append(row)
+        else:
+            new_rows.append(row)
+
+    stats["transactions_created"] += len(new_rows)
+    stats["transactions_updated"] += len(updated_rows)
+    _update_job(job_id, stage="transactions", total_transactions=len(new_rows) + len(updated_rows))
+
+    transactions_table = Transaction.__table__
+    stale_ids = [transaction_id for ids in existing.values() for transaction_id in ids]
+    chunk_size = settings.IMPORT_CHUNK_SIZE
+    for offset in range(0, len(stale_ids), chunk_size):
+        db.execute(delete(transactions_table).where(
+            transactions_table.c.id.in_(stale_ids[offset:offset + chunk_size])
+        ))
+
+    # 配對到的交易先 COPY 到暫存表，再以一次 UPDATE ... FROM 更新；新交易直接 COPY 寫入
+    if updated_rows:
+        db.execute(text(
+            "CREATE TEMP TABLE import_transaction_updates ON COMMIT DROP AS "
+            f"SELECT id, {', '.join(_TRANSACTION_UPDATE_COLUMNS)} FROM transactions WITH NO DATA"
+        ))
+    processed = 0
+    for rows, is_update in ((updated_rows, True), (new_rows, False)):
+        for offset in range(0, len(rows), chunk_size):
+            chunk = rows[offset:offset + chunk_size]
+            # 批次寫入時 hybrid setter 不會被呼叫，需先自行加密
+            notes = encrypt_many(row["note"] for row in chunk)
+            if is_update:
+                for row, note in zip(chunk, notes):
+                    row["note"] = note
+                _copy_rows(db, "import_transaction_updates", ("id",) + _TRANSACTION_UPDATE_COLUMNS, chunk)
+            else:
+                descriptions = encrypt_many(row["description"] for row in chunk)
+                for row, description, note in zip(chunk, descriptions, notes):
+                    row["description"] = description
+                    row["note"] = note
+                _copy_rows(db, "transactions", _TRANSACTION_INSERT_COLUMNS, chunk)
+            processed += len(chunk)
+            _update_job(job_id, processed_transactions=processed)
+
+    if updated_rows:
+        assignments = ", ".join(f"{column} = u.{column}" for column in _TRANSACTION_UPDATE_COLUMNS)
+        db.execute(text(
+            f"UPDATE transactions AS t SET {assignments}, updated_at = now() "
+            "FROM import_transaction_updates AS u WHERE t.id = u.id"
+        ))
+
+
+def _import_categories(db: Session, user_id: int, categories_data: list, stats: dict):
+    existing = {cat.name: cat for cat in db.query(Category).filter(Category.user_id == user_id)}
+    for cat_data in categories_data:
+        category = existing.get(cat_data["name"])
+        if category is not None:
+            # 覆蓋現有類別
+            category.order_index = cat_data.get("order_index", 0)
+            stats["categories_updated"] += 1
+        else:
+            category = Category(
+                user_id=user_id,
+                name=cat_data["name"],
+                order_index=cat_data.get("order_index", 0)
+            )
+            db.add(category)
+            existing[category.name] = category
+            stats["categories_created"] += 1
+
+
+def _import_budgets(db: Session, user_id: int, budgets_data: list,
+                    account_index_to_id: dict, stats: dict) -> list:
+    """匯入預算與綁定，回傳匯入的預算"""
+    # 以名稱與時間範圍比對 (避免週期預算被誤判為重複)
+    existing = {
+        (budget.name, budget.start_date, budget.end_date): budget
+        for budget in db.query(Budget).filter(Budget.user_id == user_id)
+    }
+
+    bindings = {}  # {預算: (類別名稱, 帳戶 ID)}，重複出現的預算以最後一次為準
+    for budget_data in budgets_data:
+        start_date = _parse_datetime(budget_data.get("start_date"))
+        end_date = _parse_datetime(budget_data.get("end_date"))
+        key = (budget_data["name"], start_date, end_date)
+
+        budget = existing.get(key)
+        if budget is not None:
+            stats["budgets_updated"] += 1
+        else:
+            budget = Budget(user_id=user_id, name=budget_data["name"])
+            db.add(budget)
+            existing[key] = budget
+            stats["budgets_created"] += 1
+
+        budget.amount = budget_data["amount"]
+        budget.daily_limit = budget_data.get("daily_limit")
+        budget.daily_limit_mode = budget_data.get("daily_limit_mode", "manual")
+        budget.range_mode = budget_data["range_mode"]
+        budget.period = budget_data.get("period")
+        budget.start_date = start_date
+        budget.end_date = end_date
+        budget.is_primary = budget_data.get("is_primary", False)
+
+        bindings[budget] = (
+            set(budget_data.get("category_names", []) or []),
+            [
+                account_index_to_id[idx]
+                for idx in budget_data.get("account_indices", [])
+                if idx in account_index_to_id
+            ]
+        )
+
+    # 刪除既有預算的舊綁定，新預算寫入後取得 ID
+    existing_ids = [budget.id for budget in bindings if budget.id is not None]
+    if existing_ids:
+        db.query(BudgetCategory).filter(BudgetCategory.budget_id.in_(existing_ids)).delete(synchronize_session=False)
+        db.query(BudgetAccount).filter(BudgetAccount.budget_id.in_(existing_ids)).delete(synchronize_session=False)
+    db.flush()
+
+    category_rows = [
+        {"budget_id": budget.id, "category_name": category_name}
+        for budget, (category_names, _) in bindings.items()
+        for category_name in category_names
+    ]
+    account_rows = [
+        {"budget_id": budget.id, "account_id": account_id}
+        for budget, (_, account_ids) in bindings.items()
+        for account_id in account_ids
+    ]
+    if category_rows:
+        db.execute(insert(BudgetCategory.__table__), category_rows)
+    if account_rows:
+        db.execute(insert(BudgetAccount.__table__), account_rows)
+
+    return list(bindings)
+
+
+def import_user_data(db: Session, user_id: int, import_data: dict, job_id: int) -> dict:
+    """將解析後的匯入資料寫入使用者的帳戶 (不提交)，回傳統計"""
+    stats = {
+        "accounts_created": 0,
+        "accounts_updated": 0,
+        "transactions_created": 0,
+        "transactions_updated": 0,
+        "categories_created": 0,
+        "categories_updated": 0,
+        "budgets_created": 0,
+        "budgets_updated": 0
+    }
+
+    _update_job(job_id, stage="accounts")
+    account_index_to_id, overwritten_ids = _import_accounts(db, user_id, import_data.get("accounts", []), stats)
+
+    _import_transactions(
+        db, job_id, import_data.get("transactions", []), account_index_to_id, overwritten_ids, stats
+    )
+
+    _update_job(job_id, stage="categories")
+    _import_categories(db, user_id, import_data.get("categories", []), stats)
+
+    _update_job(job_id, stage="budgets")
+    imported_budgets = _import_budgets(db, user_id, import_data.get("budgets", []), account_index_to_id, stats)
+
+    # 匯入過程有批次刪除/寫入交易，直接重建每日彙總與預算已使用金額
+    _update_job(job_id, stage="finalizing")
+    db.flush()
+    resync_user(db, user_id)
+
+    # 計算匯入預算的統計資料 (不提交，與匯入一起由 run_import_job 提交)
+    for budget in imported_budgets:
+        try:
+            with db.begin_nested():
+                apply_budget_stats(budget, *calculate_budget_stats(db, budget))
+        except Exception as e:
+            # 統計計算失敗不影響匯入，只記錄錯誤 (savepoint 已回復該預算的統計)
+            logger.error(f"Failed to update stats for budget {budget.id}: {e}")
+
+    return stats
+
+
+def run_import_job(job_id: int, content: bytes):
+    """執行匯入任務，成功時一次提交，失敗時回復並記錄錯誤"""
+    db = SessionLocal()
+    try:
+        job = db.get(ImportJob, job_id)
+        if job is None or job.status != "pending":
+            return
+        user_id = job.user_id
+        db.rollback()  # 結束讀取任務的交易，任務狀態由 _update_job 更新
+
+        _update_job(job_id, status="running", stage="parsing", started_at=datetime.now(timezone.utc))
+        import_data = parse_import_file(content)
+        stats = import_user_data(db, user_id, import_data, job_id)
+        db.commit()
+
+        _update_job(
+            job_id, status="completed", stage=None, stats=json.dumps(stats),
+            finished_at=datetime.now(timezone.utc)
+        )
+        logger.info(f"Import job {job_id} completed: {stats}")
+
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Import job {job_id} failed: {e}")
+        _update_job(job_id, status="failed", error=str(e), finished_at=datetime.now(timezone.utc))
+    finally:
+        db.close()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.IMPORT_MAX_WORKERS, thread_name_prefix="import"
+                )
+    return _executor
+
+
+def submit_import_job(job_id: int, content: bytes):
+    """交給背景執行緒執行，超過 IMPORT_MAX_WORKERS 的任務排隊等候"""
+    _get_executor().submit(run_import_job, job_id, content)
@@ -0,0 +1,32 @@
+"""
+使用者資料版本服務
+
+users.data_version 在使用者的交易、帳戶、預算或類別有任何異動時遞增，
+報表快取以此版本作為鍵的一部分，版本改變後舊的快取自然失效。
+
+bump_data_version 只執行 UPDATE，不提交；與資料異動在同一個資料庫交易中生效。
+UPDATE 會鎖住使用者的資料列直到提交，同一使用者的版本號依提交順序遞增，
+異動紀錄 (change_log) 以此版本作為序號。
+"""
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.models.user import User
+
+
+def bump_data_version(db: Session, user_id: int, count: int = 1) -> int:
+    """遞增使用者的資料版本，回傳遞增後的版本"""
+    users = User.__table__
+    version = db.execute(
+        update(users)
+        .where(users.c.id == user_id)
+        .values(data_version=users.c.data_version + count)
+        .returning(users.c.data_version)
+    ).scalar()
+    return version or 0
+
+
+def get_data_version(db: Session, user_id: int) -> int:
+    """讀取使用者目前的資料版本"""
+    version = db.query(User.data_version).filter(User.id == user_id).scalar()
+    return version or 0
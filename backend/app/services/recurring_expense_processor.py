@@ -5,7 +5,7 @@
 1. 檢查所有啟用的固定支出
 2. 判斷哪些固定支出需要建立新的交易
 3. 建立到期的固定支出交易
-4. 更新帳戶餘額
+4. 更新帳戶餘額與每日彙總
 """
 
 from sqlalchemy.orm import Session
@@ -17,6 +17,7 @@ import logging
 from app.models.recurring_expense import RecurringExpense
 from app.models.transaction import Transaction
 from app.core.timezone import to_utc, TAIPEI_TZ
+from app.services.transaction_sync import sync_transaction_changes
 
 logger = logging.getLogger(__name__)
 
@@ -70,6 +71,7 @@ def process_recurring_expenses(db: Session):
                     # Update account balance
                     account = recurring_expense.account
                     account.balance -= recurring_expense.amount
+                    sync_transaction_changes(db, account.user_id, added=[transaction])
 
                     # Update last_executed_date
                     recurring_expense.last_executed_date = to_utc(datetime.combine(target_date, datetime.min.time()).replace(tzinfo=TAIPEI_TZ))
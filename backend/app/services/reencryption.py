@@ -0,0 +1,261 @@
+"""
+加密欄位重新加密任務
+
+金鑰輪替後，舊金鑰 (或 Fernet 格式) 的密文仍可解密，但需要逐步改寫為目前的金鑰。
+任務依 REENCRYPTION_TARGETS 的順序處理每張資料表：
+
+- 以獨立連線的 yield_per 串流讀取 id 大於檢查點的資料，每批 REENCRYPTION_CHUNK_SIZE 筆
+- 只改寫需要重新加密的值，以批次 UPDATE 寫入；UPDATE 條件包含舊密文，
+  讀取後被使用者修改過的資料不會被覆蓋
+- 只改寫成功解密的密文與未加密的舊資料；密文無法解密 (金鑰不在金鑰環中或
+  DATA_ENCRYPTION_KEY 錯誤) 時任務以錯誤停止，該批不寫入，修正金鑰設定後可從檢查點繼續
+- 每批提交後更新檢查點 (current_table / last_id) 與進度，中斷後可從檢查點繼續
+- 依 rows_per_second 限速，避免影響線上查詢
+
+用法：
+
+    job = start_reencryption_job(db)            # 建立或繼續未完成的任務
+    run_reencryption_job_in_background(job.id)
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import Base, SessionLocal, engine
+from app.core.encryption import (
+    FieldDecryptionError, decrypt_many, encrypt_many, evict_decrypted, get_active_field_key_id,
+    needs_reencryption
+)
+from app.models.reencryption_job import ReencryptionJob
+
+logger = logging.getLogger(__name__)
+
+# (資料表, 加密欄位)，依序處理
+REENCRYPTION_TARGETS = (
+    ("transactions", ("description", "note")),
+    ("description_history", ("description",)),
+)
+
+# 尚未結束的任務狀態
+UNFINISHED_STATUSES = ("pending", "running", "paused", "failed")
+
+# running 狀態的任務超過此時間沒有進度，視為執行中的行程已中斷
+STALE_JOB_SECONDS = 300
+
+# 本行程內正在執行的任務
+_running_job_ids = set()
+_running_lock = threading.Lock()
+
+
+class ReencryptionJobConflict(Exception):
+    """已有任務在執行中"""
+
+
+def get_latest_reencryption_job(db: Session) -> Optional[ReencryptionJob]:
+    return db.query(ReencryptionJob).order_by(ReencryptionJob.id.desc()).first()
+
+
+def _is_active_elsewhere(job: ReencryptionJob) -> bool:
+    """任務是否正由其他行程執行 (running 且最近仍有進度)"""
+    if job.status != "running" or job.updated_at is None:
+        return False
+    return datetime.now(timezone.utc) - job.updated_at < timedelta(seconds=STALE_JOB_SECONDS)
+
+
+def start_reencryption_job(db: Session, rows_per_second: Optional[int] = None) -> ReencryptionJob:
+    """
+    建立重新加密任務，目標金鑰相同的未完成任務則從檢查點繼續
+
+    Raises:
+        ReencryptionJobConflict: 已有任務在執行中
+    """
+    target_key_id = get_active_field_key_id()
+    job = db.query(ReencryptionJob).filter(
+        ReencryptionJob.status.in_(UNFINISHED_STATUSES)
+    ).order_by(ReencryptionJob.id.desc()).first()
+
+    if job is not None:
+        with _running_lock:
+            running_here = job.id in _running_job_ids
+        if running_here or _is_active_elsewhere(job):
+            raise ReencryptionJobConflict(f"Re-encryption job {job.id} is already running")
+        if job.target_key_id != target_key_id:
+            # 目前金鑰已變更，舊任務作廢並重新開始
+            job.status = "failed"
+            job.error = f"Superseded by key {target_key_id}"
+            job = None
+
+    if job is None:
+        total_rows = sum(
+            db.execute(select(func.count()).select_from(Base.metadata.tables[table_name])).scalar() or 0
+            for table_name, _ in REENCRYPTION_TARGETS
+        )
+        job = ReencryptionJob(
+            status="pending",
+            target_key_id=target_key_id,
+            total_rows=total_rows,
+            rows_processed=0,
+            rows_updated=0,
+            last_id=0,
+        )
+        db.add(job)
+
+    job.status = "pending"
+    job.error = None
+    job.rows_per_second = settings.REENCRYPTION_ROWS_PER_SECOND if rows_per_second is None else rows_per_second
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def pause_reencryption_job(db: Session, job: ReencryptionJob) -> ReencryptionJob:
+    """暫停任務，執行中的任務會在目前這一批完成後停止"""
+    if job.status in ("pending", "running"):
+        job.status = "paused"
+        db.commit()
+        db.refresh(job)
+    return job
+
+
+class ReencryptionDecryptError(Exception):
+    """資料列的密文無法以目前的金鑰設定解密"""
+
+
+def _reencrypt_chunk(table_name, rows, columns) -> list:
+    """
+    計算一批資料需要改寫的值，回傳 UPDATE 參數
+
+    Raises:
+        ReencryptionDecryptError: 有密文無法解密，整批都不改寫
+    """
+    pending = [
+        row for row in rows
+        if any(needs_reencryption(getattr(row, column)) for column in columns)
+    ]
+    old_values = [getattr(row, column) for row in pending for column in columns]
+    # 整批一次解密再加密；全表掃描不寫入解密快取，避免擠掉報表常用的項目。
+    # strict：解密失敗的密文不能當成明文再加密，否則原始資料會被永久覆蓋
+    try:
+        plain_values = decrypt_many(old_values, use_cache=False, strict=True)
+    except FieldDecryptionError as e:
+        row = pending[e.index // len(columns)]
+        column = columns[e.index % len(columns)]
+        raise ReencryptionDecryptError(f"{table_name} id {row.id} {column}: {e}") from e
+    new_values = iter(encrypt_many(plain_values))
+    old_values = iter(old_values)
+
+    params = []
+    for row in pending:
+        param = {"b_id": row.id}
+        for column in columns:
+            param[f"b_old_{column}"] = next(old_values)
+            param[f"b_new_{column}"] = next(new_values)
+        params.append(param)
+    return params
+
+
+def _update_statement(table, columns):
+    """以舊密文為條件的批次 UPDATE，不更新 updated_at"""
+    conditions = [table.c.id == bindparam("b_id")]
+    conditions += [table.c[column].is_not_distinct_from(bindparam(f"b_old_{column}")) for column in columns]
+    values = {column: bindparam(f"b_new_{column}") for column in columns}
+    if "updated_at" in table.c:
+        values["updated_at"] = table.c.updated_at
+    return update(table).where(*conditions).values(**values)
+
+
+def run_reencryption_job(job_id: int):
+    """執行重新加密任務直到完成、暫停或失敗"""
+    db = SessionLocal()
+    try:
+        job = db.get(ReencryptionJob, job_id)
+        if job is None or job.status not in ("pending", "running"):
+            return
+
+        job.status = "running"
+        if job.started_at is None:
+            job.started_at = datetime.now(timezone.utc)
+        db.commit()
+
+        chunk_size = settings.REENCRYPTION_CHUNK_SIZE
+        table_names = [table_name for table_name, _ in REENCRYPTION_TARGETS]
+        start_index = table_names.index(job.current_table) if job.current_table in table_names else 0
+        run_started = time.monotonic()
+        run_rows = 0
+
+        for table_name, columns in REENCRYPTION_TARGETS[start_index:]:
+            if job.current_table != table_name:
+                job.current_table = table_name
+                job.last_id = 0
+                db.commit()
+
+            table = Base.metadata.tables[table_name]
+            statement = _update_statement(table, columns)
+            query = select(table.c.id, *(table.c[column] for column in columns)).where(
+                table.c.id > job.last_id
+            ).order_by(table.c.id)
+
+            # 以獨立連線串流讀取，寫入與檢查點在 db 中分批提交
+            with engine.connect() as read_conn:
+                result = read_conn.execution_options(yield_per=chunk_size).execute(query)
+                for rows in result.partitions():
+                    status = db.query(ReencryptionJob.status).filter(ReencryptionJob.id == job_id).scalar()
+                    if status != "running":
+                        logger.info(f"Re-encryption job {job_id} stopped ({status}) at {table_name} id {job.last_id}")
+                        return
+
+                    params = _reencrypt_chunk(table_name, rows, columns)
+                    if params:
+                        db.execute(statement, params)
+                        evict_decrypted(*(value for param in params for key, value in param.items()
+                                          if key.startswith("b_old_")))
+                    job.last_id = rows[-1].id
+                    job.rows_processed += len(rows)
+                    job.rows_updated += len(params)
+                    db.commit()
+
+                    # 限速：依已處理筆數計算應花費的時間
+                    run_rows += len(rows)
+                    if job.rows_per_second > 0:
+                        delay = run_rows / job.rows_per_second - (time.monotonic() - run_started)
+                        if delay > 0:
+                            time.sleep(delay)
+
+        job.status = "completed"
+        job.finished_at = datetime.now(timezone.utc)
+        db.commit()
+        logger.info(f"Re-encryption job {job_id} completed: {job.rows_updated}/{job.rows_processed} rows re-encrypted")
+
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Re-encryption job {job_id} failed: {e}")
+        job = db.get(ReencryptionJob, job_id)
+        if job is not None:
+            job.status = "failed"
+            job.error = str(e)
+            db.commit()
+    finally:
+        db.close()
+
+
+def run_reencryption_job_in_background(job_id: int):
+    """在背景執行緒執行任務，同一行程內同一任務只會執行一次"""
+    with _running_lock:
+        if job_id in _running_job_ids:
+            return
+        _running_job_ids.add(job_id)
+
+    def target():
+        try:
+            run_reencryption_job(job_id)
+        finally:
+            with _running_lock:
+                _running_job_ids.discard(job_id)
+
+    threading.Thread(target=target, daemon=True, name=f"reencryption-{job_id}").start()
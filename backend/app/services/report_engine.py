@@ -0,0 +1,328 @@
+"""
+報表計算引擎
+
+同一個日期區間的各種報表 (總覽、明細、類別、排行、帳戶) 共用一個 ReportEngine：
+- 需要逐筆交易的報表 (明細、排行、分類/帳戶交易列表) 會觸發一次性載入，
+  區間內每筆交易只查詢與解密一次，並在單次迴圈中累計所有統計
+- 只需要彙總數字的報表 (類別、帳戶) 在交易尚未載入時直接讀取每日彙總表，
+  已載入時則沿用單次迴圈的結果，不再另外查詢
+
+用法：
+
+    engine = ReportEngine(db, user_id, start, end)
+    overview = engine.overview()
+    ranking = engine.ranking()   # 與 overview 共用同一次載入
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.encryption import decrypt_many
+
+from app.models.account import Account
+from app.models.transaction import Transaction
+from app.schemas.report import (
+    OverviewReport, DetailsReport, CategoryReport,
+    RankingReport, AccountReport, CategoryStats,
+    AccountStats, TransactionDetail, DailyTransactions
+)
+from app.services.transaction_rollup import (
+    get_category_totals, get_account_totals, CREDIT_TYPES, DEBIT_TYPES
+)
+
+# 報表可組合的區塊
+REPORT_SECTIONS = ('overview', 'details', 'category', 'ranking', 'account')
+
+TOP_TRANSACTIONS_LIMIT = 5
+
+
+def load_report_transactions(db: Session, user_id: int, start_date: datetime, end_date: datetime,
+                             *filters) -> List[TransactionDetail]:
+    """取得使用者在 [start_date, end_date) 區間內的交易，依日期新到舊排序，可附加額外的篩選條件"""
+    rows = db.query(Transaction, Account.name).join(
+        Account, Transaction.account_id == Account.id
+    ).filter(
+        Account.user_id == user_id,
+        Transaction.transaction_date >= start_date,
+        Transaction.transaction_date < end_date,
+        *filters
+    ).order_by(Transaction.transaction_date.desc(), Transaction.id.desc()).all()
+
+    return _to_details(rows)
+
+
+def load_top_transactions(db: Session, user_id: int, start_date: datetime, end_date: datetime,
+                          transaction_types, limit: int) -> List[TransactionDetail]:
+    """取得區間內指定類型金額最大的交易"""
+    rows = db.query(Transaction, Account.name).join(
+        Account, Transaction.account_id == Account.id
+    ).filter(
+        Account.user_id == user_id,
+        Transaction.transaction_type.in_(transaction_types),
+        Transaction.transaction_date >= start_date,
+        Transaction.transaction_date < end_date
+    ).order_by(
+        Transaction.amount.desc(),
+        Transaction.transaction_date.desc()
+    ).limit(limit).all()
+
+    return _to_details(rows)
+
+
+def _to_details(rows) -> List[TransactionDetail]:
+    """(Transaction, 帳戶名稱) 轉換為 TransactionDetail，敘述以批次解密"""
+    descriptions = decrypt_many(trans._description for trans, _ in rows)
+    return [
+        _to_detail(trans, account_name, description)
+        for (trans, account_name), description in zip(rows, descriptions)
+    ]
+
+
+def _to_detail(trans: Transaction, account_name: str, description: str) -> TransactionDetail:
+    return TransactionDetail(
+        id=trans.id,
+        description=description,
+        amount=trans.amount,
+        transaction_type=trans.transaction_type,
+        category=trans.category,
+        transaction_date=trans.transaction_date,
+        account_id=trans.account_id,
+        account_name=account_name,
+        exclude_from_budget=trans.exclude_from_budget
+    )
+
+
+def get_local_date_range(start_date: datetime, end_date: datetime):
+    """將報表的 [start_date, end_date) 時間區間轉換為每日彙總表的台北日期區間 (含首尾)"""
+    return start_date.date(), (end_date - timedelta(microseconds=1)).date()
+
+
+class _TransactionScan:
+    """單次迴圈累計出的所有統計"""
+
+    def __init__(self, transactions: List[TransactionDetail]):
+        self.daily_groups = defaultdict(list)
+        self.daily_credit = defaultdict(float)
+        self.daily_debit = defaultdict(float)  # 僅 debit，與舊版明細報表一致
+        self.total_credit = 0.0
+        self.total_debit = 0.0  # debit + installment
+        self.category_totals = defaultdict(lambda: {'credit': 0.0, 'debit': 0.0})
+        self.account_totals = defaultdict(lambda: {'credit': 0.0, 'debit': 0.0})
+        self.income = []
+        self.expense = []
+
+        for t in transactions:
+            date_str = t.transaction_date.strftime('%Y-%m-%d')
+            self.daily_groups[date_str].append(t)
+
+            if t.transaction_type in CREDIT_TYPES:
+                key = 'credit'
+                self.total_credit += t.amount
+                self.daily_credit[date_str] += t.amount
+                self.income.append(t)
+            elif t.transaction_type in DEBIT_TYPES:
+                key = 'debit'
+                self.total_debit += t.amount
+                if t.transaction_type == 'debit':
+                    self.daily_debit[date_str] += t.amount
+                self.expense.append(t)
+            else:
+                continue
+
+            self.category_totals[t.category or '未分類'][key] += t.amount
+            self.account_totals[t.account_id][key] += t.amount
+
+        # 交易已依日期新到舊排序，穩定排序後同金額仍維持日期順序
+        self.income.sort(key=lambda x: x.amount, reverse=True)
+        self.expense.sort(key=lambda x: x.amount, reverse=True)
+
+
+class ReportEngine:
+    """計算單一使用者在 [start_date, end_date) 區間內的報表"""
+
+    def __init__(self, db: Session, user_id: int, start_date: datetime, end_date: datetime):
+        self.db = db
+        self.user_id = user_id
+        self.start_date = start_date
+        self.end_date = end_date
+        self._transactions: Optional[List[TransactionDetail]] = None
+        self._scan: Optional[_TransactionScan] = None
+        self._category_totals = None
+        self._account_totals = None
+
+    @property
+    def transactions(self) -> List[TransactionDetail]:
+        if self._transactions is None:
+            self._transactions = load_report_transactions(self.db, self.user_id, self.start_date, self.end_date)
+        return self._transactions
+
+    def _get_scan(self) -> _TransactionScan:
+        if self._scan is None:
+            self._scan = _TransactionScan(self.transactions)
+        return self._scan
+
+    def _get_category_totals(self) -> dict:
+        if self._scan is not None:
+            return self._scan.category_totals
+        if self._category_totals is None:
+            self._category_totals = get_category_totals(
+                self.db, self.user_id, *get_local_date_range(self.start_date, self.end_date)
+            )
+        return self._category_totals
+
+    def _get_account_totals(self) -> dict:
+        if self._scan is not None:
+            return self._scan.account_totals
+        if self._account_totals is None:
+            self._account_totals = get_account_totals(
+                self.db, self.user_id, *get_local_date_range(self.start_date, self.end_date)
+            )
+        return self._account_totals
+
+    def _category_stats(self) -> List[CategoryStats]:
+        category_totals = self._get_category_totals()
+        total_debit = sum(amounts['debit'] for amounts in category_totals.values())
+
+        # 百分比以支出計算
+        return [
+            CategoryStats(
+                category=cat,
+                amount=amounts['debit'],
+                percentage=(amounts['debit'] / total_debit * 100) if total_debit > 0 else 0,
+                credit=amounts['credit'],
+                debit=amounts['debit']
+            )
+            for cat, amounts in category_totals.items()
+        ]
+
+    def overview(self) -> OverviewReport:
+        category_stats = self._category_stats()
+        total_credit = sum(stats.credit for stats in category_stats)
+        total_debit = sum(stats.debit for stats in category_stats)
+        category_stats.sort(key=lambda x: x.amount, reverse=True)
+
+        if self._scan is not None:
+            top_five_income = self._scan.income[:TOP_TRANSACTIONS_LIMIT]
+            top_five_expense = self._scan.expense[:TOP_TRANSACTIONS_LIMIT]
+        else:
+            top_five_income = load_top_transactions(
+                self.db, self.user_id, self.start_date, self.end_date, CREDIT_TYPES, TOP_TRANSACTIONS_LIMIT
+            )
+            top_five_expense = load_top_transactions(
+                self.db, self.user_id, self.start_date, self.end_date, DEBIT_TYPES, TOP_TRANSACTIONS_LIMIT
+            )
+
+        return OverviewReport(
+            total_credit=total_credit,
+            total_debit=total_debit,
+            net_amount=total_credit - total_debit,
+            category_stats=category_stats,
+            top_five_income=top_five_income,
+            top_five_expense=top_five_expense
+        )
+
+    def details(self, day_label: Optional[str] = None) -> DetailsReport:
+        """
+        明細報表
+
+        Args:
+            day_label: 單日報表的日期字串，指定時所有交易合併為同一天，
+                       當日支出包含分期 (與舊版單日明細一致)
+        """
+        scan = self._get_scan()
+        if day_label is not None:
+            daily_transactions = [DailyTransactions(
+                date=day_label,
+                total_credit=scan.total_credit,
+                total_debit=scan.total_debit,
+                transactions=self.transactions
+            )]
+        else:
+            daily_transactions = [
+                DailyTransactions(
+                    date=date_str,
+                    total_credit=scan.daily_credit[date_str],
+                    total_debit=scan.daily_debit[date_str],
+                    transactions=scan.daily_groups[date_str]
+                )
+                for date_str in sorted(scan.daily_groups.keys(), reverse=True)
+            ]
+
+        return DetailsReport(
+            daily_transactions=daily_transactions,
+            total_credit=scan.total_credit,
+            total_debit=scan.total_debit
+        )
+
+    def category(self) -> CategoryReport:
+        category_stats = self._category_stats()
+        total_credit = sum(stats.credit for stats in category_stats)
+        total_debit = sum(stats.debit for stats in category_stats)
+        # 依收支合計排序，最活躍的類別在前
+        category_stats.sort(key=lambda x: x.debit + x.credit, reverse=True)
+
+        return CategoryReport(
+            category_stats=category_stats,
+            total_amount=total_debit,  # Backward compatible
+            total_credit=total_credit,
+            total_debit=total_debit
+        )
+
+    def ranking(self) -> RankingReport:
+        return RankingReport(
+            expense_ranking=self._get_scan().expense,
+            income_ranking=self._get_scan().income
+        )
+
+    def account(self) -> AccountReport:
+        account_totals = self._get_account_totals()
+        account_map = dict(
+            self.db.query(Account.id, Account.name).filter(Account.user_id == self.user_id).all()
+        )
+        total_amount = sum(amounts['debit'] for amounts in account_totals.values())
+
+        account_stats = [
+            AccountStats(
+                account_id=acc_id,
+                account_name=account_map.get(acc_id, '未知帳戶'),
+                amount=amounts['debit'],
+                percentage=(amounts['debit'] / total_amount * 100) if total_amount > 0 else 0,
+                credit=amounts['credit'],
+                debit=amounts['debit'],
+                balance=amounts['credit'] - amounts['debit']
+            )
+            for acc_id, amounts in account_totals.items()
+        ]
+        account_stats.sort(key=lambda x: x.amount, reverse=True)
+
+        return AccountReport(
+            account_stats=account_stats,
+            total_amount=total_amount
+        )
+
+    def category_transactions(self, category: Optional[str]) -> List[TransactionDetail]:
+        return [t for t in self.transactions if t.category == category]
+
+    def account_transactions(self, account_id: int) -> List[TransactionDetail]:
+        return [t for t in self.transactions if t.account_id == account_id]
+
+    def build(self, sections, day_label: Optional[str] = None) -> dict:
+        """
+        一次計算多個報表區塊，回傳 {區塊名稱: 報表}，只包含要求的區塊
+
+        需要逐筆交易的區塊先計算，讓類別/帳戶統計沿用同一次載入的結果
+        """
+        sections = set(sections)
+        if sections & {'details', 'ranking'}:
+            self._get_scan()
+        result = {}
+        for section in REPORT_SECTIONS:
+            if section not in sections:
+                continue
+            if section == 'details':
+                result[section] = self.details(day_label)
+            else:
+                result[section] = getattr(self, section)()
+        return result
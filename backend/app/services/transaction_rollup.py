@@ -0,0 +1,256 @@
+"""
+交易每日彙總 (rollup) 服務
+
+此服務負責：
+1. 交易新增/修改/刪除時，以差額 upsert 同步更新 transaction_daily_rollups
+2. 依日期區間讀取彙總後的類別/帳戶/每日統計，取代報表即時掃描交易表
+3. 重建 (backfill) 指定使用者或全部使用者的彙總資料
+
+所有寫入都在呼叫端的 session 內執行，與交易本身在同一個資料庫交易中提交。
+"""
+from collections import defaultdict
+from datetime import date
+from typing import Iterable, Optional
+import logging
+
+from sqlalchemy import func, select, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.core.timezone import to_taipei_time
+from app.models.account import Account
+from app.models.transaction import Transaction
+from app.models.transaction_daily_rollup import TransactionDailyRollup
+
+logger = logging.getLogger(__name__)
+
+# 彙總日期以台北時間計算
+ROLLUP_TIMEZONE = 'Asia/Taipei'
+
+# 報表統計使用的交易類型
+CREDIT_TYPES = ('credit',)
+DEBIT_TYPES = ('debit', 'installment')
+
+
+def _rollup_key(user_id: int, item):
+    """由交易 (或交易快照) 計算彙總鍵"""
+    return (
+        user_id,
+        item.account_id,
+        item.category or '',
+        to_taipei_time(item.transaction_date).date(),
+        item.transaction_type,
+        bool(item.exclude_from_budget),
+    )
+
+
+def apply_rollup_changes(db: Session, user_id: int, removed: Iterable = (), added: Iterable = ()):
+    """
+    依交易異動更新彙總表
+
+    Args:
+        removed: 被刪除 (或修改前) 的交易快照
+        added: 新增 (或修改後) 的交易
+    """
+    deltas = defaultdict(lambda: [0.0, 0])
+    for item in removed:
+        delta = deltas[_rollup_key(user_id, item)]
+        delta[0] -= item.amount
+        delta[1] -= 1
+    for item in added:
+        delta = deltas[_rollup_key(user_id, item)]
+        delta[0] += item.amount
+        delta[1] += 1
+
+    # 依鍵排序，讓並行寫入以相同順序取得列鎖，避免死結
+    rows = [
+        dict(
+            user_id=key[0],
+            account_id=key[1],
+            category=key[2],
+            local_date=key[3],
+            transaction_type=key[4],
+            exclude_from_budget=key[5],
+            total_amount=amount,
+            transaction_count=count,
+        )
+        for key, (amount, count) in sorted(deltas.items())
+        if amount or count
+    ]
+    if not rows:
+        return
+
+    stmt = pg_insert(TransactionDailyRollup)
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_transaction_daily_rollups_key",
+        set_={
+            "total_amount": TransactionDailyRollup.total_amount + stmt.excluded.total_amount,
+            "transaction_count": TransactionDailyRollup.transaction_count + stmt.excluded.transaction_count,
+        }
+    )
+    db.execute(stmt, rows)
+
+    if any(row["transaction_count"] < 0 for row in rows):
+        # 清除已無交易的彙總列
+        db.query(TransactionDailyRollup).filter(
+            TransactionDailyRollup.user_id == user_id,
+            TransactionDailyRollup.transaction_count <= 0
+        ).delete(synchronize_session=False)
+
+
+def rebuild_rollups(db: Session, user_id: Optional[int] = None) -> int:
+    """
+    由交易表重建彙總資料
+
+    Args:
+        user_id: 指定使用者，None 表示全部使用者
+
+    Returns:
+        重建後的彙總列數
+    """
+    delete_query = db.query(TransactionDailyRollup)
+    if user_id is not None:
+        delete_query = delete_query.filter(TransactionDailyRollup.user_id == user_id)
+    delete_query.delete(synchronize_session=False)
+
+    local_date = func.date(func.timezone(ROLLUP_TIMEZONE, Transaction.transaction_date))
+    category = func.coalesce(Transaction.category, '')
+    source = select(
+        Account.user_id,
+        Transaction.account_id,
+        category,
+        local_date,
+        Transaction.transaction_type,
+        Transaction.exclude_from_budget,
+        func.sum(Transaction.amount),
+        func.count(Transaction.id),
+    ).join(
+        Account, Transaction.account_id == Account.id
+    ).group_by(
+        Account.user_id,
+        Transaction.account_id,
+        category,
+        local_date,
+        Transaction.transaction_type,
+        Transaction.exclude_from_budget,
+    )
+    if user_id is not None:
+        source = source.where(Account.user_id == user_id)
+
+    db.execute(
+        insert(TransactionDailyRollup).from_select(
+            [
+                "user_id", "account_id", "category", "local_date", "transaction_type",
+                "exclude_from_budget", "total_amount", "transaction_count",
+            ],
+            source
+        )
+    )
+
+    count_query = db.query(func.count(TransactionDailyRollup.id))
+    if user_id is not None:
+        count_query = count_query.filter(TransactionDailyRollup.user_id == user_id)
+    return count_query.scalar()
+
+
+def ensure_rollups_initialized(db: Session) -> bool:
+    """
+    若彙總表為空但已有交易 (例如首次部署)，執行完整重建
+
+    Returns:
+        是否執行了重建
+    """
+    if db.query(TransactionDailyRollup.id).first() is not None:
+        return False
+    if db.query(Transaction.id).first() is None:
+        return False
+
+    count = rebuild_rollups(db)
+    db.commit()
+    logger.info(f"Initialized transaction daily rollups ({count} rows)")
+    return True
+
+
+def _rollup_range_query(db: Session, user_id: int, start: date, end: date, *columns):
+    """查詢 [start, end] 台北日期區間 (含首尾) 內的彙總資料"""
+    return db.query(*columns).filter(
+        TransactionDailyRollup.user_id == user_id,
+        TransactionDailyRollup.local_date >= start,
+        TransactionDailyRollup.local_date <= end,
+    )
+
+
+def get_category_totals(db: Session, user_id: int, start: date, end: date) -> dict:
+    """
+    取得區間內各類別的收入/支出總額 (不含轉帳)
+
+    Returns:
+        {類別: {'credit': float, 'debit': float}}，未分類以 '未分類' 表示
+    """
+    rows = _rollup_range_query(
+        db, user_id, start, end,
+        TransactionDailyRollup.category,
+        TransactionDailyRollup.transaction_type,
+        func.sum(TransactionDailyRollup.total_amount).label('total'),
+    ).filter(
+        TransactionDailyRollup.transaction_type.in_(CREDIT_TYPES + DEBIT_TYPES)
+    ).group_by(
+        TransactionDailyRollup.category,
+        TransactionDailyRollup.transaction_type,
+    ).all()
+
+    totals = defaultdict(lambda: {'credit': 0.0, 'debit': 0.0})
+    for row in rows:
+        cat = row.category or '未分類'
+        key = 'credit' if row.transaction_type in CREDIT_TYPES else 'debit'
+        totals[cat][key] += row.total or 0.0
+    return totals
+
+
+def get_account_totals(db: Session, user_id: int, start: date, end: date) -> dict:
+    """
+    取得區間內各帳戶的收入/支出總額 (不含轉帳)
+
+    Returns:
+        {account_id: {'credit': float, 'debit': float}}
+    """
+    rows = _rollup_range_query(
+        db, user_id, start, end,
+        TransactionDailyRollup.account_id,
+        TransactionDailyRollup.transaction_type,
+        func.sum(TransactionDailyRollup.total_amount).label('total'),
+    ).filter(
+        TransactionDailyRollup.transaction_type.in_(CREDIT_TYPES + DEBIT_TYPES)
+    ).group_by(
+        TransactionDailyRollup.account_id,
+        TransactionDailyRollup.transaction_type,
+    ).all()
+
+    totals = defaultdict(lambda: {'credit': 0.0, 'debit': 0.0})
+    for row in rows:
+        key = 'credit' if row.transaction_type in CREDIT_TYPES else 'debit'
+        totals[row.account_id][key] += row.total or 0.0
+    return totals
+
+
+def get_daily_type_totals(db: Session, user_id: int, start: date, end: date) -> dict:
+    """
+    取得區間內每日各交易類型的總額
+
+    Returns:
+        {date: {transaction_type: float}}
+    """
+    rows = _rollup_range_query(
+        db, user_id, start, end,
+        TransactionDailyRollup.local_date,
+        TransactionDailyRollup.transaction_type,
+        func.sum(TransactionDailyRollup.total_amount).label('total'),
+    ).group_by(
+        TransactionDailyRollup.local_date,
+        TransactionDailyRollup.transaction_type,
+    ).all()
+
+    totals = defaultdict(lambda: defaultdict(float))
+    for row in rows:
+        totals[row.local_date][row.transaction_type] += row.total or 0.0
+    return totals
@@ -0,0 +1,90 @@
+"""
+交易異動同步服務
+
+所有會新增/修改/刪除交易的路徑都應呼叫 sync_transaction_changes，
+讓衍生資料 (每日彙總、預算已使用金額、預算每日統計、使用者資料版本等) 與交易在同一個資料庫交易中更新，
+並記錄增量同步用的異動紀錄 (交易、受影響的帳戶餘額與預算已使用金額)。
+
+修改或刪除交易前，先以 snapshot() 保存舊值，再於異動後呼叫：
+
+    before = snapshot(transaction)
+    ... 修改 transaction ...
+    sync_transaction_changes(db, user_id, removed=[before], added=[transaction])
+"""
+from collections import namedtuple
+from typing import Iterable, Sequence
+
+from sqlalchemy.orm import Session
+
+from app.core.timezone import to_taipei_time
+from app.services.budget_spent import apply_budget_spent_changes, recompute_user_budgets_spent
+from app.services.budget_stats import mark_budget_days_dirty
+from app.services.change_log import RESET, Change, deletes, record_changes, upserts
+from app.services.transaction_rollup import apply_rollup_changes, rebuild_rollups
+
+# 影響衍生資料的交易欄位快照
+TransactionSnapshot = namedtuple(
+    "TransactionSnapshot",
+    ["id", "account_id", "category", "transaction_date", "transaction_type", "exclude_from_budget", "amount"]
+)
+
+
+def snapshot(transaction) -> TransactionSnapshot:
+    """保存交易目前的欄位值"""
+    return TransactionSnapshot(
+        id=transaction.id,
+        account_id=transaction.account_id,
+        category=transaction.category,
+        transaction_date=transaction.transaction_date,
+        transaction_type=transaction.transaction_type,
+        exclude_from_budget=bool(transaction.exclude_from_budget),
+        amount=transaction.amount,
+    )
+
+
+def sync_transaction_changes(db: Session, user_id: int, removed: Iterable = (), added: Iterable = ()):
+    """
+    同步交易異動到衍生資料
+
+    Args:
+        removed: 被刪除或修改前的交易快照
+        added: 新增或修改後的交易
+    """
+    removed = list(removed)
+    added = list(added)
+    if not removed and not added:
+        return
+    apply_rollup_changes(db, user_id, removed=removed, added=added)
+    budget_ids = apply_budget_spent_changes(db, user_id, removed=removed, added=added)
+    # 過去日期的異動需要重新計算預算的每日統計
+    mark_budget_days_dirty(
+        db, user_id, {to_taipei_time(item.transaction_date).date() for item in removed + added}
+    )
+
+    # 新增的交易需要 ID 才能記錄異動
+    if any(item.id is None for item in added):
+        db.flush()
+    added_ids = [item.id for item in added]
+    removed_ids = [item.id for item in removed if item.id not in added_ids]
+    account_ids = sorted({item.account_id for item in removed + added})
+    record_changes(
+        db, user_id,
+        upserts("transaction", added_ids) + deletes("transaction", removed_ids)
+        + upserts("account", account_ids) + upserts("budget", budget_ids)
+    )
+
+
+def resync_user(db: Session, user_id: int, changes: Sequence[Change] = (RESET,)):
+    """
+    批次刪除/匯入等無法逐筆追蹤的操作後，重建使用者的衍生資料
+
+    Args:
+        changes: 要記錄的異動，預設為 RESET (用戶端需重新下載完整資料)
+    """
+    rebuild_rollups(db, user_id)
+    net_spent = recompute_user_budgets_spent(db, user_id)
+    mark_budget_days_dirty(db, user_id)
+    changes = list(changes)
+    if RESET not in changes:
+        changes += upserts("budget", sorted(net_spent))
+    record_changes(db, user_id, changes)
@@ -8,6 +8,8 @@ from app.models.budget import Budget
 from app.models.budget_account import BudgetAccount
 from app.models.budget_category import BudgetCategory
 from app.utils.budget_period import calculate_next_period_range
+from app.services.change_log import record_changes, upserts
+from app.services.budget_spent import recompute_budgets_spent
 import logging
 
 logger = logging.getLogger(__name__)
@@ -109,6 +111,7 @@ def create_next_period_budgets():
 
             db.add(new_budget)
             db.flush()  # 取得 new_budget.id
+            record_changes(db, budget.user_id, upserts("budget", [new_budget.id]))
 
             # 複製帳戶綁定關係
             for account in budget.accounts:
@@ -130,6 +133,9 @@ def create_next_period_budgets():
                 )
                 db.add(new_budget_category)
 
+            # 新週期可能已有交易 (例如分期、預先記錄的交易)，依綁定計算已使用金額
+            recompute_budgets_spent(db, [new_budget.id])
+
         db.commit()
         logger.info(f"Successfully created {created_count} recurring budgets (checked {len(budgets_to_renew)} total)")
 
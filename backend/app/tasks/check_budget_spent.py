@@ -0,0 +1,49 @@
+"""
+預算已使用金額一致性檢查任務
+
+比對 budgets.spent 與完整重算的結果，可選擇修復誤差：
+
+    python -m app.tasks.check_budget_spent                     # 只檢查
+    python -m app.tasks.check_budget_spent --repair            # 檢查並修復
+    python -m app.tasks.check_budget_spent --user-id 1 --repair
+"""
+import argparse
+import logging
+from sqlalchemy.orm import Session
+from app.core.database import SessionLocal
+from app.services.budget_spent import check_budgets_spent
+
+logger = logging.getLogger(__name__)
+
+
+def check_budget_spent(user_id: int = None, repair: bool = False) -> list:
+    """
+    檢查 (並修復) 預算的已使用金額
+
+    Returns:
+        有誤差的預算清單
+    """
+    db: Session = SessionLocal()
+    try:
+        drifts = check_budgets_spent(db, user_id=user_id, repair=repair)
+        logger.info(f"Checked budget spent, {len(drifts)} budgets drifted" + (" and repaired" if repair else ""))
+        return drifts
+
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error checking budget spent: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Check budget spent counters against a full recomputation")
+    parser.add_argument("--user-id", type=int, default=None, help="只檢查指定使用者")
+    parser.add_argument("--repair", action="store_true", help="將有誤差的預算改寫為重算結果")
+    args = parser.parse_args()
+    drifts = check_budget_spent(args.user_id, args.repair)
+    for drift in drifts:
+        print(f"Budget {drift['budget_id']} (user {drift['user_id']}): stored={drift['stored']} expected={drift['expected']}")
+    print(f"{len(drifts)} budgets drifted" + (", repaired" if args.repair else ""))
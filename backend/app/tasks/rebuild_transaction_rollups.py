@@ -0,0 +1,55 @@
+"""
+交易每日彙總重建任務
+
+用於首次回填或修復 transaction_daily_rollups：
+
+    python -m app.tasks.rebuild_transaction_rollups            # 全部使用者
+    python -m app.tasks.rebuild_transaction_rollups --user-id 1
+"""
+import argparse
+import logging
+from sqlalchemy.orm import Session
+from app.core.database import SessionLocal
+from app.models.user import User
+from app.services.transaction_rollup import rebuild_rollups
+
+logger = logging.getLogger(__name__)
+
+
+def rebuild_transaction_rollups(user_id: int = None) -> int:
+    """
+    重建交易每日彙總，每位使用者各自提交，避免長時間鎖住整張表
+
+    Returns:
+        重建後的彙總列數
+    """
+    db: Session = SessionLocal()
+    try:
+        if user_id is not None:
+            user_ids = [user_id]
+        else:
+            user_ids = [uid for (uid,) in db.query(User.id).order_by(User.id).all()]
+
+        total_rows = 0
+        for uid in user_ids:
+            total_rows += rebuild_rollups(db, uid)
+            db.commit()
+
+        logger.info(f"Rebuilt {total_rows} rollup rows for {len(user_ids)} users")
+        return total_rows
+
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error rebuilding transaction rollups: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Rebuild transaction daily rollups")
+    parser.add_argument("--user-id", type=int, default=None, help="只重建指定使用者")
+    args = parser.parse_args()
+    rows = rebuild_transaction_rollups(args.user_id)
+    print(f"Rebuilt {rows} rollup rows")
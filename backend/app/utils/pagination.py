@@ -0,0 +1,55 @@
+"""
+Keyset (cursor) 分頁輔助函數
+
+游標內容為排序鍵的 JSON，經 URL-safe base64 編碼後交給前端，
+前端只需原樣帶回，不需要理解其內容。
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, List
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """
+    將排序鍵編碼為不透明的游標字串
+
+    Args:
+        values: 最後一筆資料的排序鍵 (datetime 會轉為 ISO 字串)
+
+    Returns:
+        URL-safe base64 游標字串
+    """
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """
+    解碼游標字串
+
+    Raises:
+        ValueError: 游標格式錯誤
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(payload, list):
+        raise ValueError("Invalid cursor")
+    return payload
+
+
+def decode_datetime_cursor(cursor: str) -> tuple:
+    """
+    解碼 (datetime, id) 形式的游標
+
+    Raises:
+        ValueError: 游標格式錯誤
+    """
+    values = decode_cursor(cursor)
+    if len(values) != 2 or not isinstance(values[0], str) or not isinstance(values[1], int):
+        raise ValueError("Invalid cursor")
+    return datetime.fromisoformat(values[0]), values[1]
@@ -0,0 +1,246 @@
+"""
+讀取端點負載測試 (同步 Session vs AsyncSession)
+
+以多個併發用戶端反覆呼叫讀取端點 (帳戶列表、交易分頁、每月統計)，部分請求為模擬的
+慢速報表查詢 (pg_sleep)。比較舊版同步端點 (執行緒池 + Session) 與目前 async 端點
+(AsyncSession) 一般讀取的延遲分佈 (p50 / p95 / p99) 與每秒請求數。
+
+兩種端點各以獨立的 uvicorn 行程 (單一 worker) 提供，負載產生器在本行程中執行，
+需要可連線的資料庫 (DATABASE_URL)，第一次執行時會建立測試使用者與交易。在 backend 目錄執行：
+
+    python -m scripts.bench_async_reads
+    python -m scripts.bench_async_reads --clients 200 --requests 20 --slow-every 10 --slow-ms 200
+"""
+import argparse
+import asyncio
+import math
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import httpx
+from fastapi import APIRouter, Depends, FastAPI
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.api import accounts, transactions
+from app.api.deps import get_current_principal, get_current_principal_async
+from app.core.database import SessionLocal, get_async_db, get_db
+from app.core.principal import Principal
+from app.core.security import create_access_token
+from app.models.account import Account
+from app.models.transaction import Transaction
+from app.models.user import User
+from app.services.transaction_rollup import get_daily_type_totals
+from app.services.transaction_sync import resync_user
+
+BENCH_USERNAME = "bench-async-reads@example.com"
+BENCH_YEAR, BENCH_MONTH = 2026, 1
+
+READ_PATHS = [
+    "/api/accounts/",
+    "/api/transactions/?limit=50",
+    f"/api/transactions/stats/monthly?year={BENCH_YEAR}&month={BENCH_MONTH}",
+]
+SLOW_PATH = "/api/slow-report"
+
+# 舊版同步端點 (執行緒池中執行，使用同步 Session)
+sync_router = APIRouter()
+
+
+@sync_router.get("/accounts/")
+def sync_get_accounts(current_user: Principal = Depends(get_current_principal), db: Session = Depends(get_db)):
+    return [
+        {"id": acc.id, "name": acc.name, "balance": acc.balance}
+        for acc in db.query(Account).filter(Account.user_id == current_user.id)
+    ]
+
+
+@sync_router.get("/transactions/")
+def sync_get_transactions(
+    limit: int = 50,
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db)
+):
+    rows = db.query(Transaction).join(Account).filter(Account.user_id == current_user.id).order_by(
+        Transaction.transaction_date.desc(), Transaction.id.desc()
+    ).limit(limit).all()
+    return [transactions.TransactionSchema.model_validate(row) for row in rows]
+
+
+@sync_router.get("/transactions/stats/monthly")
+def sync_get_monthly_stats(
+    year: int,
+    month: int,
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db)
+):
+    totals = get_daily_type_totals(db, current_user.id, date(year, month, 1), date(year, month, 28))
+    return {local_date.isoformat(): dict(type_totals) for local_date, type_totals in totals.items()}
+
+
+@sync_router.get("/slow-report")
+def sync_slow_report(
+    seconds: float,
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db)
+):
+    db.execute(text("SELECT pg_sleep(:seconds)"), {"seconds": seconds})
+    return {"ok": True}
+
+
+# 模擬的慢速報表查詢 (async 版本)
+async_router = APIRouter()
+
+
+@async_router.get("/slow-report")
+async def async_slow_report(
+    seconds: float,
+    current_user: Principal = Depends(get_current_principal_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    await db.execute(text("SELECT pg_sleep(:seconds)"), {"seconds": seconds})
+    return {"ok": True}
+
+
+def make_sync_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(sync_router, prefix="/api")
+    return app
+
+
+def make_async_app() -> FastAPI:
+    app = FastAPI()
+    app.include_router(accounts.router, prefix="/api/accounts")
+    app.include_router(transactions.router, prefix="/api/transactions")
+    app.include_router(async_router, prefix="/api")
+    return app
+
+
+def ensure_bench_data(transaction_count: int) -> None:
+    """建立測試使用者、帳戶與交易 (已存在時略過)"""
+    db = SessionLocal()
+    try:
+        if db.query(User.id).filter(User.username == BENCH_USERNAME).first():
+            return
+        user = User(username=BENCH_USERNAME, hashed_password="!")
+        db.add(user)
+        db.flush()
+        account_list = [Account(name=f"Bench {i}", account_type="cash", currency="TWD", user_id=user.id) for i in range(3)]
+        db.add_all(account_list)
+        db.flush()
+
+        rng = random.Random(42)
+        start = datetime(BENCH_YEAR, BENCH_MONTH, 1)
+        for i in range(transaction_count):
+            db.add(Transaction(
+                account_id=rng.choice(account_list).id,
+                description=f"bench #{i}",
+                amount=rng.randint(10, 2000),
+                transaction_type=rng.choice(["debit", "debit", "credit"]),
+                category=rng.choice(["飲食", "交通", "購物"]),
+                transaction_date=start + timedelta(minutes=rng.randint(0, 27 * 24 * 60))
+            ))
+        db.flush()
+        resync_user(db, user.id)
+        db.commit()
+    finally:
+        db.close()
+
+
+def percentile(sorted_values, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(p * len(sorted_values)) - 1)]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(factory: str, port: int) -> subprocess.Popen:
+    """以 uvicorn 啟動 factory 建立的應用程式，等待可以連線後回傳"""
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"scripts.bench_async_reads:{factory}", "--factory",
+         "--port", str(port), "--timeout-keep-alive", "120", "--log-level", "warning", "--no-access-log"]
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"uvicorn did not start on port {port}")
+
+
+async def run_load(base_url: str, clients: int, requests: int, slow_every: int, slow_ms: int):
+    """
+    每個用戶端依序送出 requests 個請求，每 slow_every 個請求中有一個是慢查詢
+
+    Returns:
+        (一般讀取的延遲秒數 (已排序), 總請求數, 經過秒數)
+    """
+    headers = {"Authorization": "Bearer " + create_access_token({"sub": BENCH_USERNAME})}
+    latencies = []
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=120) as client:
+        async def worker(worker_index: int):
+            for i in range(requests):
+                if slow_every and (worker_index + i) % slow_every == 0:
+                    response = await client.get(SLOW_PATH, params={"seconds": slow_ms / 1000})
+                    response.raise_for_status()
+                    continue
+                started_at = time.perf_counter()
+                response = await client.get(READ_PATHS[(worker_index + i) % len(READ_PATHS)])
+                latencies.append(time.perf_counter() - started_at)
+                response.raise_for_status()
+
+        # 預熱 (principal 快取、連線池)
+        await worker(1)
+        latencies.clear()
+
+        started_at = time.perf_counter()
+        await asyncio.gather(*(worker(index) for index in range(clients)))
+        elapsed = time.perf_counter() - started_at
+
+    return sorted(latencies), clients * requests, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sync vs async read endpoints under load")
+    parser.add_argument("--clients", type=int, default=200, help="併發用戶端數")
+    parser.add_argument("--requests", type=int, default=20, help="每個用戶端的請求數")
+    parser.add_argument("--slow-every", type=int, default=10, help="每幾個請求有一個慢查詢 (0 表示沒有)")
+    parser.add_argument("--slow-ms", type=int, default=200, help="慢查詢的秒數 (毫秒)")
+    parser.add_argument("--transactions", type=int, default=2000, help="測試使用者的交易筆數 (第一次執行時建立)")
+    args = parser.parse_args()
+
+    ensure_bench_data(args.transactions)
+
+    print(f"{args.clients} clients x {args.requests} requests, 1 in {args.slow_every} is a {args.slow_ms} ms query")
+    print(f"{'case':10} {'reads':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'requests/sec':>14}")
+    for name, factory in (("sync", "make_sync_app"), ("async", "make_async_app")):
+        port = free_port()
+        server = start_server(factory, port)
+        try:
+            latencies, total, elapsed = asyncio.run(
+                run_load(f"http://127.0.0.1:{port}", args.clients, args.requests, args.slow_every, args.slow_ms)
+            )
+        finally:
+            server.terminate()
+            server.wait()
+        p50, p95, p99 = (percentile(latencies, p) * 1000 for p in (0.5, 0.95, 0.99))
+        print(f"{name:10} {len(latencies):7} {p50:9.1f} {p95:9.1f} {p99:9.1f} {total / elapsed:14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
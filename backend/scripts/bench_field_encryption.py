@@ -0,0 +1,90 @@
+"""
+欄位加密效能測試
+
+比較舊版 Fernet、v2 逐筆 (encrypt_field / decrypt_field) 與 v2 批次
+(encrypt_many / decrypt_many) 的吞吐量。解密測試預設關閉解密快取 (實際解密)，
+另外以 "cache hit" 測試快取命中時的吞吐量。在 backend 目錄執行：
+
+    python -m scripts.bench_field_encryption
+    python -m scripts.bench_field_encryption --count 50000 --rounds 5
+"""
+import argparse
+import random
+import time
+
+from app.core.config import settings
+from app.core.encryption import (
+    _get_fernet, encrypt_field, decrypt_field, encrypt_many, decrypt_many
+)
+
+SAMPLE_WORDS = ["午餐", "晚餐", "咖啡", "捷運", "超市", "電費", "lunch", "coffee", "taxi", "rent", "groceries"]
+
+
+def make_samples(count: int):
+    """產生類似交易敘述的短字串"""
+    rng = random.Random(42)
+    return [f"{rng.choice(SAMPLE_WORDS)} {rng.choice(SAMPLE_WORDS)} #{i}" for i in range(count)]
+
+
+def best_of(rounds: int, func) -> float:
+    """執行多次取最快的秒數"""
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark field encryption formats")
+    parser.add_argument("--count", type=int, default=10000, help="每輪處理的字串數量")
+    parser.add_argument("--rounds", type=int, default=5, help="重複次數 (取最快)")
+    args = parser.parse_args()
+
+    samples = make_samples(args.count)
+    fernet = _get_fernet()
+    fernet_tokens = [fernet.encrypt(text.encode("utf-8")).decode("utf-8") for text in samples]
+    v2_tokens = encrypt_many(samples)
+    # 驗證結果時不寫入解密快取，否則之後的解密測試量到的是快取命中
+    assert decrypt_many(v2_tokens, use_cache=False) == samples
+    assert decrypt_many(fernet_tokens, use_cache=False) == samples
+
+    # (名稱, 函式, 是否啟用解密快取)
+    cases = [
+        ("encrypt  fernet (per value)", lambda: [fernet.encrypt(t.encode("utf-8")) for t in samples], False),
+        ("encrypt  v2 encrypt_field", lambda: [encrypt_field(t) for t in samples], False),
+        ("encrypt  v2 encrypt_many", lambda: encrypt_many(samples), False),
+        ("decrypt  fernet decrypt_field", lambda: [decrypt_field(t) for t in fernet_tokens], False),
+        ("decrypt  v2 decrypt_field", lambda: [decrypt_field(t) for t in v2_tokens], False),
+        ("decrypt  v2 decrypt_many", lambda: decrypt_many(v2_tokens), False),
+        ("decrypt  v2 decrypt_many (cache hit)", lambda: decrypt_many(v2_tokens), True),
+    ]
+
+    # 預熱：建立快取的金鑰與加密器
+    encrypt_field(samples[0])
+    decrypt_many(v2_tokens[:1], use_cache=False)
+
+    cache_enabled = settings.FIELD_DECRYPT_CACHE_ENABLED
+    print(f"{args.count} values, best of {args.rounds} rounds")
+    print(f"{'case':38} {'seconds':>10} {'values/sec':>14}")
+    try:
+        for name, func, use_cache in cases:
+            settings.FIELD_DECRYPT_CACHE_ENABLED = use_cache
+            if use_cache:
+                func()  # 先填入快取，只量測命中
+            seconds = best_of(args.rounds, func)
+            print(f"{name:38} {seconds:10.4f} {args.count / seconds:14,.0f}")
+    finally:
+        settings.FIELD_DECRYPT_CACHE_ENABLED = cache_enabled
+    if args.count > settings.FIELD_DECRYPT_CACHE_MAX_ENTRIES:
+        print(f"note: --count exceeds FIELD_DECRYPT_CACHE_MAX_ENTRIES ({settings.FIELD_DECRYPT_CACHE_MAX_ENTRIES}), "
+              "the cache hit case includes misses")
+
+    fernet_size = sum(len(t) for t in fernet_tokens) / len(fernet_tokens)
+    v2_size = sum(len(t) for t in v2_tokens) / len(v2_tokens)
+    print(f"average ciphertext length: fernet {fernet_size:.1f}, v2 {v2_size:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Middleware 效能測試
+
+以相同的 middleware 順序 (安全性標頭、速率限制) 包裝只回傳固定 JSON 的端點，
+比較舊版 BaseHTTPMiddleware 實作與目前的 ASGI middleware 每秒可處理的請求數。
+直接呼叫 ASGI 應用程式，不經過網路與 HTTP 伺服器。在 backend 目錄執行：
+
+    python -m scripts.bench_middleware
+    python -m scripts.bench_middleware --requests 20000 --rounds 5
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.core.middleware import SecurityHeadersMiddleware, security_headers
+from app.core.rate_limit import (
+    MemoryRateLimitBackend, RateLimitMiddleware, RateLimitPolicy, RateLimiter, rate_limit_headers
+)
+
+
+class BaseSecurityHeadersMiddleware(BaseHTTPMiddleware):
+    """舊版實作：每個回應逐一設定標頭"""
+
+    async def dispatch(self, request: Request, call_next):
+        response = await call_next(request)
+        for name, value in security_headers():
+            response.headers[name.decode("latin-1")] = value.decode("latin-1")
+        return response
+
+
+class BaseRateLimitMiddleware(BaseHTTPMiddleware):
+    """舊版實作"""
+
+    def __init__(self, app, limiter: RateLimiter):
+        super().__init__(app)
+        self.limiter = limiter
+
+    async def dispatch(self, request: Request, call_next):
+        client_ip = request.client.host if request.client else "unknown"
+        policy = self.limiter.policy_for(request.method, request.url.path)
+        result = self.limiter.check(client_ip, policy)
+        headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in rate_limit_headers(result)}
+        if not result.allowed:
+            return JSONResponse(
+                status_code=429,
+                content={"detail": "Too many requests. Please try again later."},
+                headers=headers
+            )
+        response = await call_next(request)
+        response.headers.update(headers)
+        return response
+
+
+def make_limiter() -> RateLimiter:
+    # 限制設得夠高，測試期間不會觸發 429
+    return RateLimiter(MemoryRateLimitBackend(), [], default=RateLimitPolicy("default", 10 ** 9, 60))
+
+
+def make_app(security_middleware, rate_limit_middleware) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    def ping():
+        return {"status": "ok"}
+
+    app.add_middleware(security_middleware)
+    app.add_middleware(rate_limit_middleware, limiter=make_limiter())
+    return app
+
+
+SCOPE = {
+    "type": "http",
+    "asgi": {"version": "3.0"},
+    "http_version": "1.1",
+    "method": "GET",
+    "scheme": "http",
+    "path": "/ping",
+    "raw_path": b"/ping",
+    "root_path": "",
+    "query_string": b"",
+    "headers": [(b"host", b"testserver")],
+    "client": ("127.0.0.1", 12345),
+    "server": ("testserver", 80),
+}
+
+
+async def call(app) -> list:
+    """送出一個請求，回傳 http.response.start 的標頭"""
+    headers = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            assert message["status"] == 200, message["status"]
+            headers.extend(message["headers"])
+
+    await app(dict(SCOPE), receive, send)
+    return headers
+
+
+async def run(app, count: int) -> None:
+    for _ in range(count):
+        await call(app)
+
+
+def best_of(rounds: int, app, count: int) -> float:
+    """執行多次取最快的秒數"""
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        asyncio.run(run(app, count))
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark middleware stacks")
+    parser.add_argument("--requests", type=int, default=5000, help="每輪的請求數")
+    parser.add_argument("--rounds", type=int, default=5, help="重複次數 (取最快)")
+    args = parser.parse_args()
+
+    cases = [
+        ("no middleware", make_app(lambda app: app, lambda app, limiter: app)),
+        ("BaseHTTPMiddleware", make_app(BaseSecurityHeadersMiddleware, BaseRateLimitMiddleware)),
+        ("ASGI middleware", make_app(SecurityHeadersMiddleware, RateLimitMiddleware)),
+    ]
+
+    # 兩種實作的回應標頭應相同
+    expected = {name for name, _ in asyncio.run(call(cases[1][1]))}
+    actual = {name for name, _ in asyncio.run(call(cases[2][1]))}
+    assert expected == actual, expected ^ actual
+
+    print(f"{args.requests} requests to GET /ping, best of {args.rounds} rounds")
+    print(f"{'case':24} {'seconds':>10} {'requests/sec':>14}")
+    for name, app in cases:
+        seconds = best_of(args.rounds, app, args.requests)
+        print(f"{name:24} {seconds:10.4f} {args.requests / seconds:14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
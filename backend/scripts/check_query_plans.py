@@ -0,0 +1,183 @@
+"""
+查詢計畫檢查
+
+在資料庫交易中建立測試資料 (多個使用者、帳戶、預算與交易) 並 ANALYZE，
+執行交易列表、報表、每日統計與預算的主要查詢，擷取實際送出的 SQL 並以
+EXPLAIN (FORMAT JSON) 檢查，任一查詢對 transactions / accounts / budgets /
+budget_accounts / budget_categories 使用循序掃描 (Seq Scan) 時以結束碼 1 結束。
+結束時交易會回滾，不會留下測試資料。在 backend 目錄執行：
+
+    python -m scripts.check_query_plans
+    python -m scripts.check_query_plans --users 1000 --transactions-per-account 100 --verbose
+"""
+import argparse
+import json
+import random
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, insert, text
+from sqlalchemy.orm import Session
+
+from app.api.transactions import _build_transaction_query
+from app.core.database import engine
+from app.core.encryption import encrypt_field
+from app.models.account import Account
+from app.models.budget import Budget
+from app.models.budget_account import BudgetAccount
+from app.models.budget_category import BudgetCategory
+from app.models.transaction import Transaction
+from app.models.user import User
+from app.services.budget_matcher import (
+    BudgetMatcher, get_budget_spent_totals, load_budget_rules, load_budget_transactions
+)
+from app.services.report_engine import REPORT_SECTIONS, ReportEngine
+
+# 不允許循序掃描的資料表
+CHECKED_TABLES = {"transactions", "accounts", "budgets", "budget_accounts", "budget_categories"}
+
+CATEGORIES = ["飲食", "交通", "購物", "娛樂", "醫療"]
+SEED_START = datetime(2026, 1, 1)
+SEED_DAYS = 365
+
+
+def seed(conn, users: int, accounts_per_user: int, transactions_per_account: int) -> int:
+    """建立測試資料，回傳第一個測試使用者的 ID"""
+    rng = random.Random(42)
+    user_ids = conn.execute(insert(User.__table__).returning(User.id), [
+        {"username": f"plan-check-{i}@example.com", "hashed_password": "!"} for i in range(users)
+    ]).scalars().all()
+
+    account_ids = conn.execute(insert(Account.__table__).returning(Account.id, Account.user_id), [
+        {"name": f"Account {i}", "account_type": "cash", "currency": "TWD", "user_id": user_id}
+        for user_id in user_ids for i in range(accounts_per_user)
+    ]).all()
+
+    # 所有交易共用同一個密文，查詢計畫與內容無關
+    description = encrypt_field("plan check")
+    rows = []
+    for account_id, _ in account_ids:
+        for _ in range(transactions_per_account):
+            rows.append({
+                "description": description,
+                "amount": rng.randint(10, 5000),
+                "transaction_type": rng.choice(["debit", "debit", "credit", "installment"]),
+                "category": rng.choice(CATEGORIES),
+                "transaction_date": SEED_START + timedelta(minutes=rng.randint(0, SEED_DAYS * 24 * 60)),
+                "account_id": account_id,
+                "exclude_from_budget": rng.random() < 0.1,
+            })
+    conn.execute(insert(Transaction.__table__), rows)
+
+    budget_rows = []
+    for user_id in user_ids:
+        for month in (3, 6):
+            budget_rows.append({
+                "name": f"Budget {month}", "amount": 20000, "user_id": user_id,
+                "start_date": datetime(2026, month, 1), "end_date": datetime(2026, month, 28),
+            })
+    budgets = conn.execute(insert(Budget.__table__).returning(Budget.id, Budget.user_id), budget_rows).all()
+
+    first_account = {}
+    for account_id, user_id in account_ids:
+        first_account.setdefault(user_id, account_id)
+    conn.execute(insert(BudgetCategory.__table__), [
+        {"budget_id": budget_id, "category_name": rng.choice(CATEGORIES)} for budget_id, _ in budgets
+    ])
+    conn.execute(insert(BudgetAccount.__table__), [
+        {"budget_id": budget_id, "account_id": first_account[user_id]} for budget_id, user_id in budgets
+    ])
+
+    for table in sorted(CHECKED_TABLES):
+        conn.execute(text(f"ANALYZE {table}"))
+    return user_ids[0]
+
+
+def run_queries(db: Session, user_id: int) -> None:
+    """執行 API 使用的主要查詢"""
+    start, end = datetime(2026, 3, 1), datetime(2026, 4, 1)
+
+    # 交易列表 (第一頁與日期區間)
+    db.execute(_build_transaction_query(user_id=user_id).limit(50)).all()
+    db.execute(_build_transaction_query(
+        user_id=user_id, start_date="2026-03-01", end_date="2026-03-31", category=CATEGORIES[0]
+    ).limit(50)).all()
+
+    # 報表：逐筆交易載入，以及只需彙總數字時的排行查詢
+    ReportEngine(db, user_id, start, end).build(REPORT_SECTIONS)
+    ReportEngine(db, user_id, start, end).overview()
+
+    # 每日交易 (帳戶 ID 後以 IN 查詢)
+    account_ids = [acc_id for (acc_id,) in db.query(Account.id).filter(Account.user_id == user_id)]
+    db.query(Transaction).filter(
+        Transaction.account_id.in_(account_ids),
+        Transaction.transaction_date >= datetime(2026, 3, 15),
+        Transaction.transaction_date < datetime(2026, 3, 16)
+    ).all()
+
+    # 預算報表與已使用金額
+    budgets = db.query(Budget).filter(
+        Budget.user_id == user_id, Budget.start_date < end, Budget.end_date >= start
+    ).all()
+    rules = load_budget_rules(db, budgets)
+    load_budget_transactions(db, user_id, BudgetMatcher(rules), start, end)
+    get_budget_spent_totals(db, user_id, [b.id for b in budgets], start, end)
+
+
+def seq_scans(plan: dict):
+    """回傳計畫樹中對檢查資料表的循序掃描"""
+    found = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in CHECKED_TABLES:
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if the main queries sequentially scan indexed tables")
+    parser.add_argument("--users", type=int, default=500, help="測試使用者數")
+    parser.add_argument("--accounts-per-user", type=int, default=3, help="每個使用者的帳戶數")
+    parser.add_argument("--transactions-per-account", type=int, default=60, help="每個帳戶的交易數")
+    parser.add_argument("--verbose", action="store_true", help="輸出每個查詢的完整計畫")
+    args = parser.parse_args()
+
+    failures = 0
+    statements = []
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            user_id = seed(conn, args.users, args.accounts_per_user, args.transactions_per_account)
+
+            def capture(conn, cursor, statement, parameters, context, executemany):
+                if statement.lstrip().upper().startswith("SELECT") and not executemany:
+                    statements.append((statement, parameters))
+
+            event.listen(conn, "before_cursor_execute", capture)
+            try:
+                run_queries(Session(bind=conn), user_id)
+            finally:
+                event.remove(conn, "before_cursor_execute", capture)
+
+            for statement, parameters in statements:
+                plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                tables = seq_scans(plan[0]["Plan"])
+                summary = " ".join(statement.split())[:100]
+                if tables:
+                    failures += 1
+                    print(f"SEQ SCAN on {', '.join(sorted(set(tables)))}: {summary}")
+                else:
+                    print(f"ok: {summary}")
+                if args.verbose:
+                    print(json.dumps(plan[0]["Plan"], indent=2))
+        finally:
+            trans.rollback()
+
+    print(f"{len(statements)} queries checked, {failures} with sequential scans")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
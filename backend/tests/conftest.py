@@ -0,0 +1,8 @@
+import os
+import sys
+
+# app.core.config 的必填設定；單元測試不連線資料庫
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/unit-tests")
+os.environ.setdefault("SECRET_KEY", "test-secret-key-for-unit-tests-0123456789")
+os.environ.setdefault("ENVIRONMENT", "development")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
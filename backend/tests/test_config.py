@@ -0,0 +1,30 @@
+import pytest
+
+from app.core.config import Settings
+
+
+def make_settings(**overrides):
+    return Settings(DATABASE_URL="postgresql://localhost/test", SECRET_KEY="x" * 32, **overrides)
+
+
+def test_default_key_ring_is_valid():
+    make_settings().validate_encryption_keys()
+
+
+def test_rotated_active_key_is_valid():
+    settings = make_settings(DATA_ENCRYPTION_KEYS="2:second-secret", DATA_ENCRYPTION_ACTIVE_KEY_ID="2")
+    settings.validate_encryption_keys()
+    assert settings.data_encryption_key_ring["2"] == "second-secret"
+
+
+@pytest.mark.parametrize("overrides, message", [
+    ({"DATA_ENCRYPTION_ACTIVE_KEY_ID": "2"}, "not in DATA_ENCRYPTION_KEYS"),
+    ({"DATA_ENCRYPTION_KEYS": "2:", "DATA_ENCRYPTION_ACTIVE_KEY_ID": "2"}, "key_id:secret"),
+    ({"DATA_ENCRYPTION_KEYS": ":secret"}, "key_id:secret"),
+    ({"DATA_ENCRYPTION_KEYS": "1:other"}, "key id '1'"),
+    ({"DATA_ENCRYPTION_KEYS": "2:a,2:b"}, "more than once"),
+    ({"DATA_ENCRYPTION_KEY": ""}, "must not be empty"),
+])
+def test_invalid_key_ring_fails(overrides, message):
+    with pytest.raises(ValueError, match=message):
+        make_settings(**overrides).validate_encryption_keys()
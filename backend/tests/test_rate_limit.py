@@ -0,0 +1,96 @@
+import pytest
+
+from app.core.cache import InProcessSharedStore
+from app.core.config import settings
+from app.core.rate_limit import (
+    MemoryRateLimitBackend, RateLimitPolicy, RateLimiter, SharedStoreRateLimitBackend, create_rate_limiter
+)
+
+AUTH = RateLimitPolicy("auth", 10, 60)
+
+
+@pytest.fixture(params=["memory", "shared"])
+def limiter(request):
+    if request.param == "memory":
+        backend = MemoryRateLimitBackend()
+    else:
+        backend = SharedStoreRateLimitBackend(InProcessSharedStore())
+    return RateLimiter(backend, [], default=AUTH)
+
+
+def test_allows_up_to_limit_then_rejects(limiter):
+    results = [limiter.check("1.2.3.4", AUTH, now=600 + i) for i in range(11)]
+    assert all(r.allowed for r in results[:10])
+    assert not results[10].allowed
+    assert results[9].remaining == 0
+
+
+def test_rejected_requests_are_not_counted(limiter):
+    # 每秒一個請求持續 5 分鐘：被拒絕的請求不計入，滑動視窗每分鐘約放行 limit 個
+    allowed = sum(limiter.check("1.2.3.4", AUTH, now=600 + t).allowed for t in range(300))
+    assert allowed >= 45
+
+
+def test_client_recovers_while_retrying(limiter):
+    for t in range(10):
+        assert limiter.check("1.2.3.4", AUTH, now=600 + t).allowed
+    # 持續重試 (全部被拒絕) 不會延長封鎖
+    for t in range(10, 70):
+        limiter.check("1.2.3.4", AUTH, now=600 + t)
+    assert limiter.check("1.2.3.4", AUTH, now=600 + 75).allowed
+
+
+@pytest.mark.parametrize("burst_at", [0, 5, 30, 59])
+def test_retry_after_is_sufficient_and_tight(limiter, burst_at):
+    start = 600 + burst_at
+    for _ in range(10):
+        assert limiter.check("1.2.3.4", AUTH, now=start).allowed
+    rejected = limiter.check("1.2.3.4", AUTH, now=start)
+    assert not rejected.allowed
+
+    retry_after = rejected.retry_after
+    assert limiter.check("1.2.3.4", AUTH, now=start + retry_after).allowed
+
+
+@pytest.mark.parametrize("burst_at", [0, 5, 30, 59])
+def test_retry_after_is_not_too_long(limiter, burst_at):
+    start = 600 + burst_at
+    for _ in range(10):
+        limiter.check("1.2.3.4", AUTH, now=start)
+    retry_after = limiter.check("1.2.3.4", AUTH, now=start).retry_after
+    # 提早一秒重試仍會被拒絕 (Retry-After 不會過度保守)
+    assert not limiter.check("1.2.3.4", AUTH, now=start + retry_after - 1.001).allowed
+
+
+def test_retry_after_within_window_uses_previous_weight(limiter):
+    # 上一視窗用完，目前視窗尚未有請求：等待上一視窗的權重下降
+    for _ in range(10):
+        limiter.check("1.2.3.4", AUTH, now=630)
+    rejected = limiter.check("1.2.3.4", AUTH, now=665)
+    assert not rejected.allowed
+    assert rejected.retry_after == 1
+    assert limiter.check("1.2.3.4", AUTH, now=666).allowed
+
+
+def test_keys_and_policies_are_counted_separately(limiter):
+    read = RateLimitPolicy("read", 2, 60)
+    for _ in range(10):
+        limiter.check("1.2.3.4", AUTH, now=600)
+    assert not limiter.check("1.2.3.4", AUTH, now=600).allowed
+    assert limiter.check("5.6.7.8", AUTH, now=600).allowed
+    assert limiter.check("1.2.3.4", read, now=600).allowed
+
+
+def test_memory_backend_undo_after_window_rollover():
+    backend = MemoryRateLimitBackend()
+    backend.hit("k", 60, 659)
+    backend.hit("k", 60, 660)  # 另一個請求已進入下一個視窗
+    backend.undo("k", 60, 659)
+    assert backend.hit("k", 60, 661) == (2, 0)
+
+
+def test_shared_backend_requires_url(monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_BACKEND", "shared")
+    monkeypatch.setattr(settings, "RATE_LIMIT_SHARED_URL", "")
+    with pytest.raises(RuntimeError, match="RATE_LIMIT_SHARED_URL"):
+        create_rate_limiter()
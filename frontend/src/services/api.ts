@@ -25,11 +25,7 @@ import type {
   CategoryUpdate,
   CategoryOrderUpdate,
   MonthlyStats,
-  OverviewReport,
-  DetailsReport,
-  CategoryReport,
-  RankingReport,
-  AccountReport,
+  CombinedReport,
   TransactionDetail,
   ExchangeRate,
   RecurringExpense,
@@ -142,6 +138,10 @@ export default {
     })
   },
 
+  getImportJob(jobId: number) {
+    return api.get(`/users/me/import/${jobId}`)
+  },
+
   clearUserData() {
     return api.delete('/users/me/clear-data')
   },
@@ -242,66 +242,6 @@ export default {
   },
 
   // Reports
-  getOverviewReportMonthly(year: number, month: number) {
-    return api.get<OverviewReport>('/reports/overview/monthly', {
-      params: { year, month }
-    })
-  },
-
-  getOverviewReportDaily(date: string) {
-    return api.get<OverviewReport>('/reports/overview/daily', {
-      params: { date_str: date }
-    })
-  },
-
-  getDetailsReportMonthly(year: number, month: number) {
-    return api.get<DetailsReport>('/reports/details/monthly', {
-      params: { year, month }
-    })
-  },
-
-  getDetailsReportDaily(date: string) {
-    return api.get<DetailsReport>('/reports/details/daily', {
-      params: { date_str: date }
-    })
-  },
-
-  getCategoryReportMonthly(year: number, month: number) {
-    return api.get<CategoryReport>('/reports/category/monthly', {
-      params: { year, month }
-    })
-  },
-
-  getCategoryReportDaily(date: string) {
-    return api.get<CategoryReport>('/reports/category/daily', {
-      params: { date_str: date }
-    })
-  },
-
-  getRankingReportMonthly(year: number, month: number) {
-    return api.get<RankingReport>('/reports/ranking/monthly', {
-      params: { year, month }
-    })
-  },
-
-  getRankingReportDaily(date: string) {
-    return api.get<RankingReport>('/reports/ranking/daily', {
-      params: { date_str: date }
-    })
-  },
-
-  getAccountReportMonthly(year: number, month: number) {
-    return api.get<AccountReport>('/reports/account/monthly', {
-      params: { year, month }
-    })
-  },
-
-  getAccountReportDaily(date: string) {
-    return api.get<AccountReport>('/reports/account/daily', {
-      params: { date_str: date }
-    })
-  },
-
   getBudgetReportMonthly(year: number, month: number) {
     return api.get<any>('/reports/budget/monthly', {
       params: { year, month }
@@ -320,36 +260,6 @@ export default {
     })
   },
 
-  getOverviewReportCustom(startDate: string, endDate: string) {
-    return api.get<any>('/reports/custom/overview', {
-      params: { start_date: startDate, end_date: endDate }
-    })
-  },
-
-  getDetailsReportCustom(startDate: string, endDate: string) {
-    return api.get<any>('/reports/custom/details', {
-      params: { start_date: startDate, end_date: endDate }
-    })
-  },
-
-  getCategoryReportCustom(startDate: string, endDate: string) {
-    return api.get<any>('/reports/custom/category', {
-      params: { start_date: startDate, end_date: endDate }
-    })
-  },
-
-  getRankingReportCustom(startDate: string, endDate: string) {
-    return api.get<any>('/reports/custom/ranking', {
-      params: { start_date: startDate, end_date: endDate }
-    })
-  },
-
-  getAccountReportCustom(startDate: string, endDate: string) {
-    return api.get<any>('/reports/custom/account', {
-      params: { start_date: startDate, end_date: endDate }
-    })
-  },
-
   getCategoryTransactionsCustom(category: string, startDate: string, endDate: string) {
     return api.get<any>(`/reports/custom/category/${encodeURIComponent(category)}/transactions`, {
       params: { start_date: startDate, end_date: endDate }
@@ -362,6 +272,12 @@ export default {
     })
   },
 
+  getCombinedReport(sections: string[], params: { year?: number, month?: number, date_str?: string, start_date?: string, end_date?: string }) {
+    return api.get<CombinedReport>('/reports/combined', {
+      params: { ...params, sections: sections.join(',') }
+    })
+  },
+
   getCategoryTransactionsMonthly(category: string, year: number, month: number) {
     return api.get<TransactionDetail[]>(`/reports/category/${encodeURIComponent(category)}/transactions/monthly`, {
       params: { year, month }
@@ -431,9 +347,15 @@ export default {
 
   // 管理員 API
   admin: {
-    // 列出所有使用者
-    listUsers() {
-      return api.get<UserAdminInfo[]>('/admin/users')
+    // 列出所有使用者 (可搜尋、排序；傳入 limit 時分頁，下一頁游標在 X-Next-Cursor header)
+    listUsers(params: {
+      search?: string
+      sort?: 'id' | 'username' | 'created_at' | 'last_login_at' | 'transaction_count' | 'budget_count' | 'account_count'
+      order?: 'asc' | 'desc'
+      limit?: number
+      cursor?: string
+    } = {}) {
+      return api.get<UserAdminInfo[]>('/admin/users', { params })
     },
 
     // 獲取特定使用者資訊
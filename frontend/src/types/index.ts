@@ -302,6 +302,15 @@ export interface AccountReport {
   total_amount: number
 }
 
+// /reports/combined 只回傳要求的區塊
+export interface CombinedReport {
+  overview?: OverviewReport
+  details?: DetailsReport
+  category?: CategoryReport
+  ranking?: RankingReport
+  account?: AccountReport
+}
+
 export interface ExchangeRate {
   id: number
   bank: string